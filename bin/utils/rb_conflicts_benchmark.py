@@ -0,0 +1,113 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import print_function
+
+import random
+from datetime import datetime, timedelta
+from itertools import combinations
+
+import click
+
+from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence
+from indico.modules.rb.models.reservations import RepeatFrequency, Reservation, ReservationState
+from indico.modules.rb.operations.conflicts import get_concurrent_pre_bookings, get_room_bookings_conflicts
+from indico.modules.rb.util import TempReservationConcurrentOccurrence, TempReservationOccurrence
+from indico.util.benchmark import Benchmark
+from indico.web.flask.app import make_app
+
+
+def _naive_get_room_bookings_conflicts(candidates, occurrences, skip_conflicts_with=frozenset()):
+    conflicts = set()
+    pre_conflicts = set()
+    conflicting_candidates = set()
+    for candidate in candidates:
+        for occurrence in occurrences:
+            if occurrence.reservation.id in skip_conflicts_with:
+                continue
+            if candidate.overlaps(occurrence):
+                overlap = candidate.get_overlap(occurrence)
+                obj = TempReservationOccurrence(*overlap, reservation=occurrence.reservation)
+                if occurrence.reservation.is_accepted:
+                    conflicting_candidates.add(candidate)
+                    conflicts.add(obj)
+                else:
+                    pre_conflicts.add(obj)
+    return conflicts, pre_conflicts, conflicting_candidates
+
+
+def _naive_get_concurrent_pre_bookings(pre_bookings, skip_conflicts_with=frozenset()):
+    concurrent_pre_bookings = []
+    for (x, y) in combinations(pre_bookings, 2):
+        if any(pre_booking.reservation.id in skip_conflicts_with for pre_booking in [x, y]):
+            continue
+        if x.overlaps(y):
+            overlap = x.get_overlap(y)
+            obj = TempReservationConcurrentOccurrence(*overlap, reservations=[x.reservation, y.reservation])
+            concurrent_pre_bookings.append(obj)
+    return concurrent_pre_bookings
+
+
+def _make_occurrences(rnd, start_dt, days, bookings_per_day):
+    occurrences = []
+    for day in xrange(days):
+        for __ in xrange(bookings_per_day):
+            occ_start_dt = start_dt + timedelta(days=day, minutes=rnd.randrange(0, 12 * 60, 30))
+            occ_end_dt = occ_start_dt + timedelta(minutes=rnd.randrange(30, 4 * 60, 30))
+            state = ReservationState.accepted if rnd.random() > 0.3 else ReservationState.pending
+            reservation = Reservation(id=len(occurrences), state=state)
+            occurrences.append(ReservationOccurrence(start_dt=occ_start_dt, end_dt=occ_end_dt,
+                                                     reservation=reservation))
+    return occurrences
+
+
+def _run(label, func, *args):
+    with Benchmark() as b:
+        result = func(*args)
+    print('{:<30}'.format(label), end='')
+    b.print_result(slow=1, veryslow=5)
+    return result
+
+
+@click.command()
+@click.option('--days', '-d', type=int, default=365, show_default=True, help='Length of the booking series')
+@click.option('--bookings-per-day', '-b', type=int, default=10, show_default=True,
+              help='Number of existing bookings per day')
+@click.option('--seed', type=int, default=1337, show_default=True, help='Seed for the random bookings')
+def main(days, bookings_per_day, seed):
+    """Compare the naive and the indexed booking conflict checks.
+
+    This uses a daily booking series and random existing bookings
+    which are never written to the database.
+    """
+    with make_app().app_context():
+        _main(days, bookings_per_day, seed)
+
+
+def _main(days, bookings_per_day, seed):
+    rnd = random.Random(seed)
+    start_dt = datetime(2020, 1, 6, 8, 0)
+    candidates = ReservationOccurrence.create_series(start_dt, start_dt + timedelta(days=days - 1, hours=2),
+                                                     (RepeatFrequency.DAY, 1))
+    occurrences = _make_occurrences(rnd, start_dt.replace(hour=7), days, bookings_per_day)
+    skip_conflicts_with = {occ.reservation.id for occ in rnd.sample(occurrences, len(occurrences) // 20)}
+    print('{} candidates, {} existing occurrences'.format(len(candidates), len(occurrences)))
+
+    naive = _run('conflicts (naive)', _naive_get_room_bookings_conflicts, candidates, occurrences,
+                 skip_conflicts_with)
+    indexed = _run('conflicts (indexed)', get_room_bookings_conflicts, candidates, occurrences, skip_conflicts_with)
+    assert naive == indexed
+
+    pre_bookings = sorted((occ for occ in occurrences if not occ.reservation.is_accepted),
+                          key=lambda occ: occ.start_dt)
+    naive = _run('pre-bookings (naive)', _naive_get_concurrent_pre_bookings, pre_bookings, skip_conflicts_with)
+    indexed = _run('pre-bookings (indexed)', get_concurrent_pre_bookings, pre_bookings, skip_conflicts_with)
+    assert naive == indexed
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import print_function
+
+from datetime import date, datetime, time, timedelta
+
+import click
+
+from indico.core.db import db
+from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence, ReservationOccurrenceState
+from indico.modules.rb.models.reservations import RepeatFrequency, Reservation, ReservationState
+from indico.modules.rb.models.rooms import Room
+from indico.util.benchmark import Benchmark
+from indico.web.flask.app import make_app
+
+
+def _create_occurrences_orm(reservation):
+    # what creating the occurrences of a booking used to do (without the blocking checks):
+    # add each occurrence to the session and check them for conflicts one by one
+    ReservationOccurrence.create_series_for_reservation(reservation)
+    db.session.flush()
+    conflicts = reservation.get_conflicting_occurrences()
+    for occurrence, occurrence_conflicts in conflicts.iteritems():
+        if occurrence_conflicts['confirmed']:
+            occurrence.state = ReservationOccurrenceState.cancelled
+    db.session.flush()
+
+
+def _create_occurrences_bulk(reservation):
+    reservation.create_occurrences(True)
+    db.session.flush()
+
+
+def _make_reservation(room, days):
+    start_dt = datetime.combine(date.today() + timedelta(days=1), time(8))
+    return Reservation(room=room, start_dt=start_dt, end_dt=start_dt + timedelta(days=days - 1, hours=1),
+                       repeat_frequency=RepeatFrequency.DAY, repeat_interval=1, booking_reason='Benchmark',
+                       booked_for_user=room.owner, booked_for_name=room.owner.full_name, created_by_user=room.owner,
+                       state=ReservationState.accepted)
+
+
+def _run(label, func, room, days):
+    savepoint = db.session.begin_nested()
+    try:
+        reservation = _make_reservation(room, days)
+        db.session.flush()
+        with Benchmark() as b:
+            func(reservation)
+        count = reservation.occurrences.count()
+    finally:
+        savepoint.rollback()
+    print('{:<20}{:>6} occurrences  '.format(label, count), end='')
+    b.print_result(slow=1, veryslow=5)
+
+
+@click.command()
+@click.argument('room_id', type=int)
+@click.option('--days', '-d', type=int, default=365, show_default=True, help='Length of the daily booking')
+def main(room_id, days):
+    """Compare creating the occurrences of a long booking with and without bulk inserts.
+
+    All changes are rolled back, so this can be used on a database
+    containing real bookings to benchmark the conflict checks as well.
+    """
+    with make_app().app_context():
+        room = Room.get(room_id, is_deleted=False)
+        if room is None:
+            raise click.BadParameter('Room does not exist', param_hint='room_id')
+        try:
+            _run('ORM', _create_occurrences_orm, room, days)
+            _run('bulk', _create_occurrences_bulk, room, days)
+        finally:
+            db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
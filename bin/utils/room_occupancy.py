@@ -14,7 +14,7 @@ from dateutil.relativedelta import relativedelta
 
 from indico.modules.rb.models.locations import Location
 from indico.modules.rb.models.rooms import Room
-from indico.modules.rb.statistics import calculate_rooms_occupancy
+from indico.modules.rb.statistics import calculate_rooms_statistics
 from indico.web.flask.app import make_app
 
 
@@ -28,12 +28,14 @@ def _main(location):
     else:
         rooms = Room.find_all(Location.name.in_(location), _join=Location)
 
+    stats = calculate_rooms_statistics(rooms, [(past_month, yesterday), (past_year, yesterday)])
     print('Month\tYear\tPublic?\tRoom')
     for room in rooms:
+        month_stats, year_stats = stats[room.id]
         print('{2:.2f}%\t{3:.2f}%\t{1}\t{0}'.format(room.full_name,
                                                     "Y" if room.is_public else "N",
-                                                    calculate_rooms_occupancy([room], past_month, yesterday) * 100,
-                                                    calculate_rooms_occupancy([room], past_year, yesterday) * 100))
+                                                    month_stats['occupancy'] * 100,
+                                                    year_stats['occupancy'] * 100))
 
 
 @click.command()
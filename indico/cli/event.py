@@ -13,8 +13,10 @@ import click
 
 from indico.cli.core import cli_group
 from indico.core.db import db
+from indico.modules.categories.util import get_category_cleanup_queries
 from indico.modules.events import Event, EventLogKind, EventLogRealm
 from indico.modules.events.export import export_event, import_event
+from indico.modules.events.operations import delete_events
 from indico.modules.users.models.users import User
 
 
@@ -48,6 +50,31 @@ def restore(event_id, user_id, message):
     click.secho('Event undeleted: "{}"'.format(event.title), fg='green')
 
 
+@cli.command('cleanup-categories')
+@click.option('-n', '--dry-run', is_flag=True, help="Only show how many events would be deleted.")
+@click.option('-b', '--batch-size', type=int, default=100, show_default=True,
+              help="The number of events deleted in each batch.")
+def cleanup_categories(dry_run, batch_size):
+    """Delete old events in the categories set in `CATEGORY_CLEANUP`.
+
+    This performs the same cleanup as the periodic task.  Since each
+    batch of events is committed separately, an interrupted cleanup
+    can be resumed by simply running this command again.
+    """
+    janitor_user = User.get_system_user()
+    for category, days, query in get_category_cleanup_queries():
+        count = query.count()
+        click.echo('Category {} ("{}"): {} events older than {} days'.format(category.id, category.title, count,
+                                                                             days))
+        if dry_run or not count:
+            continue
+        with click.progressbar(length=count, label='Deleting events') as bar:
+            for event_ids in delete_events(query, 'Cleaning up category', janitor_user, batch_size=batch_size):
+                bar.update(len(event_ids))
+    if not dry_run:
+        click.secho('Cleanup finished', fg='green')
+
+
 @cli.command()
 @click.argument('event_id', type=int)
 @click.argument('target_file', type=click.File('wb'))
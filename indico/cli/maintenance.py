@@ -17,6 +17,7 @@ from indico.modules.attachments import Attachment, AttachmentFolder
 from indico.modules.attachments.models.principals import AttachmentFolderPrincipal, AttachmentPrincipal
 from indico.modules.events.contributions import Contribution
 from indico.modules.events.contributions.models.principals import ContributionPrincipal
+from indico.modules.events.models.effective_acl import find_outdated_effective_acls, refresh_effective_acls
 from indico.modules.events.models.principals import EventPrincipal
 from indico.modules.events.models.roles import EventRole
 from indico.modules.events.sessions import Session
@@ -106,3 +107,24 @@ def fix_event_role_acls():
                   default=True, abort=True)
     db.session.commit()
     click.secho('Success!', fg='green')
+
+
+@cli.command()
+def fix_effective_acls():
+    """Fix outdated effective ACLs of categories and events.
+
+    This is only needed if protection settings or ACLs have been
+    modified directly in the database.
+    """
+    connection = db.session.connection()
+    category_ids, event_ids = find_outdated_effective_acls(connection)
+    if not category_ids and not event_ids:
+        click.secho('Nothing to fix :)', fg='green')
+        return
+    click.echo('Outdated categories: {}'.format(', '.join(map(unicode, sorted(category_ids))) or '-'))
+    click.echo('Outdated events: {}'.format(', '.join(map(unicode, sorted(event_ids))) or '-'))
+    click.confirm(click.style('Do you want to update the effective ACLs shown above?', fg='white', bold=True),
+                  default=True, abort=True)
+    refresh_effective_acls(connection, category_ids, event_ids)
+    db.session.commit()
+    click.secho('Success!', fg='green')
@@ -19,7 +19,7 @@ def locked_task(f):
     """Decorator to prevent a task from running multiple times at once."""
     @wraps(f)
     def wrapper(*args, **kwargs):
-        cache = GenericCache('task-locks')
+        cache = GenericCache('task-locks', local=False)
         name = current_task.name
         if cache.get(name):
             Logger.get('celery').warning('Task %s is locked; not executing it. '
@@ -39,7 +39,7 @@ def unlock_task(name):
 
     :return: ``True`` if the task has been unlocked; ``False`` if it was not locked.
     """
-    cache = GenericCache('task-locks')
+    cache = GenericCache('task-locks', local=False)
     if not cache.get(name):
         return False
     cache.delete(name)
@@ -34,6 +34,8 @@ DEFAULTS = {
     'BASE_URL': None,
     'CACHE_BACKEND': 'files',
     'CACHE_DIR': '/opt/indico/cache',
+    'CACHE_LOCAL_SIZE': 0,
+    'CACHE_LOCAL_TTL': 5,
     'CATEGORY_CLEANUP': {},
     'CELERY_BROKER': None,
     'CELERY_CONFIG': {},
@@ -76,6 +78,8 @@ DEFAULTS = {
     'SENTRY_DSN': None,
     'SENTRY_LOGGING_LEVEL': 'WARNING',
     'SESSION_LIFETIME': 86400 * 31,
+    'SMTP_BATCH_RATE_LIMIT': 0,
+    'SMTP_BATCH_SIZE': 50,
     'SMTP_LOGIN': None,
     'SMTP_PASSWORD': None,
     'SMTP_SERVER': ('localhost', 25),
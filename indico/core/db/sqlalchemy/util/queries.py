@@ -9,7 +9,7 @@ from __future__ import unicode_literals
 
 import re
 
-from sqlalchemy import func, inspect, over
+from sqlalchemy import func, inspect, over, tuple_
 from sqlalchemy.sql import update
 
 
@@ -176,3 +176,33 @@ def with_total_rows(query, single_entity=True):
     total = res[0][-1]
     rows = [row[0] for row in res] if single_entity else [row[:-1] for row in res]
     return rows, total
+
+
+def iter_keyset_chunks(query, columns, chunk_size, after=None):
+    """Iterate over the results of a query in keyset-paginated chunks.
+
+    Instead of loading all results at once (or using OFFSET, which gets
+    slower the further you get), the query is ordered by `columns` and
+    each chunk continues right after the last row of the previous one.
+    Since every chunk is a regular query, this also works fine with
+    eager loading strategies that cannot be combined with ``yield_per``.
+
+    :param query: A sqlalchemy query object returning a single entity
+    :param columns: A list of columns that define a unique ordering of
+                    the results (usually ending with the primary key)
+    :param chunk_size: The number of rows to load per chunk
+    :param after: A tuple containing the values of `columns` after
+                  which to start
+    :return: An iterator yielding lists of objects
+    """
+    query = query.order_by(None).order_by(*columns)
+    while True:
+        chunk_query = query
+        if after is not None:
+            chunk_query = chunk_query.filter(tuple_(*columns) > tuple_(*after))
+        chunk = chunk_query.limit(chunk_size).all()
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            break
+        after = tuple(getattr(chunk[-1], col.key) for col in columns)
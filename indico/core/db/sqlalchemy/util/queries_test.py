@@ -0,0 +1,40 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+import pytest
+
+from indico.core.db.sqlalchemy.util.queries import iter_keyset_chunks
+from indico.modules.events import Event
+from indico.util.date_time import now_utc
+
+
+@pytest.mark.parametrize('chunk_size', (1, 2, 3, 5, 10))
+def test_iter_keyset_chunks(db, create_event, chunk_size):
+    start_dt = now_utc(exact=False)
+    # some events share the same start date so the id is needed as a tie-breaker
+    events = [create_event(i, start_dt=start_dt + timedelta(hours=i // 2), end_dt=start_dt + timedelta(days=1))
+              for i in range(1, 8)]
+    chunks = list(iter_keyset_chunks(Event.query, [Event.start_dt, Event.id], chunk_size))
+    assert all(len(chunk) <= chunk_size for chunk in chunks)
+    assert [e for chunk in chunks for e in chunk] == events
+
+
+def test_iter_keyset_chunks_after(db, create_event):
+    start_dt = now_utc(exact=False)
+    events = [create_event(i, start_dt=start_dt + timedelta(hours=i), end_dt=start_dt + timedelta(days=1))
+              for i in range(1, 6)]
+    after = (events[1].start_dt, events[1].id)
+    chunks = list(iter_keyset_chunks(Event.query, [Event.start_dt, Event.id], 2, after=after))
+    assert chunks == [events[2:4], events[4:]]
+
+
+def test_iter_keyset_chunks_empty(db):
+    assert list(iter_keyset_chunks(Event.query, [Event.start_dt, Event.id], 10)) == []
@@ -10,6 +10,7 @@ from __future__ import absolute_import, unicode_literals
 import cPickle
 import os
 import tempfile
+import time
 from datetime import date
 
 import click
@@ -64,6 +65,64 @@ def send_email_task(task, email, log_entry=None):
             db.session.commit()
 
 
+@celery.task(name='send_emails')
+def send_emails_task(emails):
+    """Send multiple emails using a single SMTP connection.
+
+    Emails which cannot be sent are passed on to `send_email_task`,
+    so they are retried (and stored in case all attempts failed) just
+    like emails which are not sent in a batch.
+
+    :param emails: A list of ``(email, log_entry_id)`` tuples
+    """
+    from indico.modules.events.logs import EventLogEntry
+    interval = (1.0 / config.SMTP_BATCH_RATE_LIMIT) if config.SMTP_BATCH_RATE_LIMIT else 0
+    last_sent = 0
+    conn = EmailBackend(timeout=config.SMTP_TIMEOUT)
+    try:
+        for email, log_entry_id in emails:
+            log_entry = EventLogEntry.get(log_entry_id) if log_entry_id is not None else None
+            delay = last_sent + interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            last_sent = time.time()
+            try:
+                conn.open()
+                _send_message(email, conn)
+            except Exception as exc:
+                logger.warning('Could not send email "%s" from batch; retrying it separately [%s]',
+                               truncate(email['subject'], 100), exc)
+                _close_connection(conn)
+                send_email_task.apply_async((email, log_entry), countdown=(DELAYS[0] if not config.DEBUG else 1))
+            else:
+                logger.info('Sent email "%s"', truncate(email['subject'], 100))
+                if log_entry:
+                    update_email_log_state(log_entry)
+    finally:
+        _close_connection(conn)
+    # commit the log entry state changes
+    db.session.commit()
+
+
+def _close_connection(conn):
+    try:
+        conn.close()
+    except Exception:
+        # the connection is discarded anyway
+        pass
+
+
+def _send_message(email, conn):
+    msg = EmailMessage(subject=email['subject'], body=email['body'], from_email=email['from'],
+                       to=email['to'], cc=email['cc'], bcc=email['bcc'], reply_to=email['reply_to'],
+                       attachments=email['attachments'], connection=conn)
+    if not msg.to:
+        msg.extra_headers['To'] = 'Undisclosed-recipients:;'
+    if email['html']:
+        msg.content_subtype = 'html'
+    msg.send()
+
+
 def do_send_email(email, log_entry=None, _from_task=False):
     """Send an email.
 
@@ -82,14 +141,7 @@ def do_send_email(email, log_entry=None, _from_task=False):
                        the celery task responsible for sending emails.
     """
     with EmailBackend(timeout=config.SMTP_TIMEOUT) as conn:
-        msg = EmailMessage(subject=email['subject'], body=email['body'], from_email=email['from'],
-                           to=email['to'], cc=email['cc'], bcc=email['bcc'], reply_to=email['reply_to'],
-                           attachments=email['attachments'], connection=conn)
-        if not msg.to:
-            msg.extra_headers['To'] = 'Undisclosed-recipients:;'
-        if email['html']:
-            msg.content_subtype = 'html'
-        msg.send()
+        _send_message(email, conn)
     if not _from_task:
         logger.info('Sent email "%s"', truncate(email['subject'], 100))
     if log_entry:
@@ -0,0 +1,231 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+import cPickle as pickle
+
+import pytest
+from mock import MagicMock
+
+from indico.legacy.common.cache import LocalLRUCache, TwoTierCacheClient
+
+
+class MockRedis(object):
+    """A minimal in-memory replacement for a redis client."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.published = []
+        self.executed = 0
+
+    def pipeline(self, transaction=True):
+        return MockPipeline(self)
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def pttl(self, key):
+        if key not in self.data:
+            return -2
+        return self.ttls[key] * 1000 if key in self.ttls else -1
+
+    def set(self, key, val, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = val
+        self.ttls.pop(key, None)
+        if ex:
+            self.ttls[key] = ex
+        return True
+
+    def setex(self, key, ttl, val):
+        return self.set(key, val, ex=ttl)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.ttls.pop(key, None)
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+class MockPipeline(object):
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._commands.append((name, args, kwargs))
+
+    def execute(self):
+        self._client.executed += 1
+        return [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in self._commands]
+
+
+@pytest.fixture
+def local_cache(mocker):
+    # the invalidation listener is started explicitly when needed
+    mocker.patch('indico.legacy.common.cache.threading.Thread')
+    cache = LocalLRUCache('redis://localhost', max_size=3, ttl=60)
+    cache._connected = True
+    return cache
+
+
+@pytest.fixture
+def redis_client():
+    return MockRedis()
+
+
+@pytest.fixture
+def two_tier_client(redis_client, local_cache):
+    return TwoTierCacheClient(MagicMock(_client=redis_client), local_cache)
+
+
+def test_local_cache_lru(local_cache):
+    for key in 'abc':
+        local_cache.set(key, key)
+    assert local_cache.get('a') == 'a'
+    local_cache.set('d', 'd')
+    # b is the least recently used key
+    assert local_cache.get('b') is None
+    assert [local_cache.get(key) for key in 'acd'] == ['a', 'c', 'd']
+
+
+def test_local_cache_ttl(mocker, local_cache):
+    now = mocker.patch('indico.legacy.common.cache.time.time', return_value=1000)
+    local_cache.set('a', 'a')
+    local_cache.set('b', 'b', ttl=10)
+    now.return_value = 1011
+    assert local_cache.get('a') == 'a'
+    assert local_cache.get('b') is None
+    now.return_value = 1061
+    assert local_cache.get('a') is None
+
+
+def test_local_cache_disconnected(local_cache):
+    local_cache.set('a', 'a')
+    local_cache._connected = False
+    assert local_cache.get('a') is None
+    local_cache.set('b', 'b')
+    local_cache._connected = True
+    assert local_cache.get('b') is None
+
+
+def test_local_cache_generation(local_cache):
+    generation = local_cache.generation
+    local_cache.delete_multi(['a'])
+    local_cache.set('a', 'old', generation=generation)
+    local_cache.set('b', 'b', generation=generation)
+    assert local_cache.get('a') is None
+    assert local_cache.get('b') == 'b'
+    # once the invalidated keys are not tracked anymore, nothing
+    # retrieved before the invalidation is stored
+    local_cache.delete_multi(['x', 'y', 'z'])
+    local_cache.set('a', 'old', generation=generation)
+    local_cache.set('c', 'c', generation=generation)
+    assert local_cache.get('a') is None
+    assert local_cache.get('c') is None
+    local_cache.set('c', 'c', generation=local_cache.generation)
+    assert local_cache.get('c') == 'c'
+
+
+def test_local_cache_invalidation_message(local_cache):
+    other = LocalLRUCache('redis://localhost', max_size=3, ttl=60)
+    local_cache.set('a', 'a')
+    local_cache.set('b', 'b')
+    local_cache._handle_message({'data': local_cache.make_invalidation_message(['a'])})
+    assert local_cache.get('a') == 'a'
+    local_cache._handle_message({'data': other.make_invalidation_message(['a'])})
+    assert local_cache.get('a') is None
+    assert local_cache.get('b') == 'b'
+
+
+def test_local_cache_listener(mocker, local_cache):
+    class _StopListening(BaseException):
+        pass
+
+    local_cache.set('a', 'a')
+    local_cache.set('b', 'b')
+    other = LocalLRUCache('redis://localhost', max_size=3, ttl=60)
+    pubsub = mocker.patch('indico.legacy.common.cache.redis.StrictRedis.from_url').return_value.pubsub.return_value
+
+    def _listen():
+        # the cache is cleared when connecting since invalidations may have been missed
+        assert local_cache._connected
+        assert local_cache.get('a') is None
+        local_cache.set('a', 'a')
+        local_cache.set('b', 'b')
+        yield {'data': other.make_invalidation_message(['a'])}
+        assert local_cache.get('a') is None
+        assert local_cache.get('b') == 'b'
+        raise Exception('connection lost')
+
+    pubsub.listen.side_effect = _listen
+    mocker.patch('indico.legacy.common.cache.time.sleep', side_effect=_StopListening)
+    with pytest.raises(_StopListening):
+        local_cache._listen()
+    pubsub.subscribe.assert_called_once_with(LocalLRUCache.channel)
+    assert not local_cache._connected
+    assert local_cache.get('b') is None
+
+
+def test_two_tier_get_multi(two_tier_client, redis_client, local_cache):
+    redis_client.set('a', pickle.dumps('a'), ex=30)
+    redis_client.set('b', pickle.dumps('b'))
+    assert two_tier_client.get_multi(['a', 'b', 'c']) == {'a': 'a', 'b': 'b'}
+    # get and pttl for all keys are sent in a single round-trip
+    assert redis_client.executed == 1
+    assert local_cache._data['a'][0] <= local_cache._data['b'][0] - 29
+    # cached keys do not need any round-trip
+    redis_client.delete('a', 'b')
+    assert two_tier_client.get_multi(['a', 'b']) == {'a': 'a', 'b': 'b'}
+    assert redis_client.executed == 1
+
+
+def test_two_tier_get_invalidated_during_read(mocker, two_tier_client, redis_client, local_cache):
+    redis_client.set('a', pickle.dumps('old'))
+    execute = MockPipeline.execute
+
+    def _execute(pipe):
+        res = execute(pipe)
+        # another process changes the key while we wait for the response
+        local_cache._handle_message({'data': pickle.dumps(('other', ['a']))})
+        return res
+
+    mocker.patch.object(MockPipeline, 'execute', _execute)
+    assert two_tier_client.get('a') == 'old'
+    assert local_cache.get('a') is None
+
+
+def test_two_tier_set(two_tier_client, redis_client, local_cache):
+    two_tier_client.set_multi({'a': 'a', 'b': 'b'}, 30)
+    assert redis_client.executed == 1
+    assert redis_client.ttls == {'a': 30, 'b': 30}
+    assert pickle.loads(local_cache.get('a')) == 'a'
+    channel, message = redis_client.published[0]
+    assert channel == LocalLRUCache.channel
+    sender, keys = pickle.loads(message)
+    assert sender == local_cache.token
+    assert sorted(keys) == ['a', 'b']
+
+
+def test_two_tier_add(two_tier_client, redis_client, local_cache):
+    local_cache.set('a', pickle.dumps('stale'))
+    assert two_tier_client.add('a', 'a', 30)
+    assert not two_tier_client.add('a', 'b', 30)
+    assert local_cache.get('a') is None
+    assert two_tier_client.get('a') == 'a'
+    assert len(redis_client.published) == 2
+
+
+def test_two_tier_delete(two_tier_client, redis_client, local_cache):
+    two_tier_client.set('a', 'a')
+    two_tier_client.delete('a')
+    assert local_cache.get('a') is None
+    assert 'a' not in redis_client.data
+    assert pickle.loads(redis_client.published[-1][1]) == (local_cache.token, ['a'])
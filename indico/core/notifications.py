@@ -9,7 +9,7 @@ from __future__ import unicode_literals
 
 import re
 import time
-from functools import wraps
+from functools import partial, wraps
 from types import GeneratorType
 
 from flask import g
@@ -100,26 +100,51 @@ def flush_email_queue():
     if not queue:
         return
     logger.debug('Sending %d queued emails', len(queue))
-    for fn, email, log_entry in queue:
+    for send, emails in _batch_email_queue(queue):
         try:
-            fn(email, log_entry)
+            send()
         except Exception:
             # Flushing the email queue happens after a commit.
             # If anything goes wrong here we keep going and just log
             # it to avoid losing (more) emails in case celery is not
             # used for email sending or there is a temporary issue
             # with celery.
-            if log_entry:
-                update_email_log_state(log_entry, failed=True)
-            path = store_failed_email(email, log_entry)
-            logger.exception('Flushing queued email "%s" failed; stored data in %s',
-                             truncate(email['subject'], 100), path)
+            for email, log_entry in emails:
+                if log_entry:
+                    update_email_log_state(log_entry, failed=True)
+                path = store_failed_email(email, log_entry)
+                logger.exception('Flushing queued email "%s" failed; stored data in %s',
+                                 truncate(email['subject'], 100), path)
             # Wait for a short moment in case it's a very temporary issue
             time.sleep(0.25)
     del queue[:]
     db.session.commit()
 
 
+def _batch_email_queue(queue):
+    """Group queued emails into batches sent by a single task.
+
+    :return: An iterator yielding ``(send, emails)`` tuples, where
+             `send` is a callable sending the emails and `emails` is
+             the list of ``(email, log_entry)`` tuples it sends.
+    """
+    from indico.core.emails import send_emails_task
+    if not config.SMTP_USE_CELERY or config.SMTP_BATCH_SIZE < 2:
+        for fn, email, log_entry in queue:
+            yield partial(fn, email, log_entry), [(email, log_entry)]
+        return
+    for i in xrange(0, len(queue), config.SMTP_BATCH_SIZE):
+        batch = queue[i:i+config.SMTP_BATCH_SIZE]
+        if len(batch) == 1:
+            fn, email, log_entry = batch[0]
+            yield partial(fn, email, log_entry), [(email, log_entry)]
+        else:
+            emails = [(email, log_entry) for fn, email, log_entry in batch]
+            yield (partial(send_emails_task.delay, [(email, log_entry.id if log_entry else None)
+                                                    for email, log_entry in emails]),
+                   emails)
+
+
 def make_email(to_list=None, cc_list=None, bcc_list=None, from_address=None, reply_address=None, attachments=None,
                subject=None, body=None, template=None, html=False):
     """Create an email.
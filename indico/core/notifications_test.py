@@ -0,0 +1,56 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+from flask import g
+
+from indico.core.emails import send_emails_task
+from indico.core.notifications import flush_email_queue, init_email_queue, make_email, send_email
+from indico.testing.util import extract_emails
+
+
+@pytest.fixture
+def email_config(app):
+    old_config = app.config['INDICO']
+    app.config['INDICO'] = dict(app.config['INDICO'])  # make it mutable
+    yield app.config['INDICO']
+    app.config['INDICO'] = old_config
+
+
+@pytest.mark.usefixtures('db', 'request_context')
+@pytest.mark.parametrize(('batch_size', 'expected'), (
+    (1, [1, 1, 1, 1, 1]),
+    (2, [2, 2, 1]),
+    (10, [5]),
+))
+def test_flush_email_queue_batches(mocker, email_config, batch_size, expected):
+    email_config['SMTP_USE_CELERY'] = True
+    email_config['SMTP_BATCH_SIZE'] = batch_size
+    send_email_task = mocker.patch('indico.core.emails.send_email_task')
+    send_emails_task = mocker.patch('indico.core.emails.send_emails_task')
+    init_email_queue()
+    for i in range(5):
+        send_email(make_email('test{}@example.com'.format(i), subject='Test', body='Test'))
+    flush_email_queue()
+    assert not g.email_queue
+    sent = ([1] * send_email_task.delay.call_count +
+            [len(call[0][0]) for call in send_emails_task.delay.call_args_list])
+    assert sorted(sent, reverse=True) == expected
+
+
+@pytest.mark.usefixtures('db')
+def test_send_emails_task(smtp, mocker):
+    send_email_task = mocker.patch('indico.core.emails.send_email_task')
+    emails = [(make_email('test{}@example.com'.format(i), subject='Test {}'.format(i), body='Test'), None)
+              for i in range(3)]
+    send_emails_task.run(emails)
+    assert not send_email_task.apply_async.called
+    for i in range(3):
+        extract_emails(smtp, one=True, subject='Test {}'.format(i))
+    assert not smtp.outbox
@@ -8,22 +8,77 @@
 from __future__ import unicode_literals
 
 from collections import defaultdict
+from datetime import timedelta
 from enum import Enum
+from uuid import uuid4
 
 from flask import g, has_request_context
 from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.event import listens_for
+from sqlalchemy.orm import Session
 
 from indico.core.db import db
 from indico.core.db.sqlalchemy.principals import PrincipalMixin, PrincipalType
+from indico.legacy.common.cache import GenericCache
 from indico.util.decorators import strict_classproperty
 
 
+#: How long settings are kept in the shared cache
+SETTINGS_CACHE_TTL = timedelta(days=1)
+
+_settings_cache = GenericCache('settings')
+
+
 def _coerce_value(value):
     if isinstance(value, Enum):
         return value.value
     return value
 
 
+def _normalize_object_kwargs(kwargs):
+    # objects are identified by their ID (like in the query filtering by
+    # them) since their repr may change, e.g. when a user is renamed
+    for key, value in kwargs.viewitems():
+        if isinstance(value, db.Model):
+            yield '{}_id'.format(key), value.id
+        else:
+            yield key, value
+
+
+def _get_version_keys(cls, kwargs):
+    # settings are cached per settings class and object (e.g. event), and
+    # both have a version which changes whenever one of the settings changes.
+    # settings deleted/modified without specifying an object (such as
+    # ``delete_all`` for all events) change the version of the whole class.
+    object_key = ','.join('{}={}'.format(k, v) for k, v in sorted(_normalize_object_kwargs(kwargs)))
+    return 'version:{}'.format(cls.__name__), 'version:{}:{}'.format(cls.__name__, object_key)
+
+
+def _get_versions(version_keys):
+    versions = _settings_cache.get_multi(version_keys)
+    missing = [key for key, version in versions.viewitems() if version is None]
+    if missing:
+        for key in missing:
+            _settings_cache.add(key, uuid4().hex, SETTINGS_CACHE_TTL)
+        versions = _settings_cache.get_multi(version_keys)
+        if None in versions.viewvalues():
+            # cache not available (e.g. the null cache)
+            return None
+    return tuple(versions[key] for key in version_keys)
+
+
+@listens_for(Session, 'after_transaction_end')
+def _update_settings_cache_versions(session, transaction):
+    if transaction.parent is not None:
+        return
+    modified = session.info.pop('modified_settings', None)
+    if modified:
+        # settings modified in a transaction which has now ended get new
+        # versions, so all processes reload them from the database.
+        # this is also done on rollback where it's not needed but harmless
+        _settings_cache.set_multi({key: uuid4().hex for key in modified}, SETTINGS_CACHE_TTL)
+
+
 class SettingsBase(object):
     """Base class for any kind of setting tables."""
 
@@ -54,13 +109,13 @@ class SettingsBase(object):
             return
         cls.find(cls.name.in_(names), cls.module == module, **kwargs).delete(synchronize_session='fetch')
         db.session.flush()
-        cls._clear_cache()
+        cls._clear_cache(kwargs)
 
     @classmethod
     def delete_all(cls, module, **kwargs):
         cls.find(module=module, **kwargs).delete()
         db.session.flush()
-        cls._clear_cache()
+        cls._clear_cache(kwargs)
 
     @classmethod
     def _get_cache(cls, kwargs):
@@ -79,8 +134,8 @@ class SettingsBase(object):
             # no cache for this settings class / kwargs
             return g.global_settings_cache.setdefault(key, defaultdict(dict)), False
 
-    @staticmethod
-    def _clear_cache():
+    @classmethod
+    def _clear_cache(cls, kwargs):
         if has_request_context():
             g.pop('global_settings_cache', None)
 
@@ -103,15 +158,50 @@ class JSONSettingsBase(SettingsBase):
     def get_all_settings(cls, module, **kwargs):
         return {s.name: s for s in cls.find(module=module, **kwargs)}
 
+    @classmethod
+    def _clear_cache(cls, kwargs):
+        super(JSONSettingsBase, cls)._clear_cache(kwargs)
+        version_keys = _get_version_keys(cls, kwargs)
+        db.session.info.setdefault('modified_settings', set()).add(version_keys[1] if kwargs else version_keys[0])
+
+    @classmethod
+    def _load_all(cls, kwargs):
+        rv = defaultdict(dict)
+        for s in cls.find(**kwargs):
+            rv[s.module][s.name] = s.value
+        return rv
+
+    @classmethod
+    def _get_all_cached(cls, kwargs):
+        """Get all settings for the given kwargs using the shared cache.
+
+        The cache is shared by all processes (and with the in-process
+        cache in front of Redis it usually does not even need a Redis
+        query), so it is also used outside a request context where the
+        per-request cache is not available.
+        """
+        version_keys = _get_version_keys(cls, kwargs)
+        modified = db.session.info.get('modified_settings', ())
+        if version_keys[0] in modified or version_keys[1] in modified:
+            # not committed yet, so other processes must not see it
+            return cls._load_all(kwargs)
+        versions = _get_versions(version_keys)
+        if versions is None:
+            return cls._load_all(kwargs)
+        data_key = 'data:{}'.format(version_keys[1])
+        cached = _settings_cache.get(data_key)
+        if cached is not None and cached[0] == versions:
+            return defaultdict(dict, cached[1])
+        settings = cls._load_all(kwargs)
+        _settings_cache.set(data_key, (versions, dict(settings)), SETTINGS_CACHE_TTL)
+        return settings
+
     @classmethod
     def get_all(cls, module, **kwargs):
         cache, hit = cls._get_cache(kwargs)
-        if hit:
-            return cache[module]
-        else:
-            for s in cls.find(**kwargs):
-                cache[s.module][s.name] = s.value
-            return cache[module]
+        if not hit:
+            cache.update(cls._get_all_cached(kwargs))
+        return cache[module]
 
     @classmethod
     def get(cls, module, name, default=None, **kwargs):
@@ -128,7 +218,7 @@ class JSONSettingsBase(SettingsBase):
             db.session.add(setting)
         setting.value = _coerce_value(value)
         db.session.flush()
-        cls._clear_cache()
+        cls._clear_cache(kwargs)
 
     @classmethod
     def set_multi(cls, module, items, **kwargs):
@@ -139,7 +229,7 @@ class JSONSettingsBase(SettingsBase):
         for name in items.viewkeys() & existing.viewkeys():
             existing[name].value = _coerce_value(items[name])
         db.session.flush()
-        cls._clear_cache()
+        cls._clear_cache(kwargs)
 
 
 class PrincipalSettingsBase(PrincipalMixin, SettingsBase):
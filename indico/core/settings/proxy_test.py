@@ -12,8 +12,10 @@ import pytz
 
 from indico.core.settings import PrefixSettingsProxy, SettingsProxy
 from indico.core.settings.converters import DatetimeConverter, TimedeltaConverter
+from indico.core.settings.models import base
+from indico.legacy.common.cache import FileCacheClient
 from indico.modules.events.settings import EventSettingsProxy
-from indico.modules.users import User
+from indico.modules.users import User, UserSettingsProxy
 
 
 def test_proxy_strict_nodefaults():
@@ -97,6 +99,54 @@ def test_proxy_preload(count_queries):
     assert cnt() == 0
 
 
+def test_proxy_shared_cache(db, monkeypatch, tmpdir, count_queries, mocker):
+    monkeypatch.setattr(base._settings_cache, '_client', FileCacheClient(tmpdir.strpath))
+    # `parent` cannot be passed to the Mock constructor since it has a special meaning there
+    transaction = mocker.Mock()
+    transaction.parent = None
+    proxy = SettingsProxy('test', {'hello': 'world', 'foo': None})
+    proxy.set('foo', 'bar')
+    with count_queries() as cnt:
+        # modified in the current transaction, so the shared cache is not used
+        assert proxy.get('foo') == 'bar'
+        assert proxy.get('foo') == 'bar'
+    assert cnt() == 2
+    base._update_settings_cache_versions(db.session, transaction)
+    with count_queries() as cnt:
+        assert proxy.get('foo') == 'bar'
+    assert cnt() == 1
+    with count_queries() as cnt:
+        # no request context, but the shared cache is available
+        assert proxy.get('foo') == 'bar'
+        assert proxy.get('hello') == 'world'
+    assert cnt() == 0
+    proxy.set('foo', 'test')
+    assert proxy.get('foo') == 'test'
+    base._update_settings_cache_versions(db.session, transaction)
+    assert proxy.get('foo') == 'test'
+
+
+def test_user_proxy_shared_cache_renamed(db, monkeypatch, tmpdir, mocker, dummy_user):
+    monkeypatch.setattr(base._settings_cache, '_client', FileCacheClient(tmpdir.strpath))
+    transaction = mocker.Mock()
+    transaction.parent = None
+    proxy = UserSettingsProxy('test', {'foo': None})
+    proxy.set(dummy_user, 'foo', 'bar')
+    base._update_settings_cache_versions(db.session, transaction)
+    assert proxy.get(dummy_user, 'foo') == 'bar'
+    first_name = dummy_user.first_name
+    dummy_user.first_name = 'Renamed'
+    proxy.set(dummy_user, 'foo', 'test')
+    base._update_settings_cache_versions(db.session, transaction)
+    assert proxy.get(dummy_user, 'foo') == 'test'
+    # the settings are cached by user id, so the value cached before the
+    # user was renamed is not used anymore
+    dummy_user.first_name = first_name
+    assert proxy.get(dummy_user, 'foo') == 'test'
+    assert base._get_version_keys(base.JSONSettingsBase, {'user': dummy_user}) == \
+        base._get_version_keys(base.JSONSettingsBase, {'user_id': dummy_user.id})
+
+
 @pytest.mark.usefixtures('db', 'request_context')  # use req ctx so the cache is active
 def test_proxy_cache_mutable():
     proxy = SettingsProxy('test', {'foo': []})
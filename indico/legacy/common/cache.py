@@ -9,8 +9,11 @@ import cPickle as pickle
 import datetime
 import hashlib
 import os
+import threading
 import time
+from collections import OrderedDict
 from itertools import izip
+from uuid import uuid4
 
 import redis
 from flask import g
@@ -22,6 +25,11 @@ from indico.util.fs import silentremove
 from indico.util.string import truncate
 
 
+# Used to make `add` atomic (within the current process) for backends
+# which do not have a native way to set a value only if it's missing
+_add_lock = threading.Lock()
+
+
 # To cache `None` we need to actually store something else since memcached
 # does not distinguish between a None value and a cache miss...
 class _NoneValue(object):
@@ -49,6 +57,21 @@ class CacheClient(object):
     The unit for the ttl arguments is a second.
     """
 
+    def add(self, key, val, ttl=0):
+        """Set a value unless the key already exists.
+
+        Backends that cannot do this atomically fall back to a lock
+        which only protects against concurrent calls in the same
+        process.
+
+        :return: whether the value has been set
+        """
+        with _add_lock:
+            if self.get(key) is not None:
+                return False
+            self.set(key, val, ttl)
+            return True
+
     def set_multi(self, mapping, ttl=0):
         for key, val in mapping.iteritems():
             self.set(key, val, ttl)
@@ -108,10 +131,13 @@ class RedisCacheClient(CacheClient):
 
     def set_multi(self, mapping, ttl=0):
         try:
-            self._client.mset(dict((k, pickle.dumps(v)) for k, v in mapping.iteritems()))
-            if ttl:
-                for key in mapping:
-                    self._client.expire(key, ttl)
+            pipe = self._client.pipeline(transaction=False)
+            for key, val in mapping.iteritems():
+                if ttl:
+                    pipe.setex(key, ttl, pickle.dumps(val))
+                else:
+                    pipe.set(key, pickle.dumps(val))
+            pipe.execute()
         except redis.RedisError:
             Logger.get('cache.redis').exception('set_multi(%r, %r) failed', mapping, ttl)
 
@@ -120,6 +146,7 @@ class RedisCacheClient(CacheClient):
             return dict(zip(keys, map(self._unpickle, self._client.mget(keys))))
         except redis.RedisError:
             Logger.get('cache.redis').exception('get_multi(%r) failed', keys)
+            return {}
 
     def delete_multi(self, keys):
         try:
@@ -127,6 +154,13 @@ class RedisCacheClient(CacheClient):
         except redis.RedisError:
             Logger.get('cache.redis').exception('delete_multi(%r) failed', keys)
 
+    def add(self, key, val, ttl=0):
+        try:
+            return bool(self._client.set(key, pickle.dumps(val), ex=(ttl or None), nx=True))
+        except redis.RedisError:
+            Logger.get('cache.redis').exception('add(%r, %r) failed', key, ttl)
+            return False
+
     def set(self, key, val, ttl=0):
         try:
             if ttl:
@@ -150,6 +184,238 @@ class RedisCacheClient(CacheClient):
             Logger.get('cache.redis').exception('delete(%r) failed', key)
 
 
+class LocalLRUCache(object):
+    """A thread-safe in-process LRU cache limited in size and age.
+
+    Entries are invalidated across processes by listening for messages
+    sent on a Redis pub/sub channel whenever a process modifies a key.
+    As long as the listener is not connected, the cache is bypassed
+    since it may contain outdated data.
+
+    The cache contains pickled data so callers never share (and thus
+    possibly modify) the same object.
+
+    Every invalidation increases a generation counter.  Callers storing
+    a value they read from Redis pass the generation from before that
+    read, so the value is not stored if the key has been invalidated
+    in the meantime.
+    """
+
+    channel = 'cache/gen/invalidate'
+
+    def __init__(self, url, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.token = uuid4().hex
+        self.generation = 0
+        self._url = url
+        self._data = OrderedDict()
+        # the generation in which a key has last been invalidated; only
+        # the most recent ones are kept, for all others we only know the
+        # newest generation which has been discarded
+        self._invalidated = OrderedDict()
+        self._discarded_generation = 0
+        self._lock = threading.Lock()
+        self._connected = False
+        listener = threading.Thread(target=self._listen, name='cache-invalidation-listener')
+        listener.daemon = True
+        listener.start()
+
+    def get(self, key):
+        if not self._connected:
+            return None
+        with self._lock:
+            try:
+                expiry, val = self._data.pop(key)
+            except KeyError:
+                return None
+            if expiry < time.time():
+                return None
+            self._data[key] = (expiry, val)
+            return val
+
+    def set(self, key, val, ttl=0, generation=None):
+        """Store a value in the cache.
+
+        :param generation: The generation from before the value has been
+                           retrieved. If the key has been invalidated
+                           since then, the value is not stored.
+        """
+        if not self._connected:
+            return
+        expiry = time.time() + (min(ttl, self.ttl) if ttl else self.ttl)
+        with self._lock:
+            if generation is not None and self._invalidated_since(key, generation):
+                return
+            self._data.pop(key, None)
+            self._data[key] = (expiry, val)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def _invalidated_since(self, key, generation):
+        if key in self._invalidated:
+            return self._invalidated[key] > generation
+        return self._discarded_generation > generation
+
+    def delete_multi(self, keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                self._data.pop(key, None)
+                self._invalidated.pop(key, None)
+                self._invalidated[key] = self.generation
+            while len(self._invalidated) > self.max_size:
+                __, self._discarded_generation = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._invalidated.clear()
+            self._discarded_generation = self.generation
+
+    def make_invalidation_message(self, keys):
+        return pickle.dumps((self.token, list(keys)), pickle.HIGHEST_PROTOCOL)
+
+    def _handle_message(self, message):
+        sender, keys = pickle.loads(message['data'])
+        if sender != self.token:
+            self.delete_multi(keys)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis.StrictRedis.from_url(self._url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # anything we cached before may have been invalidated in the meantime
+                self.clear()
+                self._connected = True
+                for message in pubsub.listen():
+                    self._handle_message(message)
+            except Exception:
+                Logger.get('cache.local').exception('Listening for cache invalidations failed')
+            self._connected = False
+            self.clear()
+            time.sleep(1)
+
+
+_local_cache = None
+_local_cache_pid = None
+_local_cache_lock = threading.Lock()
+
+
+def get_local_cache():
+    """Get the in-process cache used in front of Redis.
+
+    A separate cache is created after forking since the listener
+    thread does not survive a fork.
+    """
+    global _local_cache, _local_cache_pid
+    with _local_cache_lock:
+        if _local_cache is None or _local_cache_pid != os.getpid():
+            _local_cache = LocalLRUCache(config.REDIS_CACHE_URL, config.CACHE_LOCAL_SIZE, config.CACHE_LOCAL_TTL)
+            _local_cache_pid = os.getpid()
+        return _local_cache
+
+
+class TwoTierCacheClient(CacheClient):
+    """Redis cache client with an in-process LRU cache in front of it.
+
+    Reads are served from the in-process cache whenever possible and
+    all Redis operations involving multiple keys are sent in a single
+    pipelined round-trip.  Every write also publishes an invalidation
+    message so other processes drop their copy of the modified keys.
+    """
+
+    key_prefix = RedisCacheClient.key_prefix
+
+    def __init__(self, client, local_cache):
+        self._redis_client = client
+        self._client = client._client
+        self._local = local_cache
+
+    def hash_key(self, key):
+        return self._redis_client.hash_key(key)
+
+    def _invalidate(self, pipe, keys):
+        self._local.delete_multi(keys)
+        pipe.publish(self._local.channel, self._local.make_invalidation_message(keys))
+
+    def get(self, key):
+        return self.get_multi([key]).get(key)
+
+    def get_multi(self, keys):
+        data = {}
+        missing = []
+        for key in keys:
+            val = self._local.get(key)
+            if val is None:
+                missing.append(key)
+            else:
+                data[key] = val
+        if missing:
+            # invalidations received while waiting for redis must not be
+            # overwritten with the data we got from redis
+            generation = self._local.generation
+            try:
+                pipe = self._client.pipeline(transaction=False)
+                for key in missing:
+                    pipe.get(key)
+                    pipe.pttl(key)
+                res = pipe.execute()
+            except redis.RedisError:
+                Logger.get('cache.redis').exception('get_multi(%r) failed', missing)
+                res = []
+            for key, val, pttl in izip(missing, res[::2], res[1::2]):
+                if val is not None:
+                    self._local.set(key, val, pttl / 1000.0 if pttl > 0 else 0, generation=generation)
+                    data[key] = val
+        return {key: pickle.loads(val) for key, val in data.iteritems()}
+
+    def set(self, key, val, ttl=0):
+        self.set_multi({key: val}, ttl)
+
+    def set_multi(self, mapping, ttl=0):
+        data = {key: pickle.dumps(val) for key, val in mapping.iteritems()}
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for key, val in data.iteritems():
+                if ttl:
+                    pipe.setex(key, ttl, val)
+                else:
+                    pipe.set(key, val)
+            self._invalidate(pipe, data)
+            generation = self._local.generation
+            pipe.execute()
+        except redis.RedisError:
+            Logger.get('cache.redis').exception('set_multi(%r, %r) failed', data.keys(), ttl)
+            return
+        for key, val in data.iteritems():
+            self._local.set(key, val, ttl, generation=generation)
+
+    def add(self, key, val, ttl=0):
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            pipe.set(key, pickle.dumps(val), ex=(ttl or None), nx=True)
+            self._invalidate(pipe, [key])
+            return bool(pipe.execute()[0])
+        except redis.RedisError:
+            Logger.get('cache.redis').exception('add(%r, %r) failed', key, ttl)
+            return False
+
+    def delete(self, key):
+        self.delete_multi([key])
+
+    def delete_multi(self, keys):
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            pipe.delete(*keys)
+            self._invalidate(pipe, keys)
+            pipe.execute()
+        except redis.RedisError:
+            Logger.get('cache.redis').exception('delete_multi(%r) failed', keys)
+
+
 class FileCacheClient(CacheClient):
     """File-based cache with a memcached-like API.
 
@@ -236,6 +502,9 @@ class MemcachedCacheClient(CacheClient):
         import memcache
         self._client = memcache.Client(servers)
 
+    def add(self, key, val, ttl=0):
+        return bool(self._client.add(key, val, self.convert_ttl(ttl)))
+
     def set(self, key, val, ttl=0):
         return self._client.set(key, val, self.convert_ttl(ttl))
 
@@ -250,11 +519,16 @@ class GenericCache(object):
     """A simple cache interface that supports various backends.
 
     The backends are accessed through the CacheClient interface.
+
+    When using Redis and :data:`CACHE_LOCAL_SIZE` is set, an in-process
+    cache is used in front of Redis.  Pass ``local=False`` to bypass it
+    for data that must always be up to date, such as locks.
     """
 
-    def __init__(self, namespace):
+    def __init__(self, namespace, local=True):
         self._client = None
         self._namespace = namespace
+        self._local = local
 
     def __repr__(self):
         return 'GenericCache(%r)' % self._namespace
@@ -268,23 +542,24 @@ class GenericCache(object):
         if self._client is not None:
             return
         # If not, we might have one from another instance
-        self._client = g.get('generic_cache_client', None)
-
-        if self._client is not None:
-            return
+        client = g.get('generic_cache_client', None)
 
         # If not, create a new one
-        backend = config.CACHE_BACKEND
-        if backend == 'memcached':
-            self._client = MemcachedCacheClient(config.MEMCACHED_SERVERS)
-        elif backend == 'redis':
-            self._client = RedisCacheClient(config.REDIS_CACHE_URL)
-        elif backend == 'files':
-            self._client = FileCacheClient(config.CACHE_DIR)
-        else:
-            self._client = NullCacheClient()
+        if client is None:
+            backend = config.CACHE_BACKEND
+            if backend == 'memcached':
+                client = MemcachedCacheClient(config.MEMCACHED_SERVERS)
+            elif backend == 'redis':
+                client = RedisCacheClient(config.REDIS_CACHE_URL)
+            elif backend == 'files':
+                client = FileCacheClient(config.CACHE_DIR)
+            else:
+                client = NullCacheClient()
+            g.generic_cache_client = client
 
-        g.generic_cache_client = self._client
+        if self._local and config.CACHE_LOCAL_SIZE and isinstance(client, RedisCacheClient):
+            client = TwoTierCacheClient(client, get_local_cache())
+        self._client = client
 
     def _hashKey(self, key):
         if hasattr(self._client, 'hash_key'):
@@ -316,6 +591,19 @@ class GenericCache(object):
         Logger.get('cache.generic').debug('SET %s %r (%d)', self._namespace, key, time)
         self._client.set(self._makeKey(key), _NoneValue.replace(val), time)
 
+    def add(self, key, val, time=0):
+        """Set key to val unless it already exists.
+
+        :param key: the key of the cache entry
+        :param val: any python object that can be pickled
+        :param time: number of seconds or a datetime.timedelta
+        :return: whether the value has been set
+        """
+        self._connect()
+        time = self._processTime(time)
+        Logger.get('cache.generic').debug('ADD %s %r (%d)', self._namespace, key, time)
+        return self._client.add(self._makeKey(key), _NoneValue.replace(val), time)
+
     def set_multi(self, mapping, time=0):
         self._connect()
         time = self._processTime(time)
@@ -0,0 +1,59 @@
+"""Add room availability table
+
+Revision ID: 7cb9e60346ea
+Revises: f37d509e221c
+Create Date: 2020-11-02 14:10:37.288412
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7cb9e60346ea'
+down_revision = 'f37d509e221c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'room_availability',
+        sa.Column('room_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('booked', postgresql.BIT(96), nullable=False),
+        sa.Column('pre_booked', postgresql.BIT(96), nullable=False),
+        sa.ForeignKeyConstraint(['room_id'], ['roombooking.rooms.id']),
+        sa.PrimaryKeyConstraint('room_id', 'date'),
+        schema='roombooking'
+    )
+    # 15-minute slots; a slot is set if any valid occurrence overlaps with it
+    op.execute('''
+        WITH slots AS (
+            SELECT r.room_id, r.state, occ.start_dt::date AS date,
+                   floor((extract(hour FROM occ.start_dt::time) * 60 + extract(minute FROM occ.start_dt::time) +
+                          extract(second FROM occ.start_dt::time) / 60) / 15)::int AS start_slot,
+                   CASE WHEN occ.end_dt::date > occ.start_dt::date THEN 96
+                        ELSE ceil((extract(hour FROM occ.end_dt::time) * 60 + extract(minute FROM occ.end_dt::time) +
+                                   extract(second FROM occ.end_dt::time) / 60) / 15)::int
+                   END AS end_slot
+            FROM roombooking.reservation_occurrences occ
+            JOIN roombooking.reservations r ON (r.id = occ.reservation_id)
+            WHERE occ.state = 2
+        ), masks AS (
+            SELECT room_id, state, date,
+                   (repeat('1', 96)::bit(96) >> start_slot) & (repeat('1', 96)::bit(96) << (96 - end_slot)) AS mask
+            FROM slots
+        )
+        INSERT INTO roombooking.room_availability (room_id, date, booked, pre_booked)
+        SELECT room_id, date,
+               bit_or(CASE WHEN state = 2 THEN mask ELSE repeat('0', 96)::bit(96) END),
+               bit_or(CASE WHEN state != 2 THEN mask ELSE repeat('0', 96)::bit(96) END)
+        FROM masks
+        GROUP BY room_id, date
+    ''')
+
+
+def downgrade():
+    op.drop_table('room_availability', schema='roombooking')
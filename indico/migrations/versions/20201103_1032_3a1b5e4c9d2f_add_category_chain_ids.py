@@ -0,0 +1,97 @@
+"""Add category chain ids
+
+Revision ID: 3a1b5e4c9d2f
+Revises: 7cb9e60346ea
+Create Date: 2020-11-03 10:32:14.615209
+"""
+
+import textwrap
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3a1b5e4c9d2f'
+down_revision = '7cb9e60346ea'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('categories', sa.Column('chain_ids', postgresql.ARRAY(sa.Integer()), nullable=True),
+                  schema='categories')
+    op.execute('''
+        WITH RECURSIVE chains(id, path) AS (
+            SELECT id, ARRAY[id]
+            FROM categories.categories
+            WHERE parent_id IS NULL
+
+            UNION ALL
+
+            SELECT cat.id, chains.path || cat.id
+            FROM categories.categories cat, chains
+            WHERE cat.parent_id = chains.id
+        )
+        UPDATE categories.categories cat
+        SET chain_ids = chains.path
+        FROM chains
+        WHERE chains.id = cat.id
+    ''')
+    op.alter_column('categories', 'chain_ids', nullable=False, schema='categories')
+    op.create_index(None, 'categories', ['chain_ids'], unique=False, schema='categories', postgresql_using='gin')
+    op.execute(textwrap.dedent('''
+        CREATE FUNCTION categories.update_chain_ids() RETURNS trigger AS
+        $BODY$
+        BEGIN
+            IF NEW.parent_id IS NULL THEN
+                NEW.chain_ids := ARRAY[NEW.id];
+            ELSE
+                SELECT chain_ids || NEW.id INTO NEW.chain_ids
+                FROM categories.categories
+                WHERE id = NEW.parent_id;
+            END IF;
+            RETURN NEW;
+        END;
+        $BODY$
+        LANGUAGE plpgsql
+    '''))
+    op.execute(textwrap.dedent('''
+        CREATE FUNCTION categories.update_descendant_chain_ids() RETURNS trigger AS
+        $BODY$
+        BEGIN
+            IF OLD.chain_ids = NEW.chain_ids THEN
+                RETURN NULL;
+            END IF;
+            -- replace the old chain of the moved category with its new one
+            UPDATE categories.categories
+            SET chain_ids = NEW.chain_ids || chain_ids[array_length(OLD.chain_ids, 1) + 1:]
+            WHERE chain_ids @> ARRAY[NEW.id] AND id != NEW.id;
+            RETURN NULL;
+        END;
+        $BODY$
+        LANGUAGE plpgsql
+    '''))
+    op.execute('''
+        CREATE TRIGGER update_chain_ids
+        BEFORE INSERT OR UPDATE OF parent_id
+        ON categories.categories
+        FOR EACH ROW
+        EXECUTE PROCEDURE categories.update_chain_ids();
+
+        CREATE TRIGGER update_descendant_chain_ids
+        AFTER UPDATE OF parent_id
+        ON categories.categories
+        FOR EACH ROW
+        EXECUTE PROCEDURE categories.update_descendant_chain_ids();
+    ''')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER update_descendant_chain_ids ON categories.categories')
+    op.execute('DROP TRIGGER update_chain_ids ON categories.categories')
+    op.execute('DROP FUNCTION categories.update_descendant_chain_ids()')
+    op.execute('DROP FUNCTION categories.update_chain_ids()')
+    op.drop_index('ix_categories_chain_ids', table_name='categories', schema='categories')
+    op.drop_column('categories', 'chain_ids', schema='categories')
@@ -0,0 +1,103 @@
+"""Add effective ACLs
+
+Revision ID: b2e6d71c4a83
+Revises: 3a1b5e4c9d2f
+Create Date: 2020-11-04 09:15:42.108733
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e6d71c4a83'
+down_revision = '3a1b5e4c9d2f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table, schema in (('categories', 'categories'), ('events', 'events')):
+        op.add_column(table, sa.Column('effective_acl', postgresql.ARRAY(sa.String()), nullable=False,
+                                       server_default='{}'),
+                      schema=schema)
+        op.alter_column(table, 'effective_acl', server_default=None, schema=schema)
+    # principal keys are the principal identifiers; public objects only contain '*'
+    op.execute('''
+        UPDATE categories.categories cat
+        SET effective_acl = CASE
+            WHEN (
+                SELECT pp.protection_mode
+                FROM categories.categories pp
+                WHERE pp.id = ANY(cat.chain_ids) AND pp.protection_mode != 1
+                ORDER BY array_position(cat.chain_ids, pp.id) DESC
+                LIMIT 1
+            ) = 0 THEN ARRAY['*']::varchar[]
+            ELSE coalesce((
+                SELECT array_agg(DISTINCT CASE p.type
+                    WHEN 1 THEN 'User:' || p.user_id
+                    WHEN 2 THEN 'Group::' || p.local_group_id
+                    WHEN 3 THEN 'Group:' || p.mp_group_provider || ':' || p.mp_group_name
+                    WHEN 5 THEN 'IPNetworkGroup:' || p.ip_network_group_id
+                    WHEN 7 THEN 'CategoryRole:' || p.category_role_id
+                END)::varchar[]
+                FROM categories.principals p
+                WHERE p.category_id = ANY(cat.chain_ids) AND (
+                    p.full_access OR array_position(cat.chain_ids, p.category_id) >= (
+                        SELECT max(array_position(cat.chain_ids, pp.id))
+                        FROM categories.categories pp
+                        WHERE pp.id = ANY(cat.chain_ids) AND pp.protection_mode != 1
+                    )
+                )
+            ), '{}')
+        END
+    ''')
+    op.execute('''
+        WITH own AS (
+            SELECT p.event_id, array_agg(DISTINCT CASE p.type
+                WHEN 1 THEN 'User:' || p.user_id
+                WHEN 2 THEN 'Group::' || p.local_group_id
+                WHEN 3 THEN 'Group:' || p.mp_group_provider || ':' || p.mp_group_name
+                WHEN 4 THEN 'Email:' || p.email
+                WHEN 5 THEN 'IPNetworkGroup:' || p.ip_network_group_id
+                WHEN 6 THEN 'EventRole:' || p.event_role_id
+                WHEN 7 THEN 'CategoryRole:' || p.category_role_id
+                WHEN 8 THEN 'RegistrationForm:' || p.registration_form_id
+            END)::varchar[] AS keys
+            FROM events.principals p
+            GROUP BY p.event_id
+        ), managers AS (
+            SELECT cat.id AS category_id, array_agg(DISTINCT CASE p.type
+                WHEN 1 THEN 'User:' || p.user_id
+                WHEN 2 THEN 'Group::' || p.local_group_id
+                WHEN 3 THEN 'Group:' || p.mp_group_provider || ':' || p.mp_group_name
+                WHEN 5 THEN 'IPNetworkGroup:' || p.ip_network_group_id
+                WHEN 7 THEN 'CategoryRole:' || p.category_role_id
+            END)::varchar[] AS keys
+            FROM categories.categories cat
+            JOIN categories.principals p ON (p.category_id = ANY(cat.chain_ids))
+            WHERE p.full_access
+            GROUP BY cat.id
+        )
+        UPDATE events.events e
+        SET effective_acl = CASE
+            WHEN e.protection_mode = 0 THEN ARRAY['*']::varchar[]
+            WHEN e.protection_mode = 1 AND cat.effective_acl @> ARRAY['*']::varchar[] THEN ARRAY['*']::varchar[]
+            WHEN e.protection_mode = 1 THEN
+                coalesce((SELECT keys FROM own WHERE own.event_id = e.id), '{}') || cat.effective_acl
+            ELSE
+                coalesce((SELECT keys FROM own WHERE own.event_id = e.id), '{}') || coalesce(managers.keys, '{}')
+        END
+        FROM categories.categories cat
+        LEFT JOIN managers ON (managers.category_id = cat.id)
+        WHERE cat.id = e.category_id
+    ''')
+    op.create_index(None, 'categories', ['effective_acl'], unique=False, schema='categories',
+                    postgresql_using='gin')
+    op.create_index(None, 'events', ['effective_acl'], unique=False, schema='events', postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_column('events', 'effective_acl', schema='events')
+    op.drop_column('categories', 'effective_acl', schema='categories')
@@ -0,0 +1,63 @@
+"""Add event log search vector
+
+Revision ID: e4a9c3f2d8b1
+Revises: b2e6d71c4a83
+Create Date: 2020-11-05 11:40:52.183604
+"""
+
+import textwrap
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a9c3f2d8b1'
+down_revision = 'b2e6d71c4a83'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('logs', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True), schema='events')
+    op.execute(textwrap.dedent('''
+        CREATE FUNCTION events.update_log_search_vector() RETURNS trigger AS
+        $BODY$
+        BEGIN
+            NEW.search_vector := to_tsvector('simple', indico.indico_unaccent(concat_ws(' ',
+                NEW.module, NEW.type, NEW.summary,
+                (SELECT u.first_name || ' ' || u.last_name FROM users.users u WHERE u.id = NEW.user_id),
+                NEW.data->>'body', NEW.data->>'subject', NEW.data->>'from', NEW.data->>'to', NEW.data->>'cc'
+            )));
+            RETURN NEW;
+        END;
+        $BODY$
+        LANGUAGE plpgsql
+    '''))
+    op.execute('''
+        UPDATE events.logs l
+        SET search_vector = to_tsvector('simple', indico.indico_unaccent(concat_ws(' ',
+            l.module, l.type, l.summary,
+            (SELECT u.first_name || ' ' || u.last_name FROM users.users u WHERE u.id = l.user_id),
+            l.data->>'body', l.data->>'subject', l.data->>'from', l.data->>'to', l.data->>'cc'
+        )))
+    ''')
+    op.alter_column('logs', 'search_vector', nullable=False, schema='events')
+    op.execute('''
+        CREATE TRIGGER update_search_vector
+        BEFORE INSERT OR UPDATE OF module, type, summary, user_id, data
+        ON events.logs
+        FOR EACH ROW
+        EXECUTE PROCEDURE events.update_log_search_vector();
+    ''')
+    op.create_index(None, 'logs', ['search_vector'], unique=False, schema='events', postgresql_using='gin')
+    op.create_index(None, 'logs', ['event_id', 'logged_dt', 'id'], unique=False, schema='events')
+
+
+def downgrade():
+    op.drop_index('ix_logs_event_id_logged_dt_id', table_name='logs', schema='events')
+    op.drop_index('ix_logs_search_vector', table_name='logs', schema='events')
+    op.execute('DROP TRIGGER update_search_vector ON events.logs')
+    op.execute('DROP FUNCTION events.update_log_search_vector()')
+    op.drop_column('logs', 'search_vector', schema='events')
@@ -0,0 +1,52 @@
+"""Add registration search data
+
+Revision ID: c7d1f4a93b25
+Revises: e4a9c3f2d8b1
+Create Date: 2020-11-06 10:15:27.412863
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d1f4a93b25'
+down_revision = 'e4a9c3f2d8b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'registration_search_data',
+        sa.Column('registration_id', sa.Integer(), nullable=False, autoincrement=False),
+        sa.Column('registration_form_id', sa.Integer(), nullable=False),
+        sa.Column('data', postgresql.JSONB(), nullable=False),
+        sa.Column('country', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['registration_id'], ['event_registration.registrations.id']),
+        sa.ForeignKeyConstraint(['registration_form_id'], ['event_registration.forms.id']),
+        sa.PrimaryKeyConstraint('registration_id'),
+        schema='event_registration'
+    )
+    op.create_index(None, 'registration_search_data', ['registration_form_id'], unique=False,
+                    schema='event_registration')
+    op.create_index(None, 'registration_search_data', ['country'], unique=False, schema='event_registration')
+    # personal_data_type 8 is the country field
+    op.execute('''
+        INSERT INTO event_registration.registration_search_data (registration_id, registration_form_id, data, country)
+        SELECT
+            r.id,
+            r.registration_form_id,
+            COALESCE(jsonb_object_agg(fd.field_id::text, rd.data) FILTER (WHERE rd.data != 'null'::jsonb), '{}'),
+            (array_agg(NULLIF(rd.data #>> '{}', '')) FILTER (WHERE fi.personal_data_type = 8))[1]
+        FROM event_registration.registrations r
+        LEFT JOIN event_registration.registration_data rd ON (rd.registration_id = r.id)
+        LEFT JOIN event_registration.form_field_data fd ON (fd.id = rd.field_data_id)
+        LEFT JOIN event_registration.form_items fi ON (fi.id = fd.field_id)
+        GROUP BY r.id
+    ''')
+
+
+def downgrade():
+    op.drop_table('registration_search_data', schema='event_registration')
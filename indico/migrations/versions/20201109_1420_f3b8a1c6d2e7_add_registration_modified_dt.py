@@ -0,0 +1,33 @@
+"""Add registration modified_dt
+
+Revision ID: f3b8a1c6d2e7
+Revises: c7d1f4a93b25
+Create Date: 2020-11-09 14:20:41.839127
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+from indico.core.db.sqlalchemy import UTCDateTime
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8a1c6d2e7'
+down_revision = 'c7d1f4a93b25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('registrations', sa.Column('modified_dt', UTCDateTime, nullable=True), schema='event_registration')
+    op.execute('''
+        UPDATE event_registration.registrations
+        SET modified_dt = GREATEST(submitted_dt, checked_in_dt)
+    ''')
+    op.alter_column('registrations', 'modified_dt', nullable=False, schema='event_registration')
+    op.create_index(None, 'registrations', ['event_id', 'modified_dt'], unique=False, schema='event_registration')
+
+
+def downgrade():
+    op.drop_index('ix_registrations_event_id_modified_dt', table_name='registrations', schema='event_registration')
+    op.drop_column('registrations', 'modified_dt', schema='event_registration')
@@ -0,0 +1,30 @@
+"""Add registration ticket file
+
+Revision ID: a9d4e2b7c1f0
+Revises: f3b8a1c6d2e7
+Create Date: 2020-11-10 09:35:12.527604
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4e2b7c1f0'
+down_revision = 'f3b8a1c6d2e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('registrations', sa.Column('ticket_file_id', sa.Integer(), nullable=True),
+                  schema='event_registration')
+    op.create_index(None, 'registrations', ['ticket_file_id'], unique=False, schema='event_registration')
+    op.create_foreign_key(None, 'registrations', 'files', ['ticket_file_id'], ['id'],
+                          source_schema='event_registration', referent_schema='indico')
+
+
+def downgrade():
+    op.drop_constraint('fk_registrations_ticket_file_id_files', 'registrations', schema='event_registration')
+    op.drop_index('ix_registrations_ticket_file_id', table_name='registrations', schema='event_registration')
+    op.drop_column('registrations', 'ticket_file_id', schema='event_registration')
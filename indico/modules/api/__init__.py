@@ -34,6 +34,7 @@ api_settings = SettingsProxy('api', {
     'allow_persistent': False,
     'security_mode': APIMode.KEY.value,
     'cache_ttl': 600,
+    'cache_stale_ttl': 0,
     'signature_ttl': 600
 })
 
@@ -35,6 +35,9 @@ class AdminSettingsForm(IndicoForm):
                                                         'signed request.'))
     cache_ttl = IntegerField(_('Cache TTL'), [NumberRange(min=0)],
                              description=_('Time to cache API results (in seconds)'))
+    cache_stale_ttl = IntegerField(_('Stale cache TTL'), [NumberRange(min=0)],
+                                   description=_('Time during which an expired API result is still served while it '
+                                                 'is being refreshed in the background (in seconds)'))
     signature_ttl = IntegerField(_('Signature TTL'), [NumberRange(min=1)],
                                  description=_('Time after which a request signature expires. This should not be too '
                                                'low to account for small clock differences between the client and the '
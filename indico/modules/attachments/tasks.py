@@ -5,16 +5,41 @@
 # modify it under the terms of the MIT License; see the
 # LICENSE file for more details.
 
+from datetime import timedelta
+from hashlib import sha1
+
 from indico.core.celery import celery
 from indico.core.db import db
+from indico.legacy.common.cache import GenericCache
 from indico.modules.attachments.models.attachments import Attachment
 from indico.modules.files.models.files import File
 
 
+#: How long a generated material package is reused for identical
+#: requests.  This must be shorter than the time after which unclaimed
+#: files are deleted.
+PACKAGE_CACHE_TTL = timedelta(hours=12)
+
+_package_cache = GenericCache('materials-package')
+
+
+def _get_package_cache_key(event, attachments):
+    # a new version of an attachment has a different file id, so the
+    # cached package is not used anymore in that case
+    files = sorted((a.id, a.file_id) for a in attachments)
+    return sha1('{}:{}'.format(event.id, files)).hexdigest()
+
+
 @celery.task(ignore_result=False)
 def generate_materials_package(attachment_ids, event):
     from indico.modules.attachments.controllers.event_package import AttachmentPackageGeneratorMixin
     attachments = Attachment.query.filter(Attachment.id.in_(attachment_ids)).all()
+    cache_key = _get_package_cache_key(event, attachments)
+    file_id = _package_cache.get(cache_key)
+    if file_id is not None:
+        f = File.get(file_id)
+        if f is not None and f.storage_file_id is not None:
+            return f.signed_download_url
     attachment_package_mixin = AttachmentPackageGeneratorMixin()
     attachment_package_mixin.event = event
     generated_zip = attachment_package_mixin._generate_zip_file(attachments, return_file=True)
@@ -23,4 +48,5 @@ def generate_materials_package(attachment_ids, event):
     f.save(context, generated_zip)
     db.session.add(f)
     db.session.commit()
+    _package_cache.set(cache_key, f.id, PACKAGE_CACHE_TTL)
     return f.signed_download_url
@@ -38,6 +38,39 @@ def _merge_users(target, source, **kwargs):
     CategoryPrincipal.merge_users(target, source, 'category')
 
 
+@signals.event.created.connect
+@signals.event.updated.connect
+@signals.event.deleted.connect
+def _event_changed(event, **kwargs):
+    from indico.modules.categories.serialize import invalidate_category_feeds
+    invalidate_category_feeds(event.category.chain_ids)
+
+
+@signals.event.moved.connect
+def _event_moved(event, old_parent, **kwargs):
+    from indico.modules.categories.serialize import invalidate_category_feeds
+    invalidate_category_feeds(set(event.category.chain_ids) | set(old_parent.chain_ids))
+
+
+@signals.category.updated.connect
+@signals.category.moved.connect
+@signals.category.deleted.connect
+def _category_changed(category, old_parent=None, **kwargs):
+    from indico.modules.categories.serialize import invalidate_category_feeds
+    invalidate_category_feeds(set(category.chain_ids) | set(old_parent.chain_ids if old_parent else []))
+
+
+@signals.acl.entry_changed.connect
+@signals.acl.protection_changed.connect
+def _protection_changed(sender, obj, **kwargs):
+    from indico.modules.categories.serialize import invalidate_category_feeds
+    from indico.modules.events import Event
+    if sender is Category:
+        invalidate_category_feeds(obj.chain_ids)
+    elif sender is Event:
+        invalidate_category_feeds(obj.category.chain_ids)
+
+
 @signals.menu.items.connect_via('category-management-sidemenu')
 def _sidemenu_items(sender, category, **kwargs):
     yield SideMenuItem('content', _('Content'), url_for('categories.manage_content', category),
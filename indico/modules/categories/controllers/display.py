@@ -20,6 +20,7 @@ from flask import Response, flash, jsonify, redirect, request, session
 from pytz import utc
 from sqlalchemy.orm import joinedload, load_only, subqueryload, undefer, undefer_group
 from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.http import is_resource_modified
 
 from indico.core.db import db
 from indico.core.db.sqlalchemy.colors import ColorTuple
@@ -27,7 +28,8 @@ from indico.core.db.sqlalchemy.util.queries import get_n_matching
 from indico.modules.categories.controllers.base import RHDisplayCategoryBase
 from indico.modules.categories.legacy import XMLCategorySerializer
 from indico.modules.categories.models.categories import Category
-from indico.modules.categories.serialize import (serialize_categories_ical, serialize_category, serialize_category_atom,
+from indico.modules.categories.serialize import (get_cached_category_feed, get_category_feed_version,
+                                                 serialize_categories_ical, serialize_category, serialize_category_atom,
                                                  serialize_category_chain)
 from indico.modules.categories.util import get_category_stats, get_upcoming_events
 from indico.modules.categories.views import WPCategory, WPCategoryCalendar, WPCategoryStatistics
@@ -406,22 +408,57 @@ class RHShowPastEventsInCategory(RHShowEventsInCategoryBase):
     session_field = 'fetch_past_events_in'
 
 
-class RHExportCategoryICAL(RHDisplayCategoryBase):
-    def _process(self):
-        filename = '{}-category.ics'.format(secure_filename(self.category.title, str(self.category.id)))
-        buf = serialize_categories_ical([self.category.id], session.user,
-                                        Event.end_dt >= (now_utc() - timedelta(weeks=4)))
-        return send_file(filename, buf, 'text/calendar')
+class RHCategoryFeedBase(RHDisplayCategoryBase):
+    """Base class for category feeds.
+
+    Rendered feeds are cached and conditional requests are supported,
+    so clients polling an unchanged feed do not cause the events to be
+    queried again.
+    """
 
+    #: The type of the feed, also used as the file extension
+    feed_type = None
+    #: The MIME type of the feed
+    mimetype = None
+
+    def _render(self):
+        raise NotImplementedError
 
-class RHExportCategoryAtom(RHDisplayCategoryBase):
     def _process(self):
-        filename = '{}-category.atom'.format(secure_filename(self.category.title, str(self.category.id)))
-        buf = serialize_category_atom(self.category,
-                                      url_for(request.endpoint, self.category, _external=True),
-                                      session.user,
-                                      Event.end_dt >= now_utc())
-        return send_file(filename, buf, 'application/atom+xml')
+        filename = '{}-category.{}'.format(secure_filename(self.category.title, str(self.category.id)),
+                                           self.feed_type)
+        version = get_category_feed_version(self.category, session.user, self.feed_type)
+        if version is None:
+            return send_file(filename, BytesIO(self._render()), self.mimetype)
+        etag, last_modified = version
+        # werkzeug compares the date with a naive one from the request
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified.replace(tzinfo=None)):
+            rv = Response(status=304)
+        else:
+            rv = send_file(filename, BytesIO(get_cached_category_feed(etag, self._render)), self.mimetype)
+        rv.set_etag(etag)
+        rv.last_modified = last_modified
+        return rv
+
+
+class RHExportCategoryICAL(RHCategoryFeedBase):
+    feed_type = 'ics'
+    mimetype = 'text/calendar'
+
+    def _render(self):
+        return serialize_categories_ical([self.category.id], session.user,
+                                         Event.end_dt >= (now_utc() - timedelta(weeks=4))).getvalue()
+
+
+class RHExportCategoryAtom(RHCategoryFeedBase):
+    feed_type = 'atom'
+    mimetype = 'application/atom+xml'
+
+    def _render(self):
+        return serialize_category_atom(self.category,
+                                       url_for(request.endpoint, self.category, _external=True),
+                                       session.user,
+                                       Event.end_dt >= now_utc()).getvalue()
 
 
 class RHXMLExportCategoryInfo(RH):
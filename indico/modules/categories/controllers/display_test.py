@@ -0,0 +1,94 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import MagicMock
+from werkzeug.http import http_date, quote_etag
+
+from indico.core.db import db
+from indico.legacy.common.cache import FileCacheClient, NullCacheClient
+from indico.modules.categories.controllers.display import RHCategoryFeedBase
+from indico.modules.categories.serialize import _feed_cache, invalidate_category_feeds
+
+
+class RHDummyFeed(RHCategoryFeedBase):
+    feed_type = 'ics'
+    mimetype = 'text/calendar'
+
+
+@pytest.fixture
+def get_feed(app, mocker):
+    """Request a category feed, optionally with conditional request headers."""
+    render = mocker.patch.object(RHDummyFeed, '_render', return_value=b'feed')
+
+    def _get_feed(**headers):
+        with app.test_request_context('/category/1/events.ics', headers=headers):
+            rh = RHDummyFeed()
+            rh.category = MagicMock(id=1, title='Test', chain_ids=[0, 1])
+            rv = rh._process()
+            rv.direct_passthrough = False  # allow accessing the data of file responses
+            return rv
+
+    _get_feed.render = render
+    return _get_feed
+
+
+@pytest.fixture
+def feed_cache(mocker, tmpdir):
+    mocker.patch.object(_feed_cache, '_client', FileCacheClient(tmpdir.strpath))
+
+
+@pytest.mark.usefixtures('feed_cache')
+def test_category_feed_conditional(get_feed):
+    rv = get_feed()
+    assert rv.status_code == 200
+    assert rv.get_data() == b'feed'
+    etag = rv.get_etag()[0]
+    assert etag
+    assert rv.last_modified
+    # matching conditional requests do not render the feed
+    rv = get_feed(**{'If-None-Match': quote_etag(etag)})
+    assert rv.status_code == 304
+    assert rv.get_etag()[0] == etag
+    assert not rv.get_data()
+    rv = get_feed(**{'If-Modified-Since': http_date(rv.last_modified)})
+    assert rv.status_code == 304
+    # and neither do non-conditional requests for a cached feed
+    rv = get_feed()
+    assert rv.status_code == 200
+    assert rv.get_data() == b'feed'
+    assert get_feed.render.call_count == 1
+    rv = get_feed(**{'If-None-Match': quote_etag('outdated')})
+    assert rv.status_code == 200
+    assert get_feed.render.call_count == 1
+
+
+@pytest.mark.usefixtures('feed_cache')
+@pytest.mark.parametrize('category_id', (0, 1))
+def test_category_feed_changed(app, get_feed, category_id):
+    etag = get_feed().get_etag()[0]
+    # e.g. an event or the protection of the category or a parent changed
+    with app.app_context():
+        invalidate_category_feeds({category_id})
+        db.session.rollback()
+    rv = get_feed(**{'If-None-Match': quote_etag(etag)})
+    assert rv.status_code == 200
+    assert rv.get_etag()[0] != etag
+    assert rv.get_data() == b'feed'
+    assert get_feed.render.call_count == 2
+
+
+def test_category_feed_null_cache(mocker, get_feed):
+    mocker.patch.object(_feed_cache, '_client', NullCacheClient())
+    for __ in range(2):
+        rv = get_feed(**{'If-None-Match': '*'})
+        assert rv.status_code == 200
+        assert rv.get_data() == b'feed'
+        assert rv.get_etag() == (None, None)
+    assert get_feed.render.call_count == 2
@@ -108,3 +108,45 @@ def _create_check_cycles(sender, connection, **kwargs):
         LANGUAGE plpgsql
     """)
     DDL(sql).execute(connection)
+
+
+@signals.db_schema_created.connect_via('categories')
+def _create_update_chain_ids(sender, connection, **kwargs):
+    sql = textwrap.dedent("""
+        CREATE FUNCTION categories.update_chain_ids() RETURNS trigger AS
+        $BODY$
+        BEGIN
+            IF NEW.parent_id IS NULL THEN
+                NEW.chain_ids := ARRAY[NEW.id];
+            ELSE
+                SELECT chain_ids || NEW.id INTO NEW.chain_ids
+                FROM categories.categories
+                WHERE id = NEW.parent_id;
+            END IF;
+            RETURN NEW;
+        END;
+        $BODY$
+        LANGUAGE plpgsql
+    """)
+    DDL(sql).execute(connection)
+
+
+@signals.db_schema_created.connect_via('categories')
+def _create_update_descendant_chain_ids(sender, connection, **kwargs):
+    sql = textwrap.dedent("""
+        CREATE FUNCTION categories.update_descendant_chain_ids() RETURNS trigger AS
+        $BODY$
+        BEGIN
+            IF OLD.chain_ids = NEW.chain_ids THEN
+                RETURN NULL;
+            END IF;
+            -- replace the old chain of the moved category with its new one
+            UPDATE categories.categories
+            SET chain_ids = NEW.chain_ids || chain_ids[array_length(OLD.chain_ids, 1) + 1:]
+            WHERE chain_ids @> ARRAY[NEW.id] AND id != NEW.id;
+            RETURN NULL;
+        END;
+        $BODY$
+        LANGUAGE plpgsql
+    """)
+    DDL(sql).execute(connection)
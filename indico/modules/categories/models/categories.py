@@ -8,8 +8,8 @@
 from __future__ import unicode_literals
 
 import pytz
-from sqlalchemy import DDL, orm
-from sqlalchemy.dialects.postgresql import ARRAY, JSONB, array
+from sqlalchemy import DDL, FetchedValue, orm
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, aggregate_order_by, array
 from sqlalchemy.event import listens_for
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -77,6 +77,8 @@ class Category(SearchableTitleMixin, DescriptionMixin, ProtectionManagersMixin,
                 db.CheckConstraint("(id != 0) OR (protection_mode != {})".format(ProtectionMode.inheriting),
                                    'root_not_inheriting'),
                 db.CheckConstraint('visibility IS NULL OR visibility > 0', 'valid_visibility'),
+                db.Index(None, 'chain_ids', postgresql_using='gin'),
+                db.Index(None, 'effective_acl', postgresql_using='gin'),
                 {'schema': 'categories'})
 
     @declared_attr
@@ -93,6 +95,22 @@ class Category(SearchableTitleMixin, DescriptionMixin, ProtectionManagersMixin,
         index=True,
         nullable=True
     )
+    #: The ids of the categories in the parent chain, starting with the
+    #: root category down to the category itself.  It is maintained by
+    #: a trigger whenever a category is created or moved.
+    chain_ids = db.Column(
+        ARRAY(db.Integer),
+        nullable=False,
+        server_default=FetchedValue(),
+        server_onupdate=FetchedValue()
+    )
+    #: The keys of all principals who can access the category; it is
+    #: maintained automatically (see :mod:`indico.modules.events.models.effective_acl`)
+    effective_acl = db.deferred(db.Column(
+        ARRAY(db.String),
+        nullable=False,
+        default=[]
+    ))
     is_deleted = db.Column(
         db.Boolean,
         nullable=False,
@@ -307,13 +325,17 @@ class Category(SearchableTitleMixin, DescriptionMixin, ProtectionManagersMixin,
         self.position = (max(x.position for x in target.children) + 1) if target.children else 1
         self.parent = target
         db.session.flush()
+        # the chains of all subcategories have been updated by a trigger
+        for obj in db.session.identity_map.values():
+            if isinstance(obj, Category) and 'chain_ids' in obj.__dict__ and self.id in obj.chain_ids:
+                db.session.expire(obj, ['chain_ids'])
         signals.category.moved.send(self, old_parent=old_parent)
 
     @classmethod
     def get_tree_cte(cls, col='id'):
-        """Create a CTE for the category tree.
+        """Create a subquery for the category tree.
 
-        The CTE contains the following columns:
+        The subquery contains the following columns:
 
         - ``id`` -- the category id
         - ``path`` -- an array containing the path from the root to
@@ -323,33 +345,38 @@ class Category(SearchableTitleMixin, DescriptionMixin, ProtectionManagersMixin,
         :param col: The name of the column to use in the path or a
                     callable receiving the category alias that must
                     return the expression used for the 'path'
-                    retrieved by the CTE.
+                    retrieved by the subquery.
         """
         cat_alias = db.aliased(cls)
-        if callable(col):
-            path_column = col(cat_alias)
+        if col == 'id':
+            path_column = cat_alias.chain_ids
         else:
-            path_column = getattr(cat_alias, col)
-        cte_query = (select([cat_alias.id, array([path_column]).label('path'), cat_alias.is_deleted])
-                     .where(cat_alias.parent_id.is_(None))
-                     .cte(recursive=True))
-        rec_query = (select([cat_alias.id,
-                             cte_query.c.path.op('||')(path_column),
-                             cte_query.c.is_deleted | cat_alias.is_deleted])
-                     .where(cat_alias.parent_id == cte_query.c.id))
-        return cte_query.union_all(rec_query)
+            parent_alias = db.aliased(cls)
+            if callable(col):
+                path_column = col(parent_alias)
+            else:
+                path_column = getattr(parent_alias, col)
+            position = db.func.array_position(cat_alias.chain_ids, parent_alias.id)
+            path_column = (select([db.func.array_agg(aggregate_order_by(path_column, position))])
+                           .where(cat_alias.chain_ids.any(parent_alias.id))
+                           .as_scalar())
+        # thanks to the deletion consistency check no deleted category
+        # may contain any categories which are not deleted themselves
+        return select([cat_alias.id, path_column.label('path'), cat_alias.is_deleted]).alias('category_tree')
 
     @classmethod
     def get_protection_cte(cls):
         cat_alias = db.aliased(cls)
-        cte_query = (select([cat_alias.id, cat_alias.protection_mode])
-                     .where(cat_alias.parent_id.is_(None))
-                     .cte(recursive=True))
-        rec_query = (select([cat_alias.id,
-                             db.case({ProtectionMode.inheriting.value: cte_query.c.protection_mode},
-                                     else_=cat_alias.protection_mode, value=cat_alias.protection_mode)])
-                     .where(cat_alias.parent_id == cte_query.c.id))
-        return cte_query.union_all(rec_query)
+        parent_alias = db.aliased(cls)
+        # the root category cannot be inheriting so there is always at
+        # least one category in the chain with an explicit protection mode
+        protection_mode = (select([parent_alias.protection_mode])
+                           .where(cat_alias.chain_ids.any(parent_alias.id) &
+                                  (parent_alias.protection_mode != ProtectionMode.inheriting))
+                           .order_by(db.func.array_position(cat_alias.chain_ids, parent_alias.id).desc())
+                           .limit(1)
+                           .as_scalar())
+        return select([cat_alias.id, protection_mode.label('protection_mode')]).alias('category_protection')
 
     def get_protection_parent_cte(self):
         cte_query = (select([Category.id, db.cast(literal(None), db.Integer).label('protection_parent')])
@@ -382,22 +409,16 @@ class Category(SearchableTitleMixin, DescriptionMixin, ProtectionManagersMixin,
 
         This includes subcategories at any level of nesting.
         """
-        cte = Category.get_tree_cte()
-        return (Category.query
-                .join(cte, Category.id == cte.c.id)
-                .filter(cte.c.path.contains([self.id]),
-                        cte.c.id != self.id,
-                        ~cte.c.is_deleted))
+        return Category.query.filter(Category.chain_ids.contains([self.id]),
+                                     Category.id != self.id,
+                                     ~Category.is_deleted)
 
     @staticmethod
     def _get_chain_query(start_criterion):
-        cte_query = (select([Category.id, Category.parent_id, literal(0).label('level')])
-                     .where(start_criterion)
-                     .cte('category_chain', recursive=True))
-        parent_query = (select([Category.id, Category.parent_id, cte_query.c.level + 1])
-                        .where(Category.id == cte_query.c.parent_id))
-        cte_query = cte_query.union_all(parent_query)
-        return Category.query.join(cte_query, Category.id == cte_query.c.id).order_by(cte_query.c.level.desc())
+        chains = select([Category.chain_ids]).where(start_criterion).alias('category_chain')
+        return (Category.query
+                .join(chains, chains.c.chain_ids.any(Category.id))
+                .order_by(db.func.array_position(chains.c.chain_ids, Category.id)))
 
     @property
     def chain_query(self):
@@ -485,14 +506,20 @@ class Category(SearchableTitleMixin, DescriptionMixin, ProtectionManagersMixin,
         Get a sqlalchemy select for the visible categories within
         the given category, including the category itself.
         """
-        cte_query = (select([Category.id, literal(0).label('level')])
-                     .where((Category.id == category_id) & (Category.visibility.is_(None) | (Category.visibility > 0)))
-                     .cte(recursive=True))
-        parent_query = (select([Category.id, cte_query.c.level + 1])
-                        .where(db.and_(Category.parent_id == cte_query.c.id,
-                                       db.or_(Category.visibility.is_(None),
-                                              Category.visibility > cte_query.c.level + 1))))
-        return cte_query.union_all(parent_query)
+        cat_alias = db.aliased(Category)
+        parent_alias = db.aliased(Category)
+        start_position = db.func.array_position(cat_alias.chain_ids, category_id)
+        level = db.func.array_length(cat_alias.chain_ids, 1) - start_position
+        parent_level = db.func.array_position(cat_alias.chain_ids, parent_alias.id) - start_position
+        # a category is hidden if it or any of its parents below the
+        # given category is not visible at its depth in the tree (the
+        # level of categories above the given one is always negative)
+        hidden = (exists([1])
+                  .where(cat_alias.chain_ids.any(parent_alias.id) &
+                         (parent_alias.visibility <= parent_level)))
+        return (select([cat_alias.id, level.label('level')])
+                .where(cat_alias.chain_ids.contains([category_id]) & ~hidden)
+                .alias('visible_categories'))
 
     @property
     def visible_categories_query(self):
@@ -628,3 +655,21 @@ def _add_cycle_check_trigger(target, conn, **kw):
         EXECUTE PROCEDURE categories.check_cycles();
     """.format(table=target.fullname)
     DDL(sql).execute(conn)
+
+
+@listens_for(Category.__table__, 'after_create')
+def _add_chain_ids_triggers(target, conn, **kw):
+    sql = """
+        CREATE TRIGGER update_chain_ids
+        BEFORE INSERT OR UPDATE OF parent_id
+        ON {table}
+        FOR EACH ROW
+        EXECUTE PROCEDURE categories.update_chain_ids();
+
+        CREATE TRIGGER update_descendant_chain_ids
+        AFTER UPDATE OF parent_id
+        ON {table}
+        FOR EACH ROW
+        EXECUTE PROCEDURE categories.update_descendant_chain_ids();
+    """.format(table=target.fullname)
+    DDL(sql).execute(conn)
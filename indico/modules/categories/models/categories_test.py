@@ -155,3 +155,39 @@ def test_visibility_horizon_limitation(category_family, create_category):
     assert son.real_visibility_horizon == dad
     assert grandson.real_visibility_horizon == dad
     assert sibling.real_visibility_horizon == dad
+
+
+def test_chain_ids(db, category_family, create_category):
+    grandpa, dad, son, sibling = category_family
+    grandson = create_category(4, title='Grandson', parent=son)
+    db.session.flush()
+    db.session.expire_all()
+    assert grandson.chain_ids == [0, 1, 2, 4]
+    assert sibling.chain_ids == [0, 1, 3]
+
+    son.move(sibling)
+    assert son.chain_ids == [0, 1, 3, 2]
+    assert grandson.chain_ids == [0, 1, 3, 2, 4]
+    assert sibling.chain_ids == [0, 1, 3]
+    assert grandson.chain_query.all() == [grandpa, dad, sibling, son, grandson]
+    assert grandson.chain_titles == ['Home', 'Dad', 'Sibling', 'Son', 'Grandson']
+
+
+def test_deep_children_query(db, category_family, create_category):
+    grandpa, dad, son, sibling = category_family
+    grandson = create_category(4, title='Grandson', parent=son)
+    create_category(5, title='Deleted', parent=son).is_deleted = True
+    db.session.flush()
+    assert set(dad.deep_children_query) == {son, sibling, grandson}
+    assert set(son.deep_children_query) == {grandson}
+    assert dad.deep_children_count == 3
+
+
+def test_visible_categories_query(db, category_family, create_category):
+    grandpa, dad, son, sibling = category_family
+    grandson = create_category(4, title='Grandson', parent=son)
+    son.visibility = 2
+    db.session.flush()
+    assert set(grandpa.visible_categories_query) == {grandpa, dad, sibling}
+    assert set(dad.visible_categories_query) == {dad, son, sibling, grandson}
+    assert set(son.visible_categories_query) == {son, grandson}
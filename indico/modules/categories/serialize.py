@@ -7,24 +7,166 @@
 
 from __future__ import unicode_literals
 
+from datetime import timedelta
+from hashlib import sha1
 from io import BytesIO
 from itertools import ifilter
+from uuid import uuid4
 
 import icalendar as ical
 from feedgen.feed import FeedGenerator
 from flask import session
 from lxml import html
 from lxml.etree import ParserError
-from sqlalchemy.orm import joinedload, load_only, subqueryload, undefer
+from sqlalchemy.event import listens_for
+from sqlalchemy.orm import Session, joinedload, load_only, subqueryload, undefer
 from werkzeug.urls import url_parse
 
 from indico.core.config import config
+from indico.core.db import db
+from indico.core.db.sqlalchemy.util.queries import iter_keyset_chunks
+from indico.legacy.common.cache import GenericCache
 from indico.modules.categories import Category
 from indico.modules.events import Event
 from indico.util.date_time import now_utc
 from indico.util.string import sanitize_html
 
 
+#: How long rendered category feeds are cached.  Since the feeds only
+#: contain events relative to the current date, this is also how long
+#: it may take until past events disappear from a cached feed.
+CATEGORY_FEED_CACHE_TTL = timedelta(hours=1)
+
+_feed_cache = GenericCache('category-feeds')
+
+
+def invalidate_category_feeds(category_ids):
+    """Mark the feeds of the given categories as outdated.
+
+    The new feed versions are only stored once the current transaction
+    has ended so no other process can cache a feed rendered from the
+    data before the change using the new version.
+
+    :param category_ids: The IDs of the categories whose feeds
+                         changed.  This needs to include all the
+                         parent categories as well.
+    """
+    db.session.info.setdefault('modified_category_feeds', set()).update(category_ids)
+
+
+@listens_for(Session, 'after_transaction_end')
+def _update_category_feed_versions(session, transaction):
+    if transaction.parent is not None:
+        return
+    modified = session.info.pop('modified_category_feeds', None)
+    if modified:
+        version = (uuid4().hex, now_utc().replace(microsecond=0))
+        _feed_cache.set_multi({'version:{}'.format(id_): version for id_ in modified}, CATEGORY_FEED_CACHE_TTL)
+
+
+def get_category_feed_version(category, user, feed_type):
+    """Get the current version of a category feed.
+
+    The version depends on the category and all its parent categories
+    (since their protection affects the events in the feed) and on the
+    user since the feed only contains events the user can access.
+
+    :param category: The category of the feed
+    :param user: The user who is accessing the feed
+    :param feed_type: A string identifying the type of the feed
+    :return: An ``(etag, last_modified)`` tuple or ``None`` if the
+             cache is not available.
+    """
+    keys = ['version:{}'.format(id_) for id_ in category.chain_ids]
+    versions = _feed_cache.get_multi(keys)
+    missing = [key for key, version in versions.viewitems() if version is None]
+    if missing:
+        version = (uuid4().hex, now_utc().replace(microsecond=0))
+        for key in missing:
+            _feed_cache.add(key, version, CATEGORY_FEED_CACHE_TTL)
+        versions = _feed_cache.get_multi(keys)
+        if None in versions.viewvalues():
+            # cache not available (e.g. the null cache)
+            return None
+    tokens = [feed_type, unicode(user.id if user else '')] + [versions[key][0] for key in keys]
+    etag = sha1(':'.join(tokens).encode('utf-8')).hexdigest()
+    return etag, max(last_modified for __, last_modified in versions.viewvalues())
+
+
+def get_cached_category_feed(etag, render_fn):
+    """Get a rendered category feed from the cache.
+
+    :param etag: The etag returned by `get_category_feed_version`
+    :param render_fn: A callable returning the feed data in case it
+                      is not cached yet
+    :return: The feed data as a bytestring
+    """
+    data = _feed_cache.get('feed:{}'.format(etag))
+    if data is None:
+        data = render_fn()
+        _feed_cache.set('feed:{}'.format(etag), data, CATEGORY_FEED_CACHE_TTL)
+    return data
+
+
+def _get_ical_query_options():
+    own_room_strategy = joinedload('own_room')
+    own_room_strategy.load_only('building', 'floor', 'number', 'verbose_name')
+    own_room_strategy.lazyload('owner')
+    own_venue_strategy = joinedload('own_venue').load_only('name')
+    return (load_only('id', 'category_id', 'start_dt', 'end_dt', 'title', 'description', 'own_venue_name',
+                      'own_room_name', 'protection_mode', 'access_key'),
+            subqueryload('acl_entries'),
+            joinedload('person_links'),
+            own_room_strategy,
+            own_venue_strategy)
+
+
+def _preload_parent_categories(events):
+    # make sure the parent categories are in sqlalchemy's identity cache.
+    # this avoids query spam from `protection_parent` lookups
+    return (Category._get_chain_query(Category.id.in_({e.category_id for e in events}))
+            .options(load_only('id', 'parent_id', 'protection_mode'),
+                     joinedload('acl_entries'))
+            .all())
+
+
+def _serialize_event_ical(event, now):
+    location = ('{} ({})'.format(event.room_name, event.venue_name)
+                if event.venue_name and event.room_name
+                else (event.venue_name or event.room_name))
+    cal_event = ical.Event()
+    cal_event.add('uid', u'indico-event-{}@{}'.format(event.id, url_parse(config.BASE_URL).host))
+    cal_event.add('dtstamp', now)
+    cal_event.add('dtstart', event.start_dt)
+    cal_event.add('dtend', event.end_dt)
+    cal_event.add('url', event.external_url)
+    cal_event.add('summary', event.title)
+    cal_event.add('location', location)
+    description = []
+    if event.person_links:
+        speakers = [u'{} ({})'.format(x.full_name, x.affiliation) if x.affiliation else x.full_name
+                    for x in event.person_links]
+        description.append(u'Speakers: {}'.format(u', '.join(speakers)))
+
+    if event.description:
+        desc_text = unicode(event.description) or u'<p/>'  # get rid of RichMarkup
+        try:
+            description.append(unicode(html.fromstring(desc_text).text_content()))
+        except ParserError:
+            # this happens e.g. if desc_text contains only a html comment
+            pass
+    description.append(event.external_url)
+    cal_event.add('description', u'\n'.join(description))
+    return cal_event
+
+
+def _create_calendar():
+    cal = ical.Calendar()
+    cal.add('version', '2.0')
+    cal.add('prodid', '-//CERN//INDICO//EN')
+    return cal
+
+
 def serialize_categories_ical(category_ids, user, event_filter=True, event_filter_fn=None, update_query=None):
     """Export the events in a category to iCal.
 
@@ -37,20 +179,11 @@ def serialize_categories_ical(category_ids, user, event_filter=True, event_filte
     :param update_query: A callable that can update the query used to retrieve the events.
                          Must return the updated query object.
     """
-    own_room_strategy = joinedload('own_room')
-    own_room_strategy.load_only('building', 'floor', 'number', 'verbose_name')
-    own_room_strategy.lazyload('owner')
-    own_venue_strategy = joinedload('own_venue').load_only('name')
     query = (Event.query
              .filter(Event.category_chain_overlaps(category_ids),
                      ~Event.is_deleted,
                      event_filter)
-             .options(load_only('id', 'category_id', 'start_dt', 'end_dt', 'title', 'description', 'own_venue_name',
-                                'own_room_name', 'protection_mode', 'access_key'),
-                      subqueryload('acl_entries'),
-                      joinedload('person_links'),
-                      own_room_strategy,
-                      own_venue_strategy)
+             .options(*_get_ical_query_options())
              .order_by(Event.start_dt))
     if update_query:
         query = update_query(query)
@@ -58,50 +191,46 @@ def serialize_categories_ical(category_ids, user, event_filter=True, event_filte
     if event_filter_fn:
         it = ifilter(event_filter_fn, it)
     events = list(it)
-    # make sure the parent categories are in sqlalchemy's identity cache.
-    # this avoids query spam from `protection_parent` lookups
-    _parent_categs = (Category._get_chain_query(Category.id.in_({e.category_id for e in events}))  # noqa: F841
-                      .options(load_only('id', 'parent_id', 'protection_mode'),
-                               joinedload('acl_entries'))
-                      .all())
-    cal = ical.Calendar()
-    cal.add('version', '2.0')
-    cal.add('prodid', '-//CERN//INDICO//EN')
-
+    _parent_categs = _preload_parent_categories(events)  # noqa: F841
+    cal = _create_calendar()
     now = now_utc(False)
     for event in events:
         if not event.can_access(user):
             continue
-        location = ('{} ({})'.format(event.room_name, event.venue_name)
-                    if event.venue_name and event.room_name
-                    else (event.venue_name or event.room_name))
-        cal_event = ical.Event()
-        cal_event.add('uid', u'indico-event-{}@{}'.format(event.id, url_parse(config.BASE_URL).host))
-        cal_event.add('dtstamp', now)
-        cal_event.add('dtstart', event.start_dt)
-        cal_event.add('dtend', event.end_dt)
-        cal_event.add('url', event.external_url)
-        cal_event.add('summary', event.title)
-        cal_event.add('location', location)
-        description = []
-        if event.person_links:
-            speakers = [u'{} ({})'.format(x.full_name, x.affiliation) if x.affiliation else x.full_name
-                        for x in event.person_links]
-            description.append(u'Speakers: {}'.format(u', '.join(speakers)))
-
-        if event.description:
-            desc_text = unicode(event.description) or u'<p/>'  # get rid of RichMarkup
-            try:
-                description.append(unicode(html.fromstring(desc_text).text_content()))
-            except ParserError:
-                # this happens e.g. if desc_text contains only a html comment
-                pass
-        description.append(event.external_url)
-        cal_event.add('description', u'\n'.join(description))
-        cal.add_component(cal_event)
+        cal.add_component(_serialize_event_ical(event, now))
     return BytesIO(cal.to_ical())
 
 
+def iter_categories_ical(query, user, event_filter_fn=None, chunk_size=100, after=None):
+    """Export events to iCal without building the whole calendar in memory.
+
+    The events are loaded in keyset-paginated chunks ordered by their
+    start date and each ``VEVENT`` is emitted as soon as its chunk has
+    been loaded, so the output can be streamed to the client.
+
+    :param query: The query returning the events to export.  It must
+                  not be ordered or limited.
+    :param user: The user who needs to be able to access the events
+    :param event_filter_fn: A callable that determines which events to include (after querying)
+    :param chunk_size: The number of events to load at once
+    :param after: A ``(start_dt, id)`` tuple of the event after which
+                  the export should start
+    :return: An iterator yielding the iCal data as bytestrings
+    """
+    cal = _create_calendar()
+    header, footer = cal.to_ical().rsplit(b'END:VCALENDAR', 1)
+    yield header
+    now = now_utc(False)
+    query = query.options(*_get_ical_query_options())
+    for events in iter_keyset_chunks(query, [Event.start_dt, Event.id], chunk_size, after=after):
+        _parent_categs = _preload_parent_categories(events)  # noqa: F841
+        for event in events:
+            if (event_filter_fn and not event_filter_fn(event)) or not event.can_access(user):
+                continue
+            yield _serialize_event_ical(event, now).to_ical()
+    yield b'END:VCALENDAR' + footer
+
+
 def serialize_category_atom(category, url, user, event_filter):
     """Export the events in a category to Atom.
 
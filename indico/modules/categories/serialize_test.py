@@ -0,0 +1,80 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import MagicMock
+
+from indico.core.db import db
+from indico.core.db.sqlalchemy.protection import ProtectionMode
+from indico.legacy.common.cache import FileCacheClient, NullCacheClient
+from indico.modules.categories.serialize import (_feed_cache, get_cached_category_feed, get_category_feed_version,
+                                                 invalidate_category_feeds)
+
+
+@pytest.fixture
+def feed_cache(mocker, tmpdir):
+    mocker.patch.object(_feed_cache, '_client', FileCacheClient(tmpdir.strpath))
+
+
+@pytest.mark.usefixtures('app_context', 'feed_cache')
+def test_category_feed_version():
+    category = MagicMock(id=2, chain_ids=[0, 1, 2])
+    user = MagicMock(id=123)
+    etag, last_modified = get_category_feed_version(category, user, 'ics')
+    assert get_category_feed_version(category, user, 'ics') == (etag, last_modified)
+    # feeds depend on the user and the feed type
+    assert get_category_feed_version(category, None, 'ics')[0] != etag
+    assert get_category_feed_version(category, user, 'atom')[0] != etag
+    # unrelated categories do not affect the feed
+    invalidate_category_feeds({3})
+    db.session.rollback()
+    assert get_category_feed_version(category, user, 'ics')[0] == etag
+    # the version only changes once the transaction has ended
+    invalidate_category_feeds({0, 1})
+    assert get_category_feed_version(category, user, 'ics')[0] == etag
+    db.session.rollback()
+    new_etag, new_last_modified = get_category_feed_version(category, user, 'ics')
+    assert new_etag != etag
+    assert new_last_modified >= last_modified
+
+
+@pytest.mark.usefixtures('app_context', 'feed_cache')
+def test_cached_category_feed():
+    render = MagicMock(return_value=b'feed')
+    assert get_cached_category_feed('foo', render) == b'feed'
+    assert get_cached_category_feed('foo', render) == b'feed'
+    assert render.call_count == 1
+    assert get_cached_category_feed('bar', render) == b'feed'
+    assert render.call_count == 2
+
+
+@pytest.mark.usefixtures('app_context')
+def test_category_feed_null_cache(mocker):
+    mocker.patch.object(_feed_cache, '_client', NullCacheClient())
+    assert get_category_feed_version(MagicMock(id=1, chain_ids=[0, 1]), None, 'ics') is None
+    render = MagicMock(return_value=b'feed')
+    assert get_cached_category_feed('foo', render) == b'feed'
+    assert get_cached_category_feed('foo', render) == b'feed'
+    assert render.call_count == 2
+
+
+@pytest.mark.usefixtures('request_context')
+def test_category_feeds_invalidated(db, dummy_event, dummy_user, create_category):
+    category = dummy_event.category
+    other_category = create_category(123, title='Other')
+    db.session.flush()
+    db.session.info.pop('modified_category_feeds', None)
+    dummy_event.update_principal(dummy_user, read_access=True)
+    assert db.session.info.pop('modified_category_feeds') == set(category.chain_ids)
+    dummy_event.protection_mode = ProtectionMode.protected
+    assert db.session.info.pop('modified_category_feeds') == set(category.chain_ids)
+    category.protection_mode = ProtectionMode.protected
+    assert db.session.info.pop('modified_category_feeds') == set(category.chain_ids)
+    dummy_event.move(other_category)
+    assert db.session.info.pop('modified_category_feeds') == set(category.chain_ids) | set(other_category.chain_ids)
@@ -227,3 +227,22 @@ def serialize_category_role(role, legacy=True):
             'name': role.name,
             'identifier': 'CategoryRole:{}'.format(role.id),
         }
+
+
+def get_category_cleanup_queries():
+    """Get the events to delete according to `CATEGORY_CLEANUP`.
+
+    :return: An iterator yielding ``(category, days, query)`` tuples
+             where `query` returns the events in the category which
+             were created more than `days` days ago.
+    """
+    from indico.modules.categories import Category, logger
+    now = now_utc()
+    for categ_id, days in config.CATEGORY_CLEANUP.iteritems():
+        category = Category.get(int(categ_id), is_deleted=False)
+        if category is None:
+            logger.warning('Category %s does not exist!', categ_id)
+            continue
+        query = (Event.query.with_parent(category)
+                 .filter(~Event.is_deleted, Event.created_dt < (now - timedelta(days=days))))
+        yield category, days, query
@@ -7,12 +7,13 @@
 
 from __future__ import unicode_literals
 
+from hashlib import sha1
 from io import BytesIO
 
 from babel.numbers import format_currency
 from PIL import Image
 
-from indico.modules.events.registration.util import generate_ticket_qr_code
+from indico.modules.events.registration.util import generate_ticket_qr_code, get_ticket_qr_data
 from indico.util.date_time import format_date, format_datetime
 from indico.util.i18n import _
 from indico.util.placeholders import Placeholder
@@ -48,6 +49,20 @@ class DesignerPlaceholder(Placeholder):
     #: Whether this placeholder is rendering an image
     is_image = False
 
+    @classmethod
+    def get_fingerprint(cls, obj):
+        """Get a value which changes whenever the rendered output changes.
+
+        It is used to check whether a previously generated PDF is still
+        up to date, so image placeholders should override this method
+        to avoid rendering the image.  The value must be serializable
+        as JSON.
+        """
+        rv = cls.render(obj)
+        if isinstance(rv, Image.Image):
+            return sha1(rv.tobytes()).hexdigest()
+        return rv
+
 
 class RegistrationPlaceholder(DesignerPlaceholder):
     group = 'registrant'
@@ -89,6 +104,10 @@ class EventLogoPlaceholder(DesignerPlaceholder):
         buf = BytesIO(event.logo)
         return Image.open(buf)
 
+    @classmethod
+    def get_fingerprint(cls, event):
+        return event.logo_metadata
+
 
 class EventDatesPlaceholder(DesignerPlaceholder):
     group = 'event'
@@ -324,3 +343,7 @@ class RegistrationTicketQRPlaceholder(DesignerPlaceholder):
     @classmethod
     def render(cls, registration):
         return generate_ticket_qr_code(registration)
+
+    @classmethod
+    def get_fingerprint(cls, registration):
+        return get_ticket_qr_data(registration)
@@ -11,9 +11,11 @@ from datetime import datetime
 from hashlib import md5
 from operator import attrgetter
 
+import dateutil.parser
 import pytz
-from flask import request
-from sqlalchemy import Date, cast
+from flask import current_app, request, stream_with_context
+from itsdangerous import BadData
+from sqlalchemy import Date, cast, tuple_
 from sqlalchemy.orm import joinedload, subqueryload, undefer
 from werkzeug.exceptions import ServiceUnavailable
 
@@ -22,32 +24,38 @@ from indico.core.config import config
 from indico.core.db import db
 from indico.core.db.sqlalchemy.principals import PrincipalType
 from indico.core.db.sqlalchemy.protection import ProtectionMode
+from indico.core.db.sqlalchemy.util.queries import iter_keyset_chunks
 from indico.modules.attachments.api.util import build_folders_api_data, build_material_legacy_api_data
 from indico.modules.categories import Category
 from indico.modules.categories.models.legacy_mapping import LegacyCategoryMapping
-from indico.modules.categories.serialize import serialize_categories_ical
+from indico.modules.categories.serialize import iter_categories_ical, serialize_categories_ical
 from indico.modules.events import Event
 from indico.modules.events.contributions import contribution_settings
+from indico.modules.events.models.effective_acl import can_access_effective, can_access_filter, has_access_overrides
 from indico.modules.events.models.persons import PersonLinkBase
 from indico.modules.events.notes.util import build_note_api_data, build_note_legacy_api_data
 from indico.modules.events.sessions.models.sessions import Session
 from indico.modules.events.timetable.legacy import TimetableSerializer
 from indico.modules.events.timetable.models.entries import TimetableEntry
+from indico.util import json
 from indico.util.date_time import iterdays
 from indico.util.fossilize import fossilize
 from indico.util.fossilize.conversion import Conversion
 from indico.util.signals import values_from_signal
+from indico.util.signing import secure_serializer
 from indico.util.string import to_unicode
 from indico.web.flask.util import send_file, url_for
-from indico.web.http_api.fossils import IPeriodFossil
+from indico.web.http_api.fossils import IHTTPAPIExportResultFossil, IPeriodFossil
 from indico.web.http_api.hooks.base import HTTPAPIHook, IteratedDataFetcher
-from indico.web.http_api.responses import HTTPAPIError
+from indico.web.http_api.responses import HTTPAPIError, HTTPAPIResult
 from indico.web.http_api.util import get_query_parameter
 
 
 utc = pytz.timezone('UTC')
 MAX_DATETIME = utc.localize(datetime(2099, 12, 31, 23, 59, 0))
 MIN_DATETIME = utc.localize(datetime(2000, 1, 1))
+#: The number of events loaded at once when streaming an export
+STREAM_CHUNK_SIZE = 100
 
 
 class Period(object):
@@ -127,6 +135,8 @@ class CategoryEventHook(HTTPAPIHook):
         self._occurrences = get_query_parameter(self._queryParams, ['occ', 'occurrences'], 'no') == 'yes'
         self._location = get_query_parameter(self._queryParams, ['l', 'location'])
         self._room = get_query_parameter(self._queryParams, ['r', 'room'])
+        self._stream = get_query_parameter(self._queryParams, ['stream'], 'no') == 'yes'
+        self._cursor = get_query_parameter(self._queryParams, ['cursor'])
 
     def export_categ(self, user):
         expInt = CategoryEventFetcher(user, self)
@@ -136,6 +146,8 @@ class CategoryEventHook(HTTPAPIHook):
         legacy_id_map = {m.legacy_category_id: m.category_id
                          for m in LegacyCategoryMapping.find(LegacyCategoryMapping.legacy_category_id.in_(id_list))}
         id_list = {str(legacy_id_map.get(id_, id_)) for id_ in id_list}
+        if self._stream:
+            return expInt.category_stream(id_list, self._format)
         return expInt.category(id_list, self._format)
 
     def export_categ_extra(self, user, resultList):
@@ -422,6 +434,8 @@ class CategoryEventFetcher(IteratedDataFetcher, SerializerBase):
         self._detail_level = get_query_parameter(request.args.to_dict(), ['d', 'detail'], 'events')
         if self._detail_level not in ('events', 'contributions', 'subcontributions', 'sessions'):
             raise HTTPAPIError('Invalid detail level: {}'.format(self._detail_level), 400)
+        # plugins may grant access to events regardless of their ACL
+        self._use_effective_acl = not has_access_overrides(Event)
 
     def _calculate_occurrences(self, event, from_dt, to_dt, tz):
         start_dt = max(from_dt, event.start_dt) if from_dt else event.start_dt
@@ -449,8 +463,24 @@ class CategoryEventFetcher(IteratedDataFetcher, SerializerBase):
         if detail_level == 'sessions':
             options.append(sessions_strategy)
         options.append(undefer('effective_protection_mode'))
+        options.append(undefer('effective_acl'))
         return options
 
+    def _get_access_filter(self):
+        """Get a filter criterion excluding events the user cannot access.
+
+        Events with an access key are always included since the user
+        may have entered it.
+        """
+        if not self._use_effective_acl:
+            return db.true()
+        return can_access_filter(Event, self.user) | (Event.access_key != '')
+
+    def _can_access(self, event):
+        if self._use_effective_acl and can_access_effective(event, self.user):
+            return True
+        return event.can_access(self.user)
+
     def category(self, idlist, format):
         try:
             idlist = map(int, idlist)
@@ -458,7 +488,8 @@ class CategoryEventFetcher(IteratedDataFetcher, SerializerBase):
             raise HTTPAPIError('Category IDs must be numeric', 400)
         if format == 'ics':
             buf = serialize_categories_ical(idlist, self.user,
-                                            event_filter=Event.happens_between(self._fromDT, self._toDT),
+                                            event_filter=db.and_(Event.happens_between(self._fromDT, self._toDT),
+                                                                 self._get_access_filter()),
                                             event_filter_fn=self._filter_event,
                                             update_query=self._update_query)
             return send_file('events.ics', buf, 'text/calendar')
@@ -466,10 +497,101 @@ class CategoryEventFetcher(IteratedDataFetcher, SerializerBase):
             query = (Event.query
                      .filter(~Event.is_deleted,
                              Event.category_chain_overlaps(idlist),
-                             Event.happens_between(self._fromDT, self._toDT))
+                             Event.happens_between(self._fromDT, self._toDT),
+                             self._get_access_filter())
                      .options(*self._get_query_options(self._detail_level)))
         query = self._update_query(query)
-        return self.serialize_events(x for x in query if self._filter_event(x) and x.can_access(self.user))
+        return self.serialize_events(x for x in query if self._filter_event(x) and self._can_access(x))
+
+    def category_stream(self, idlist, format):
+        """Stream the events in some categories without loading all of them at once.
+
+        The events are sorted by their start date and loaded in small
+        chunks, which are serialized and sent to the client right away.
+        If a limit has been specified, an opaque continuation token to
+        retrieve the next page is sent in the ``X-Indico-Next-Cursor``
+        header (and in the ``nextCursor`` field of JSON exports); it can
+        be passed back using the ``cursor`` argument.
+
+        Since the end of a page needs to be known before sending the
+        headers, the limit applies to the events matching the query,
+        before checking whether the user can access them.  A page may
+        thus contain fewer events than the limit (or none at all) even
+        though there are more pages.
+        """
+        try:
+            idlist = map(int, idlist)
+        except ValueError:
+            raise HTTPAPIError('Category IDs must be numeric', 400)
+        if format not in ('json', 'ics'):
+            raise HTTPAPIError('Streaming is only available for JSON and iCalendar exports', 400)
+        after = self._load_cursor(self._hook._cursor) if self._hook._cursor else None
+        query = Event.query.filter(~Event.is_deleted,
+                                   Event.category_chain_overlaps(idlist),
+                                   Event.happens_between(self._fromDT, self._toDT),
+                                   self._get_access_filter())
+        page_end = self._get_page_end(query, after)
+        next_cursor = None
+        if page_end is not None:
+            query = query.filter(tuple_(Event.start_dt, Event.id) <= tuple_(*page_end))
+            next_cursor = self._dump_cursor(page_end)
+        if format == 'ics':
+            chunks = iter_categories_ical(query, self.user, event_filter_fn=self._filter_event,
+                                          chunk_size=STREAM_CHUNK_SIZE, after=after)
+            mimetype = 'text/calendar'
+        else:
+            chunks = self._iter_json_stream(query, after, next_cursor)
+            mimetype = 'application/json'
+        response = current_app.response_class(stream_with_context(chunks), mimetype=mimetype)
+        if next_cursor:
+            response.headers['X-Indico-Next-Cursor'] = next_cursor
+        return response
+
+    def _dump_cursor(self, position):
+        start_dt, event_id = position
+        return secure_serializer.dumps([start_dt.isoformat(), event_id], salt='http-api-export-cursor')
+
+    def _load_cursor(self, cursor):
+        try:
+            start_dt, event_id = secure_serializer.loads(cursor, salt='http-api-export-cursor')
+        except (BadData, ValueError):
+            raise HTTPAPIError('Invalid cursor', 400)
+        return dateutil.parser.parse(start_dt), event_id
+
+    def _get_page_end(self, query, after):
+        """Get the position of the last event of a limited page.
+
+        :return: A ``(start_dt, id)`` tuple or `None` if there is no
+                 limit or if there are no events after the current page.
+        """
+        limit = self._hook._userLimit
+        if not limit:
+            return None
+        query = query.with_entities(Event.start_dt, Event.id).order_by(Event.start_dt, Event.id)
+        if after is not None:
+            query = query.filter(tuple_(Event.start_dt, Event.id) > tuple_(*after))
+        rows = query.offset(limit - 1).limit(2).all()
+        return tuple(rows[0]) if len(rows) == 2 else None
+
+    def _iter_json_stream(self, query, after, next_cursor):
+        query = query.options(*self._get_query_options(self._detail_level))
+        category_ids = set()
+        count = 0
+        # use the same envelope as a regular (non-streamed) export; only
+        # the results and the data depending on them are sent later
+        envelope = fossilize(HTTPAPIResult([], request.path, request.query_string), IHTTPAPIExportResultFossil)
+        del envelope['_fossil']
+        head = {k: v for k, v in envelope.iteritems() if k not in {'results', 'count', 'additionalInfo'}}
+        yield json.dumps(head)[:-1] + ',"results":['
+        for events in iter_keyset_chunks(query, [Event.start_dt, Event.id], STREAM_CHUNK_SIZE, after=after):
+            for event in events:
+                if not self._filter_event(event) or not self._can_access(event):
+                    continue
+                yield (',' if count else '') + json.dumps(self._build_event_api_data(event))
+                category_ids.add(event.category_id)
+                count += 1
+        extra = self.category_extra(category_ids)
+        yield '],"count":%d,"additionalInfo":%s,"nextCursor":%s}' % (count, json.dumps(extra), json.dumps(next_cursor))
 
     def category_extra(self, ids):
         if self._toDT is None:
@@ -485,10 +607,11 @@ class CategoryEventFetcher(IteratedDataFetcher, SerializerBase):
     def event(self, idlist):
         query = (Event.find(Event.id.in_(idlist),
                             ~Event.is_deleted,
-                            Event.happens_between(self._fromDT, self._toDT))
+                            Event.happens_between(self._fromDT, self._toDT),
+                            self._get_access_filter())
                  .options(*self._get_query_options(self._detail_level)))
         query = self._update_query(query)
-        return self.serialize_events(x for x in query if self._filter_event(x) and x.can_access(self.user))
+        return self.serialize_events(x for x in query if self._filter_event(x) and self._can_access(x))
 
     def _filter_event(self, event):
         if self._room or self._location or self._eventType:
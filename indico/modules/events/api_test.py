@@ -0,0 +1,31 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from mock import MagicMock
+
+from indico.util import json
+from indico.util.fossilize import clearCache, fossilize
+from indico.web.http_api.fossils import IHTTPAPIExportResultFossil
+from indico.web.http_api.responses import HTTPAPIResult
+
+
+def test_stream_json_envelope(mocker, app):
+    # imported here since the http api package imports this module
+    from indico.modules.events.api import CategoryEventFetcher
+    mocker.patch('indico.modules.events.api.iter_keyset_chunks', return_value=[])
+    mocker.patch.object(CategoryEventFetcher, 'category_extra', return_value={'moreFutureEvents': False})
+    with app.test_request_context('/export/categ/1.json?stream=yes&limit=5'):
+        clearCache()
+        fetcher = CategoryEventFetcher(None, MagicMock(_detail='events'))
+        data = json.loads(''.join(fetcher._iter_json_stream(MagicMock(), None, 'cursor')))
+        expected = fossilize(HTTPAPIResult([], '/export/categ/1.json', 'stream=yes&limit=5', ts=data['ts'],
+                                           extra={'moreFutureEvents': False}),
+                             IHTTPAPIExportResultFossil)
+    del expected['_fossil']
+    assert data == dict(expected, nextCursor='cursor')
@@ -8,6 +8,7 @@
 from __future__ import unicode_literals
 
 from flask import jsonify, request
+from werkzeug.exceptions import BadRequest
 
 from indico.core.db import db
 from indico.core.db.sqlalchemy.util.queries import preprocess_ts_string
@@ -20,9 +21,9 @@ from indico.modules.events.management.controllers import RHManageEventBase
 LOG_PAGE_SIZE = 15
 
 
-def _contains(field, text):
-    return (db.func.to_tsvector('simple', db.func.indico.indico_unaccent(field))
-            .match(db.func.indico.indico_unaccent(preprocess_ts_string(text)), postgresql_regconfig='simple'))
+def _matches(text):
+    return EventLogEntry.search_vector.match(db.func.indico.indico_unaccent(preprocess_ts_string(text)),
+                                             postgresql_regconfig='simple')
 
 
 def _get_metadata_query():
@@ -41,36 +42,61 @@ class RHEventLogs(RHManageEventBase):
 
 
 class RHEventLogsJSON(RHManageEventBase):
+    """Get the log entries of the event.
+
+    By default the entries are paginated by page number.  If the
+    `cursor` argument is present (it may be empty to get the first
+    entries), the entries older than the one the cursor points to are
+    returned instead, together with the cursor to get the next ones.
+    This is much faster when going through large logs since no page
+    offsets and totals need to be calculated.  The cursor also contains
+    the number of entries returned so far, so the ``index`` of the
+    entries keeps increasing across batches.
+    """
+
     def _process(self):
         page = int(request.args.get('page', 1))
+        cursor = request.args.get('cursor')
         filters = request.args.getlist('filters')
         metadata_query = _get_metadata_query()
         text = request.args.get('q')
 
         if not filters and not metadata_query:
+            if cursor is not None:
+                return jsonify(entries=[], next_cursor=None)
             return jsonify(current_page=1, pages=[], entries=[], total_page_count=0)
 
-        query = self.event.log_entries.order_by(EventLogEntry.logged_dt.desc())
+        query = self.event.log_entries.order_by(EventLogEntry.logged_dt.desc(), EventLogEntry.id.desc())
         realms = {EventLogRealm.get(f) for f in filters if EventLogRealm.get(f)}
         if realms:
             query = query.filter(EventLogEntry.realm.in_(realms))
 
         if text:
-            query = query.filter(
-                db.or_(_contains(EventLogEntry.module, text),
-                       _contains(EventLogEntry.type, text),
-                       _contains(EventLogEntry.summary, text),
-                       _contains(db.m.User.first_name + " " + db.m.User.last_name, text),
-                       _contains(EventLogEntry.data['body'].astext, text),
-                       _contains(EventLogEntry.data['subject'].astext, text),
-                       _contains(EventLogEntry.data['from'].astext, text),
-                       _contains(EventLogEntry.data['to'].astext, text),
-                       _contains(EventLogEntry.data['cc'].astext, text))
-            ).outerjoin(db.m.User)
+            query = query.filter(_matches(text))
 
         if metadata_query:
             query = query.filter(EventLogEntry.meta.contains(metadata_query))
 
+        if cursor is not None:
+            start = 0
+            if cursor:
+                ref_id, __, start = cursor.partition(':')
+                ref = None
+                if ref_id.isdigit() and start.isdigit():
+                    ref = self.event.log_entries.filter_by(id=int(ref_id)).first()
+                if ref is None:
+                    raise BadRequest('Invalid cursor')
+                start = int(start)
+                query = query.filter(db.tuple_(EventLogEntry.logged_dt, EventLogEntry.id) <
+                                     db.tuple_(ref.logged_dt, ref.id))
+            items = query.limit(LOG_PAGE_SIZE + 1).all()
+            has_more = len(items) > LOG_PAGE_SIZE
+            items = items[:LOG_PAGE_SIZE]
+            entries = [dict(serialize_log_entry(entry), index=index, html=entry.render())
+                       for index, entry in enumerate(items, start)]
+            next_cursor = '{}:{}'.format(items[-1].id, start + len(items)) if has_more else None
+            return jsonify(entries=entries, next_cursor=next_cursor)
+
         query = query.paginate(page, LOG_PAGE_SIZE)
         entries = [dict(serialize_log_entry(entry), index=index, html=entry.render())
                    for index, entry in enumerate(query.items)]
@@ -0,0 +1,88 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+import pytest
+from flask import request
+from pytz import utc
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import BadRequest
+
+from indico.modules.events.logs.controllers import LOG_PAGE_SIZE, RHEventLogsJSON
+from indico.modules.events.logs.models.entries import EventLogKind, EventLogRealm
+from indico.util import json
+
+
+def _get_log_entries(event, **kwargs):
+    request.args = MultiDict(dict(kwargs, filters='event'))
+    rh = RHEventLogsJSON()
+    rh.event = event
+    return json.loads(rh._process().get_data())
+
+
+def _log(event, summary, logged_dt=None, **kwargs):
+    entry = event.log(EventLogRealm.event, EventLogKind.other, 'Test', summary, **kwargs)
+    if logged_dt is not None:
+        entry.logged_dt = logged_dt
+    return entry
+
+
+@pytest.mark.usefixtures('request_context')
+def test_log_cursor_pagination(db, dummy_event):
+    dt = datetime(2020, 11, 1, 12, 0, tzinfo=utc)
+    older = [_log(dummy_event, 'Older {}'.format(i), datetime(2020, 10, 1, 12, i, tzinfo=utc)) for i in range(3)]
+    # entries logged at the same time must not be skipped or returned twice
+    same_dt = [_log(dummy_event, 'Same {}'.format(i), dt) for i in range(2 * LOG_PAGE_SIZE)]
+    db.session.flush()
+    expected = sorted(same_dt, key=lambda e: e.id, reverse=True) + older[::-1]
+
+    entries = []
+    cursor = ''
+    while cursor is not None:
+        data = _get_log_entries(dummy_event, cursor=cursor)
+        assert len(data['entries']) <= LOG_PAGE_SIZE
+        entries += data['entries']
+        cursor = data['next_cursor']
+    assert [e['id'] for e in entries] == [e.id for e in expected]
+    # the index continues across batches
+    assert [e['index'] for e in entries] == range(len(expected))
+
+
+@pytest.mark.usefixtures('request_context')
+@pytest.mark.parametrize('cursor', ('foo', '{id}', '{id}:', ':0', '{id}:foo', '{other_id}:0', '0:0'))
+def test_log_cursor_invalid(db, dummy_event, create_event, cursor):
+    entry = _log(dummy_event, 'Test')
+    other_entry = _log(create_event(), 'Other event')
+    db.session.flush()
+    with pytest.raises(BadRequest):
+        _get_log_entries(dummy_event, cursor=cursor.format(id=entry.id, other_id=other_entry.id))
+
+
+@pytest.mark.usefixtures('request_context')
+def test_log_search(db, dummy_event, dummy_user):
+    title_entry = _log(dummy_event, 'Title changed')
+    user_entry = _log(dummy_event, 'Something else', user=dummy_user)
+    email_entry = _log(dummy_event, 'Email sent', data={'subject': 'Invitation', 'body': 'Please join us'})
+    db.session.flush()
+
+    def _search(text):
+        return {e['id'] for e in _get_log_entries(dummy_event, q=text, cursor='')['entries']}
+
+    assert _search('title') == {title_entry.id}
+    # the search vector includes the user name and the email fields
+    assert _search('guinea pig') == {user_entry.id}
+    assert _search('invitation') == {email_entry.id}
+    assert _search('join') == {email_entry.id}
+    assert _search('nothing') == set()
+    # and it is updated by the trigger when an entry changes
+    email_entry.summary = 'Reminder sent'
+    db.session.flush()
+    assert _search('reminder') == {email_entry.id}
+    assert _search('email') == set()
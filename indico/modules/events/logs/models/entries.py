@@ -7,7 +7,10 @@
 
 from __future__ import unicode_literals
 
-from sqlalchemy.dialects.postgresql import JSON, JSONB
+from sqlalchemy import DDL
+from sqlalchemy.dialects.postgresql import JSON, JSONB, TSVECTOR
+from sqlalchemy.event import listens_for
+from sqlalchemy.schema import FetchedValue
 
 from indico.core.db import db
 from indico.core.db.sqlalchemy import PyIntEnum, UTCDateTime
@@ -37,6 +40,8 @@ class EventLogEntry(db.Model):
     """Log entries for events."""
     __tablename__ = 'logs'
     __table_args__ = (db.Index(None, 'meta', postgresql_using='gin'),
+                      db.Index(None, 'search_vector', postgresql_using='gin'),
+                      db.Index(None, 'event_id', 'logged_dt', 'id'),
                       {'schema': 'events'})
 
     #: The ID of the log entry
@@ -102,6 +107,15 @@ class EventLogEntry(db.Model):
         JSONB,
         nullable=False
     )
+    #: The text search vector of the entry (set by a trigger).
+    #: It contains the module, type, summary, the name of the user
+    #: and the sender, recipients, subject and body of emails.
+    search_vector = db.deferred(db.Column(
+        TSVECTOR,
+        nullable=False,
+        server_default=FetchedValue(),
+        server_onupdate=FetchedValue()
+    ))
 
     #: The user associated with the log entry
     user = db.relationship(
@@ -145,3 +159,15 @@ class EventLogEntry(db.Model):
         realm = self.realm.name if self.realm is not None else None
         return '<EventLogEntry({}, {}, {}, {}, {}): {}>'.format(self.id, self.event_id, self.logged_dt, realm,
                                                                 self.module, self.summary)
+
+
+@listens_for(EventLogEntry.__table__, 'after_create')
+def _add_search_vector_trigger(target, conn, **kw):
+    sql = """
+        CREATE TRIGGER update_search_vector
+        BEFORE INSERT OR UPDATE OF module, type, summary, user_id, data
+        ON {table}
+        FOR EACH ROW
+        EXECUTE PROCEDURE events.update_log_search_vector();
+    """.format(table=target.fullname)
+    DDL(sql).execute(conn)
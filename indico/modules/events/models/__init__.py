@@ -130,3 +130,22 @@ def _create_check_timetable_consistency(sender, connection, **kwargs):
         LANGUAGE plpgsql
     """)
     DDL(sql).execute(connection)
+
+
+@signals.db_schema_created.connect_via('events')
+def _create_update_log_search_vector(sender, connection, **kwargs):
+    sql = textwrap.dedent("""
+        CREATE FUNCTION events.update_log_search_vector() RETURNS trigger AS
+        $BODY$
+        BEGIN
+            NEW.search_vector := to_tsvector('simple', indico.indico_unaccent(concat_ws(' ',
+                NEW.module, NEW.type, NEW.summary,
+                (SELECT u.first_name || ' ' || u.last_name FROM users.users u WHERE u.id = NEW.user_id),
+                NEW.data->>'body', NEW.data->>'subject', NEW.data->>'from', NEW.data->>'to', NEW.data->>'cc'
+            )));
+            RETURN NEW;
+        END;
+        $BODY$
+        LANGUAGE plpgsql
+    """)
+    DDL(sql).execute(connection)
@@ -0,0 +1,340 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+"""Persisted effective access lists of categories and events.
+
+Each category and event stores the keys of all principals that can
+access it in its ``effective_acl`` column, taking into account the
+protection mode and ACL of the object itself, of all its parents and
+the management privileges inherited from the parent categories.  A
+public object contains only :data:`PUBLIC_KEY`.  This allows checking
+access to many objects at once or filtering them in SQL, using the
+keys from :func:`get_principal_keys`.
+
+The data is updated automatically whenever protection modes, ACLs or
+the position of an object in the category tree change, including bulk
+updates and deletes using the ORM.  Changes made using raw SQL can be
+detected using :func:`find_outdated_effective_acls` (or the
+``indico maint fix-effective-acls`` command).  Admin access,
+access keys and plugins overriding access checks using the
+``can_access`` signal are not taken into account.
+"""
+
+from __future__ import unicode_literals
+
+from itertools import chain
+
+from flask import has_request_context, request, session
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.event import listens_for
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from indico.core import signals
+from indico.core.db import db
+from indico.core.db.sqlalchemy.principals import PrincipalType
+from indico.core.db.sqlalchemy.protection import ProtectionMode
+from indico.core.db.sqlalchemy.util.models import attrs_changed
+from indico.modules.categories.models.categories import Category
+from indico.modules.categories.models.principals import CategoryPrincipal
+from indico.modules.events.models.events import Event
+from indico.modules.events.models.principals import EventPrincipal
+from indico.util.caching import memoize_request
+
+
+#: The key contained in the effective ACL of any public object
+PUBLIC_KEY = '*'
+
+
+def _get_principal_key(principal_class):
+    """Get an SQL expression with the principal key of an ACL entry.
+
+    The keys are the same as the ``identifier`` of the principals.
+    """
+    cls = principal_class
+    keys = {
+        PrincipalType.user: 'User:' + db.cast(cls.user_id, db.String),
+        PrincipalType.local_group: 'Group::' + db.cast(cls.local_group_id, db.String),
+        PrincipalType.multipass_group: 'Group:' + cls.multipass_group_provider + ':' + cls.multipass_group_name,
+    }
+    if cls.allow_emails:
+        keys[PrincipalType.email] = 'Email:' + cls.email
+    if cls.allow_networks:
+        keys[PrincipalType.network] = 'IPNetworkGroup:' + db.cast(cls.ip_network_group_id, db.String)
+    if cls.allow_event_roles:
+        keys[PrincipalType.event_role] = 'EventRole:' + db.cast(cls.event_role_id, db.String)
+    if cls.allow_category_roles:
+        keys[PrincipalType.category_role] = 'CategoryRole:' + db.cast(cls.category_role_id, db.String)
+    if cls.allow_registration_forms:
+        keys[PrincipalType.registration_form] = ('RegistrationForm:' +
+                                                 db.cast(cls.registration_form_id, db.String))
+    return db.case(keys, value=cls.type)
+
+
+def _get_keys(principal_class, criterion):
+    keys = db.select([db.func.array_agg(db.distinct(_get_principal_key(principal_class)))]).where(criterion)
+    return db.func.coalesce(keys.as_scalar(), db.cast([], ARRAY(db.String)))
+
+
+def _get_category_acl_value():
+    """Get an SQL expression with the effective ACL of a category."""
+    public = db.cast([PUBLIC_KEY], ARRAY(db.String))
+    # the closest category in the chain which is not inheriting (the
+    # root category is never inheriting so there is always one)
+    protection_parent = db.aliased(Category)
+    position = db.func.array_position(Category.chain_ids, protection_parent.id)
+    is_protection_parent = (Category.chain_ids.any(protection_parent.id) &
+                            (protection_parent.protection_mode != ProtectionMode.inheriting))
+    protection_mode = (db.select([protection_parent.protection_mode])
+                       .where(is_protection_parent)
+                       .order_by(position.desc())
+                       .limit(1)
+                       .as_scalar())
+    protection_position = (db.select([db.func.max(position)])
+                           .where(is_protection_parent)
+                           .correlate(Category)
+                           .as_scalar())
+    # anyone in the ACL of the protection parent or of a category
+    # inheriting from it, and the managers of all parent categories
+    entry_position = db.func.array_position(Category.chain_ids, CategoryPrincipal.category_id)
+    keys = _get_keys(CategoryPrincipal, Category.chain_ids.any(CategoryPrincipal.category_id) &
+                     (CategoryPrincipal.full_access | (entry_position >= protection_position)))
+    return db.case([(protection_mode == ProtectionMode.public, public)], else_=keys)
+
+
+def _get_event_acl_value():
+    """Get an SQL expression with the effective ACL of an event.
+
+    The expression relies on the effective ACL of the event's category,
+    so it needs to be used with ``Event.category_id == Category.id``.
+    """
+    public = db.cast([PUBLIC_KEY], ARRAY(db.String))
+    own_keys = _get_keys(EventPrincipal, EventPrincipal.event_id == Event.id)
+    manager_keys = _get_keys(CategoryPrincipal,
+                             Category.chain_ids.any(CategoryPrincipal.category_id) & CategoryPrincipal.full_access)
+    is_inheriting = Event.protection_mode == ProtectionMode.inheriting
+    return db.case([(Event.protection_mode == ProtectionMode.public, public),
+                    (is_inheriting & Category.effective_acl.contains(public), public),
+                    (is_inheriting, db.func.array_cat(own_keys, Category.effective_acl))],
+                   else_=db.func.array_cat(own_keys, manager_keys))
+
+
+def _get_root_category_ids(connection):
+    return {id_ for id_, in connection.execute(db.select([Category.id]).where(Category.parent_id.is_(None)))}
+
+
+def refresh_effective_acls(connection, category_ids=(), event_ids=()):
+    """Recalculate the effective ACLs of categories and events.
+
+    :param connection: The connection used to execute the queries
+    :param category_ids: The ids of categories whose effective ACL
+                         needs to be updated; this also updates all
+                         their subcategories and the events in them
+    :param event_ids: The ids of events whose effective ACL needs
+                      to be updated
+    """
+    category_ids = sorted(category_ids)
+    event_ids = sorted(event_ids)
+    if not category_ids and not event_ids:
+        return
+    in_categories = Category.chain_ids.overlap(db.cast(category_ids, ARRAY(db.Integer)))
+    if category_ids:
+        connection.execute(Category.__table__.update()
+                           .where(in_categories)
+                           .values(effective_acl=_get_category_acl_value()))
+    criteria = []
+    if category_ids:
+        criteria.append(in_categories)
+    if event_ids:
+        criteria.append(Event.id.in_(event_ids))
+    connection.execute(Event.__table__.update()
+                       .where((Event.category_id == Category.id) & db.or_(*criteria))
+                       .values(effective_acl=_get_event_acl_value()))
+
+
+def refresh_all_effective_acls(connection):
+    """Recalculate the effective ACLs of all categories and events."""
+    refresh_effective_acls(connection, _get_root_category_ids(connection))
+
+
+def find_outdated_effective_acls(connection):
+    """Find categories and events whose effective ACL is outdated.
+
+    This happens if protection data has been changed without going
+    through the ORM, e.g. using raw SQL.  Events are compared against
+    the effective ACL currently stored for their category.
+
+    :return: A ``(category_ids, event_ids)`` tuple of sets.
+    """
+    def _differs(column, value):
+        return ~column.contains(value) | ~column.contained_by(value)
+
+    category_ids = connection.execute(db.select([Category.id])
+                                      .where(_differs(Category.effective_acl, _get_category_acl_value())))
+    event_ids = connection.execute(db.select([Event.id])
+                                   .where((Event.category_id == Category.id) &
+                                          _differs(Event.effective_acl, _get_event_acl_value())))
+    return {id_ for id_, in category_ids}, {id_ for id_, in event_ids}
+
+
+@memoize_request
+def get_principal_keys(user):
+    """Get the keys of all principals matching a user.
+
+    The keys can be used to check whether the user can access an
+    object based on its effective ACL; they always include the
+    :data:`PUBLIC_KEY`.
+
+    :param user: A :class:`.User` or `None` for an unauthenticated
+                 user.
+    """
+    from indico.modules.events.registration.models.forms import RegistrationForm
+    from indico.modules.events.registration.models.registrations import Registration, RegistrationState
+    from indico.modules.groups import GroupProxy
+    from indico.modules.groups.membership import get_user_groups
+    from indico.modules.networks.models.networks import IPNetworkGroup
+
+    keys = {PUBLIC_KEY}
+    if has_request_context() and request.remote_addr and session.user == user:
+        keys |= {group.identifier
+                 for group in IPNetworkGroup.query
+                 if group.contains_ip(unicode(request.remote_addr))}
+    if user is None:
+        return frozenset(keys)
+    keys.add(user.identifier)
+    keys |= {'Email:{}'.format(email) for email in user.all_emails}
+    keys |= {GroupProxy(group.id, _group=group).identifier for group in user.local_groups}
+    keys |= {role.identifier for role in user.event_roles}
+    keys |= {role.identifier for role in user.category_roles}
+    regform_ids = (db.session.query(Registration.registration_form_id)
+                   .join(Registration.registration_form)
+                   .filter(Registration.user == user,
+                           Registration.state.in_([RegistrationState.unpaid, RegistrationState.complete]),
+                           ~Registration.is_deleted,
+                           ~RegistrationForm.is_deleted))
+    keys |= {'RegistrationForm:{}'.format(regform_id) for regform_id, in regform_ids}
+    # for most providers we know all groups of the user; any other
+    # multipass groups can only be checked one by one, so we check those
+    # which are actually used in any category or event ACL
+    user_groups = get_user_groups(user)
+    for principal_class in (CategoryPrincipal, EventPrincipal):
+        provider_column = principal_class.multipass_group_provider
+        name_column = principal_class.multipass_group_name
+        criteria = [(provider_column == provider) & db.func.lower(name_column).in_(list(names))
+                    for provider, names in user_groups.viewitems()
+                    if names]
+        criteria.append(provider_column.notin_(list(user_groups)) if user_groups else db.true())
+        multipass_groups = (db.session.query(provider_column, name_column)
+                            .filter(principal_class.type == PrincipalType.multipass_group, db.or_(*criteria))
+                            .distinct())
+        for provider, name in multipass_groups:
+            group = GroupProxy(name, provider)
+            if provider in user_groups or user in group:
+                keys.add(group.identifier)
+    return frozenset(keys)
+
+
+def has_access_overrides(cls):
+    """Check whether plugins may override access checks for a model."""
+    return any(True for __ in signals.acl.can_access.receivers_for(cls))
+
+
+def can_access_filter(cls, user):
+    """Get a filter criterion for objects a user can access.
+
+    Unlike :meth:`~.ProtectionMixin.can_access` this only takes the
+    effective ACL into account.  Admins can access any object.
+
+    :param cls: The model (:class:`.Category` or :class:`.Event`)
+    :param user: A :class:`.User` or `None`
+    """
+    if user and user.is_admin:
+        return db.true()
+    return cls.effective_acl.overlap(db.cast(sorted(get_principal_keys(user)), ARRAY(db.String)))
+
+
+def can_access_effective(obj, user):
+    """Check whether a user can access an object based on its effective ACL.
+
+    Unlike :meth:`~.ProtectionMixin.can_access` this only takes the
+    effective ACL into account.  Admins can access any object.
+
+    :param obj: A :class:`.Category` or :class:`.Event`
+    :param user: A :class:`.User` or `None`
+    """
+    if user and user.is_admin:
+        return True
+    return not get_principal_keys(user).isdisjoint(obj.effective_acl)
+
+
+def _expire_effective_acls(session):
+    for obj in session.identity_map.values():
+        if isinstance(obj, (Category, Event)) and 'effective_acl' in obj.__dict__:
+            session.expire(obj, ['effective_acl'])
+
+
+def _get_history_values(obj, attr):
+    return {x for x in chain.from_iterable(get_history(obj, attr)) if x is not None}
+
+
+@listens_for(Session, 'after_flush')
+def _update_effective_acls(session, flush_context):
+    category_ids = set()
+    event_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Category):
+            if obj in session.new or (obj in session.dirty and attrs_changed(obj, 'protection_mode', 'parent_id')):
+                category_ids.add(obj.id)
+        elif isinstance(obj, Event):
+            if obj in session.new or (obj in session.dirty and attrs_changed(obj, 'protection_mode', 'category_id')):
+                event_ids.add(obj.id)
+        elif isinstance(obj, CategoryPrincipal):
+            category_ids |= _get_history_values(obj, 'category_id')
+        elif isinstance(obj, EventPrincipal):
+            event_ids |= _get_history_values(obj, 'event_id')
+    if not category_ids and not event_ids:
+        return
+    connection = session.connection()
+    refresh_effective_acls(connection, category_ids, event_ids)
+    _expire_effective_acls(session)
+
+
+def _refresh_bulk_effective_acls(context):
+    """Refresh the effective ACLs after updating or deleting in bulk."""
+    cls = context.mapper.class_
+    id_attrs = {Category: 'id', Event: 'id', CategoryPrincipal: 'category_id', EventPrincipal: 'event_id'}
+    if cls not in id_attrs:
+        return
+    changed = {getattr(key, 'key', key) for key in getattr(context, 'values', {})}
+    if cls in (Category, Event) and not changed & {'protection_mode', 'parent_id', 'category_id'}:
+        return
+    # if we cannot tell which objects were affected, everything is refreshed
+    attr = id_attrs[cls]
+    ids = None
+    if attr not in changed:
+        if hasattr(context, 'matched_objects'):
+            ids = {getattr(obj, attr) for obj in context.matched_objects}
+        elif hasattr(context, 'matched_rows') and attr == 'id':
+            ids = {row[0] for row in context.matched_rows}
+    connection = context.session.connection()
+    if ids is None:
+        refresh_all_effective_acls(connection)
+    elif cls in (Category, CategoryPrincipal):
+        refresh_effective_acls(connection, category_ids=ids)
+    else:
+        refresh_effective_acls(connection, event_ids=ids)
+    _expire_effective_acls(context.session)
+
+
+@listens_for(Session, 'after_bulk_update')
+def _update_effective_acls_bulk_update(update_context):
+    _refresh_bulk_effective_acls(update_context)
+
+
+@listens_for(Session, 'after_bulk_delete')
+def _update_effective_acls_bulk_delete(delete_context):
+    _refresh_bulk_effective_acls(delete_context)
@@ -0,0 +1,143 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+
+from indico.core.db.sqlalchemy.protection import ProtectionMode
+from indico.modules.categories import Category
+from indico.modules.events import Event
+from indico.modules.events.models.effective_acl import (can_access_effective, can_access_filter,
+                                                        find_outdated_effective_acls, get_principal_keys,
+                                                        refresh_effective_acls)
+from indico.modules.events.models.principals import EventPrincipal
+from indico.modules.groups import GroupProxy
+
+
+@pytest.fixture
+def acl_tree(db, create_category, create_event, create_user):
+    users = {name: create_user(i, first_name=name) for i, name in enumerate(('alice', 'bob', 'carol', 'dave'), 1)}
+    root = Category.get_root()
+    root.protection_mode = ProtectionMode.protected
+    root.update_principal(users['alice'], full_access=True)
+    public = create_category(1, parent=root, protection_mode=ProtectionMode.public)
+    protected = create_category(2, parent=root, protection_mode=ProtectionMode.protected)
+    protected.update_principal(users['bob'], read_access=True)
+    inheriting = create_category(3, parent=protected, protection_mode=ProtectionMode.inheriting)
+    inheriting.update_principal(users['carol'], read_access=True)
+    events = [create_event(category=category, protection_mode=protection_mode)
+              for category in (public, protected, inheriting)
+              for protection_mode in (ProtectionMode.public, ProtectionMode.inheriting, ProtectionMode.protected)]
+    for event in events:
+        event.update_principal(users['dave'], read_access=True)
+    db.session.flush()
+    return users, [root, public, protected, inheriting], events
+
+
+def test_effective_acl(acl_tree):
+    users, categories, events = acl_tree
+    for user in [None] + users.values():
+        for obj in categories + events:
+            assert can_access_effective(obj, user) == obj.can_access(user), (obj, user)
+
+
+def test_effective_acl_updated(db, acl_tree):
+    users, categories, events = acl_tree
+    root, public, protected, inheriting = categories
+    inheriting_event = next(e for e in events if e.category == inheriting and e.is_inheriting)
+    assert can_access_effective(inheriting_event, users['carol'])
+    assert not can_access_effective(inheriting_event, None)
+
+    protected.protection_mode = ProtectionMode.public
+    db.session.flush()
+    assert can_access_effective(inheriting_event, None)
+
+    inheriting.move(public)
+    protected.protection_mode = ProtectionMode.protected
+    public.protection_mode = ProtectionMode.protected
+    db.session.flush()
+    assert not can_access_effective(inheriting_event, users['bob'])
+    assert can_access_effective(inheriting_event, users['carol'])
+
+    inheriting.update_principal(users['carol'], read_access=False)
+    db.session.flush()
+    assert not can_access_effective(inheriting_event, users['carol'])
+    assert can_access_effective(inheriting_event, users['alice'])
+
+
+def test_can_access_filter(acl_tree):
+    users, categories, events = acl_tree
+    for user in [None] + users.values():
+        assert set(Event.query.filter(can_access_filter(Event, user))) == {e for e in events if e.can_access(user)}
+
+
+def test_get_principal_keys(dummy_user):
+    assert get_principal_keys(None) == {'*'}
+    assert get_principal_keys(dummy_user) == {'*', 'User:{}'.format(dummy_user.id), 'Email:{}'.format(dummy_user.email)}
+
+
+def test_get_principal_keys_multipass(mocker, db, dummy_user, create_event):
+    event = create_event()
+    for provider, name in (('ldap', 'Staff'), ('ldap', 'others'), ('legacy', 'users'), ('legacy', 'guests')):
+        event.update_principal(GroupProxy(name, provider), read_access=True)
+    db.session.flush()
+    mocker.patch('indico.modules.groups.membership.get_user_groups', return_value={'ldap': frozenset({'staff'})})
+    is_group_member = mocker.patch('indico.modules.groups.core.is_group_member',
+                                   side_effect=lambda group, user: group.name == 'users')
+    keys = get_principal_keys(dummy_user)
+    assert {key for key in keys if key.startswith('Group:')} == {'Group:ldap:Staff', 'Group:legacy:users'}
+    # groups from providers which can list the groups of a user are never checked one by one
+    assert {call[0][0].name for call in is_group_member.call_args_list} == {'users', 'guests'}
+
+
+@pytest.mark.parametrize('synchronize_session', ('evaluate', 'fetch', False))
+def test_effective_acl_bulk_update(db, acl_tree, synchronize_session):
+    users, categories, events = acl_tree
+    root, public, protected, inheriting = categories
+    event = next(e for e in events if e.category == protected and e.is_protected)
+    assert not can_access_effective(event, None)
+    Event.query.filter_by(id=event.id).update({Event.protection_mode: ProtectionMode.public},
+                                              synchronize_session=synchronize_session)
+    assert can_access_effective(event, None)
+    assert event in Event.query.filter(can_access_filter(Event, None)).all()
+
+    Category.query.filter_by(id=protected.id).update({'protection_mode': ProtectionMode.public},
+                                                     synchronize_session=synchronize_session)
+    inheriting_event = next(e for e in events if e.category == inheriting and e.is_inheriting)
+    assert can_access_effective(inheriting_event, None)
+
+
+@pytest.mark.parametrize('synchronize_session', ('evaluate', 'fetch', False))
+def test_effective_acl_bulk_delete(db, acl_tree, synchronize_session):
+    users, categories, events = acl_tree
+    event = next(e for e in events if e.is_protected)
+    assert can_access_effective(event, users['dave'])
+    EventPrincipal.query.filter_by(event_id=event.id).delete(synchronize_session=synchronize_session)
+    assert not can_access_effective(event, users['dave'])
+    assert event not in Event.query.filter(can_access_filter(Event, users['dave'])).all()
+
+
+def test_find_outdated_effective_acls(db, acl_tree):
+    users, categories, events = acl_tree
+    root, public, protected, inheriting = categories
+    event = next(e for e in events if e.category == public and e.is_inheriting)
+    connection = db.session.connection()
+    assert find_outdated_effective_acls(connection) == (set(), set())
+    # changes made using raw SQL bypass the automatic updates
+    connection.execute(Event.__table__.update()
+                       .where(Event.id == event.id)
+                       .values(protection_mode=ProtectionMode.protected))
+    assert find_outdated_effective_acls(connection) == (set(), {event.id})
+    refresh_effective_acls(connection, event_ids={event.id})
+    assert find_outdated_effective_acls(connection) == (set(), set())
+    # events inheriting from an outdated category are outdated as well
+    connection.execute(Category.__table__.update()
+                       .where(Category.id == inheriting.id)
+                       .values(effective_acl=['User:{}'.format(users['bob'].id)]))
+    inheriting_event_ids = {e.id for e in events if e.category == inheriting and e.is_inheriting}
+    assert find_outdated_effective_acls(connection) == ({inheriting.id}, inheriting_event_ids)
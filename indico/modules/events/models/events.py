@@ -106,6 +106,7 @@ class Event(SearchableTitleMixin, DescriptionMixin, LocationMixin, ProtectionMan
                 db.CheckConstraint("url_shortcut != ''", 'url_shortcut_not_empty'),
                 db.CheckConstraint("cloned_from_id != id", 'not_cloned_from_self'),
                 db.CheckConstraint('visibility IS NULL OR visibility >= 0', 'valid_visibility'),
+                db.Index(None, 'effective_acl', postgresql_using='gin'),
                 {'schema': 'events'})
 
     @declared_attr
@@ -143,6 +144,13 @@ class Event(SearchableTitleMixin, DescriptionMixin, LocationMixin, ProtectionMan
         nullable=True,
         index=True
     )
+    #: The keys of all principals who can access the event; it is
+    #: maintained automatically (see :mod:`indico.modules.events.models.effective_acl`)
+    effective_acl = db.deferred(db.Column(
+        ARRAY(db.String),
+        nullable=False,
+        default=[]
+    ))
     #: The ID of the series this events belongs to
     series_id = db.Column(
         db.Integer,
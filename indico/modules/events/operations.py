@@ -336,6 +336,44 @@ def unlock_event(event):
     event.log(EventLogRealm.event, EventLogKind.change, 'Event', 'Event unlocked', session.user)
 
 
+def delete_events(query, reason, user=None, batch_size=100):
+    """Delete many events in batches.
+
+    The events are processed in batches ordered by their ID and each
+    batch is committed separately, so the session never contains more
+    than one batch of events and calling this function again with the
+    same query after an interruption continues where it stopped.
+
+    Each batch is deleted using a single UPDATE query; the
+    ``event.deleted`` signal and the log entries are still created for
+    each event.
+
+    :param query: A query returning the events to delete
+    :param reason: The reason for the deletion shown in the log
+    :param user: The user deleting the events
+    :param batch_size: The number of events deleted per batch
+    :return: An iterator yielding the list of event ids deleted in
+             each batch.
+    """
+    query = query.filter(~Event.is_deleted).order_by(Event.id)
+    last_id = None
+    while True:
+        batch_query = query if last_id is None else query.filter(Event.id > last_id)
+        events = batch_query.limit(batch_size).all()
+        if not events:
+            break
+        event_ids = [e.id for e in events]
+        last_id = event_ids[-1]
+        Event.query.filter(Event.id.in_(event_ids)).update({Event.is_deleted: True}, synchronize_session='fetch')
+        for event in events:
+            signals.event.deleted.send(event, user=user)
+            event.log(EventLogRealm.event, EventLogKind.negative, 'Event', 'Event deleted', user,
+                      data={'Reason': reason})
+        db.session.commit()
+        logger.info('Deleted %d events [%s]: %s', len(event_ids), reason, ', '.join(map(unicode, event_ids)))
+        yield event_ids
+
+
 def create_reviewing_question(event, question_model, wtf_field_cls, form, data=None):
     new_question = question_model()
     new_question.no_score = True
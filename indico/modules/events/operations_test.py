@@ -0,0 +1,40 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+
+from indico.core import signals
+from indico.modules.events import Event
+from indico.modules.events.operations import delete_events
+
+
+@pytest.mark.parametrize(('batch_size', 'expected'), (
+    (1, [1, 1, 1, 1, 1]),
+    (2, [2, 2, 1]),
+    (10, [5]),
+))
+def test_delete_events(db, create_event, dummy_user, batch_size, expected):
+    events = [create_event(i) for i in range(1, 6)]
+    other = create_event(6, title='Other')
+    db.session.flush()
+    deleted_signals = []
+    query = Event.query.filter(Event.id != other.id)
+
+    def _deleted(event, user, **kwargs):
+        deleted_signals.append(event)
+
+    with signals.event.deleted.connected_to(_deleted):
+        batches = list(delete_events(query, 'Testing', dummy_user, batch_size=batch_size))
+    assert [len(ids) for ids in batches] == expected
+    assert set(deleted_signals) == set(events)
+    assert all(e.is_deleted for e in events)
+    assert not other.is_deleted
+    assert all(e.log_entries.filter_by(summary='Event deleted').count() == 1 for e in events)
+    # running it again does not touch the already-deleted events
+    assert not list(delete_events(query, 'Testing', dummy_user, batch_size=batch_size))
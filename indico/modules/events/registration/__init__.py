@@ -40,6 +40,11 @@ registration_settings = RegistrationSettingsProxy('registrations', {
 })
 
 
+@signals.import_tasks.connect
+def _import_tasks(sender, **kwargs):
+    import indico.modules.events.registration.tasks  # noqa: F401
+
+
 @signals.menu.items.connect_via('event-management-sidemenu')
 def _extend_event_management_menu(sender, event, **kwargs):
     registration_section = 'organization' if event.type == 'conference' else 'advanced'
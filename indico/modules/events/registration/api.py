@@ -7,19 +7,32 @@
 
 from __future__ import unicode_literals
 
+from datetime import timedelta
+
+import pytz
 from flask import jsonify, request
+from marshmallow import fields
 from sqlalchemy.orm import joinedload
+from webargs import validate
 from werkzeug.exceptions import BadRequest, Forbidden
 
 from indico.core import signals
 from indico.modules.events.controllers.base import RHProtectedEventBase
 from indico.modules.events.models.events import Event
 from indico.modules.events.registration.models.registrations import RegistrationState
-from indico.modules.events.registration.util import build_registration_api_data, build_registrations_api_data
+from indico.modules.events.registration.util import (build_registration_api_data, build_registrations_api_changes,
+                                                     build_registrations_api_data, check_in_registrations)
 from indico.modules.oauth import oauth
+from indico.util.date_time import now_utc
+from indico.web.args import use_kwargs
 from indico.web.rh import RH
 
 
+#: How far before the `since` time of a request the changes feed looks for
+#: changes, to include those which were not committed yet at that time
+CHANGES_FEED_OVERLAP = timedelta(minutes=1)
+
+
 class RHAPIRegistrant(RH):
     """RESTful registrant API."""
 
@@ -70,7 +83,49 @@ class RHAPIRegistrants(RH):
         self.event = Event.find(id=request.view_args['event_id'], is_deleted=False).first_or_404()
 
     def _process_GET(self):
-        return jsonify(registrants=build_registrations_api_data(self.event))
+        # the time of this request can be used to get the changes made afterwards
+        since = now_utc()
+        return jsonify(registrants=build_registrations_api_data(self.event), since=since.isoformat())
+
+
+class RHAPIRegistrantsChanges(RHAPIRegistrants):
+    """RESTful API to get the registrants changed since a given time.
+
+    This allows scanners to keep an offline copy of the registrants up
+    to date without downloading the whole list again.  The ``since``
+    from the response needs to be used for the next request.  Changes
+    made shortly before that time are sent again to include those from
+    transactions which were still running at that time, so clients need
+    to handle registrants they already know about.
+    """
+
+    @use_kwargs({
+        'since': fields.DateTime(required=True)
+    })
+    def _process_GET(self, since):
+        if since.tzinfo is None:
+            since = pytz.utc.localize(since)
+        next_since = now_utc()
+        registrants, removed_ids = build_registrations_api_changes(self.event, since - CHANGES_FEED_OVERLAP)
+        return jsonify(registrants=registrants, removed=removed_ids, since=next_since.isoformat())
+
+
+class RHAPIRegistrantsCheckin(RHAPIRegistrants):
+    """RESTful API to check in many registrants at once.
+
+    The registrants are identified by their ticket UUID (``checkin_secret``).
+    Submitting a ticket again does not change anything, so scanners can
+    safely retry requests.
+    """
+
+    CSRF_ENABLED = False
+
+    @use_kwargs({
+        'tickets': fields.List(fields.String(), required=True, validate=validate.Length(max=1000)),
+        'checked_in': fields.Bool(missing=True)
+    })
+    def _process_POST(self, tickets, checked_in):
+        return jsonify(results=check_in_registrations(self.event, tickets, checked_in=checked_in))
 
 
 class RHAPIRegistrationForms(RHProtectedEventBase):
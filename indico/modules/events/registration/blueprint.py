@@ -48,6 +48,8 @@ _bp.add_url_rule('/manage/registration/<int:reg_form_id>/display', 'manage_regfo
 # Registrations management
 _bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/', 'manage_reglist',
                  reglists.RHRegistrationsListManage)
+_bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/list.json', 'manage_reglist_data',
+                 reglists.RHRegistrationsListData)
 _bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/customize', 'customize_reglist',
                  reglists.RHRegistrationsListCustomize, methods=('GET', 'POST'))
 _bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/static-url', 'generate_static_url',
@@ -83,6 +85,8 @@ _bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/email-pre
                  reglists.RHRegistrationEmailRegistrantsPreview, methods=('GET', 'POST'))
 _bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/import', 'registrations_import',
                  reglists.RHRegistrationsImport, methods=('GET', 'POST'))
+_bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/import/<task_id>',
+                 'registrations_import_status', reglists.RHRegistrationsImportStatus)
 _bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/table.pdf', 'registrations_pdf_export_table',
                  reglists.RHRegistrationsExportPDFTable, methods=('POST',))
 _bp.add_url_rule('/manage/registration/<int:reg_form_id>/registrations/book.pdf', 'registrations_pdf_export_book',
@@ -176,6 +180,10 @@ _bp.add_url_rule('!/api/events/<int:event_id>/registrants/<int:registrant_id>',
                  api.RHAPIRegistrant, methods=('GET', 'PATCH'))
 _bp.add_url_rule('!/api/events/<int:event_id>/registrants', 'api_registrants',
                  api.RHAPIRegistrants)
+_bp.add_url_rule('!/api/events/<int:event_id>/registrants/changes', 'api_registrants_changes',
+                 api.RHAPIRegistrantsChanges)
+_bp.add_url_rule('!/api/events/<int:event_id>/registrants/checkin', 'api_registrants_checkin',
+                 api.RHAPIRegistrantsCheckin, methods=('POST',))
 _bp.add_url_rule('/api/registration-forms', 'api_registration_forms', api.RHAPIRegistrationForms)
 
 
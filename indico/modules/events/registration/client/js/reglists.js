@@ -5,7 +5,8 @@
 // modify it under the terms of the MIT License; see the
 // LICENSE file for more details.
 
-/* global setupListGenerator:false, getSelectedRows:false, handleSelectedRowHighlight:false, setupTableSorter:false */
+/* global setupListGenerator:false, getSelectedRows:false, handleRowSelection:false,
+          handleSelectedRowHighlight:false, setupTableSorter:false */
 
 (function(global) {
   global.setupRegistrationList = function setupRegistrationList() {
@@ -22,6 +23,43 @@
         .trigger('change');
     }
 
+    function loadRemainingRegistrations() {
+      // only the first registrations are rendered with the page, the
+      // remaining ones are appended to the table in batches
+      var $wrapper = $('#registration-list .js-list-table-wrapper');
+      var cursor = $wrapper.data('next-cursor');
+      if (cursor === undefined || cursor === null || $wrapper.data('loading')) {
+        return;
+      }
+      $wrapper.data('loading', true);
+      $.ajax({
+        url: $wrapper.data('list-url'),
+        data: {cursor: cursor, html: true},
+        error: handleAjaxError,
+        complete: function() {
+          $wrapper.data('loading', false);
+        },
+        success: function(data) {
+          if (!$.contains(document.documentElement, $wrapper[0])) {
+            // the list has been replaced in the meantime
+            return;
+          }
+          $wrapper.find('tbody').append(data.html);
+          $wrapper.find('.tablesorter').trigger('update');
+          // bind the selection handlers again so they include the new rows
+          $('table.i-table input.select-row').off('change');
+          handleRowSelection(true);
+          handleRegListRowSelection();
+          $wrapper.data('next-cursor', data.next_cursor);
+          if (data.next_cursor === null) {
+            $wrapper.find('.js-reglist-loading').remove();
+          } else {
+            _.defer(loadRemainingRegistrations);
+          }
+        },
+      });
+    }
+
     $('body').on('click', '#preview-email', function() {
       var $this = $(this);
       ajaxDialog({
@@ -87,6 +125,7 @@
             handleSelectedRowHighlight(true);
             handleRegListRowSelection();
             setupTableSorter();
+            loadRemainingRegistrations();
           }
         },
       });
@@ -105,6 +144,9 @@
       principal.principalfield('choose');
     });
 
+    $('.list').on('indico:htmlUpdated', loadRemainingRegistrations);
+    loadRemainingRegistrations();
+
     $('.js-add-multiple-users').ajaxDialog({
       dialogClasses: 'add-multiple-users-dialog',
       onClose: function(data) {
@@ -113,6 +155,7 @@
           handleSelectedRowHighlight(true);
           handleRegListRowSelection();
           setupTableSorter();
+          loadRemainingRegistrations();
         }
       },
     });
@@ -139,6 +139,7 @@ class RegistrationCloner(EventCloner):
                 if old_registration_data.storage_file_id is not None:
                     with old_registration_data.open() as fd:
                         new_registration_data.save(fd)
+            new_registration.update_search_data()
             db.session.flush()
             signals.event.registration_state_updated.send(new_registration, previous_state=None)
 
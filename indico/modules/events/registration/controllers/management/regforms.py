@@ -25,6 +25,7 @@ from indico.modules.events.registration.forms import (ParticipantsDisplayForm, P
                                                       RegistrationManagersForm)
 from indico.modules.events.registration.models.forms import RegistrationForm
 from indico.modules.events.registration.models.items import PersonalDataType
+from indico.modules.events.registration.models.registrations import Registration
 from indico.modules.events.registration.stats import AccommodationStats, OverviewStats
 from indico.modules.events.registration.util import create_personal_data_fields, get_event_section_data
 from indico.modules.events.registration.views import (WPManageParticipants, WPManageRegistration,
@@ -208,6 +209,9 @@ class RHRegistrationFormDelete(RHManageRegFormBase):
 
     def _process(self):
         self.regform.is_deleted = True
+        # make the registrations show up in the check-in changes feed
+        (Registration.query.with_parent(self.regform)
+         .update({Registration.modified_dt: now_utc()}, synchronize_session=False))
         signals.event.registration_form_deleted.send(self.regform)
         flash(_("Registration form deleted"), 'success')
         logger.info("Registration form %s deleted by %s", self.regform, session.user)
@@ -12,10 +12,13 @@ import uuid
 from io import BytesIO
 
 from flask import flash, jsonify, redirect, render_template, request, session
+from marshmallow import fields
 from sqlalchemy.orm import joinedload, subqueryload
+from webargs import validate
 from werkzeug.exceptions import BadRequest, Forbidden, NotFound
 
 from indico.core import signals
+from indico.core.celery import AsyncResult
 from indico.core.config import config
 from indico.core.db import db
 from indico.core.errors import NoReportError
@@ -37,13 +40,16 @@ from indico.modules.events.registration.controllers.management import (RHManageR
                                                                        RHManageRegistrationBase)
 from indico.modules.events.registration.forms import (BadgeSettingsForm, CreateMultipleRegistrationsForm,
                                                       EmailRegistrantsForm, ImportRegistrationsForm)
+from indico.modules.events.registration.lists import RegistrationListGenerator
 from indico.modules.events.registration.models.items import PersonalDataType, RegistrationFormItemType
 from indico.modules.events.registration.models.registrations import Registration, RegistrationData, RegistrationState
 from indico.modules.events.registration.notifications import notify_registration_state_update
 from indico.modules.events.registration.settings import event_badge_settings
-from indico.modules.events.registration.util import (create_registration, generate_spreadsheet_from_registrations,
-                                                     get_event_section_data, get_ticket_attachments, get_title_uuid,
-                                                     import_registrations_from_csv, make_registration_form)
+from indico.modules.events.registration.tasks import import_registrations_task, schedule_ticket_generation
+from indico.modules.events.registration.util import (BACKGROUND_IMPORT_THRESHOLD, create_registration,
+                                                     generate_spreadsheet_from_registrations, get_event_section_data,
+                                                     get_ticket_attachments, get_title_uuid, import_registrations,
+                                                     make_registration_form, parse_registrations_csv)
 from indico.modules.events.registration.views import WPManageRegistration
 from indico.modules.events.util import ZipGeneratorMixin
 from indico.modules.users import User
@@ -51,12 +57,14 @@ from indico.util.fs import secure_filename
 from indico.util.i18n import _, ngettext
 from indico.util.placeholders import replace_placeholders
 from indico.util.spreadsheets import send_csv, send_xlsx
+from indico.web.args import use_kwargs
 from indico.web.flask.templating import get_template_module
 from indico.web.flask.util import send_file, url_for
 from indico.web.util import jsonify_data, jsonify_template
 
 
 badge_cache = GenericCache('badge-printing')
+import_task_cache = GenericCache('registration-import-tasks')
 
 
 def _render_registration_details(registration):
@@ -65,6 +73,15 @@ def _render_registration_details(registration):
     return tpl.render_registration_details(registration=registration, payment_enabled=event.has_feature('payment'))
 
 
+def _schedule_ticket_generation(regform, registrations):
+    """Generate the tickets of new registrations in the background."""
+    if not regform.tickets_enabled:
+        return
+    # the tasks need to see the new registrations
+    db.session.commit()
+    schedule_ticket_generation(registrations)
+
+
 class RHRegistrationsListManage(RHManageRegFormBase):
     """List all registrations of a specific registration form of an event."""
 
@@ -80,6 +97,31 @@ class RHRegistrationsListManage(RHManageRegFormBase):
                                                     has_badges=has_badges, has_tickets=has_tickets, **reg_list_kwargs)
 
 
+class RHRegistrationsListData(RHManageRegFormBase):
+    """Get the registrations of the list as JSON.
+
+    The registrations are returned in batches; the `next_cursor` from
+    the response needs to be passed as the `cursor` to get the next
+    batch.  The filters and columns configured for the list are used.
+    This is also used by the management list to load the registrations
+    after the first batch.
+    """
+
+    @use_kwargs({
+        'sort': fields.String(missing='name', validate=validate.OneOf(RegistrationListGenerator.sort_keys)),
+        'desc': fields.Bool(missing=False),
+        'cursor': fields.Integer(missing=None),
+        'limit': fields.Integer(missing=100, validate=validate.Range(1, 1000)),
+        'html': fields.Bool(missing=False)
+    })
+    def _process(self, sort, desc, cursor, limit, html):
+        try:
+            data = self.list_generator.get_list_data(sort, descending=desc, cursor=cursor, limit=limit, html=html)
+        except ValueError as exc:
+            raise BadRequest(unicode(exc))
+        return jsonify(data)
+
+
 class RHRegistrationsListCustomize(RHManageRegFormBase):
     """Filter options and columns to display for a registrations list of an event."""
 
@@ -293,7 +335,7 @@ class RHRegistrationCreateMultiple(RHManageRegFormBase):
         data = {pdt.name: getattr(user, pdt.name, None) for pdt in PersonalDataType}
         data['title'] = get_title_uuid(self.regform, data['title'])
         with db.session.no_autoflush:
-            create_registration(self.regform, data, management=True, notify_user=notify)
+            return create_registration(self.regform, data, management=True, notify_user=notify)
 
     def _process(self):
         form = CreateMultipleRegistrationsForm(regform=self.regform, open_add_user_dialog=(request.method == 'GET'),
@@ -301,8 +343,9 @@ class RHRegistrationCreateMultiple(RHManageRegFormBase):
 
         if form.validate_on_submit():
             session['registration_notify_user_default'] = form.notify_users.data
-            for user in form.user_principals.data:
-                self._register_user(user, form.notify_users.data)
+            registrations = [self._register_user(user, form.notify_users.data)
+                             for user in form.user_principals.data]
+            _schedule_ticket_generation(self.regform, registrations)
             return jsonify_data(**self.list_generator.render_list())
 
         return jsonify_template('events/registration/management/registration_create_multiple.html', form=form)
@@ -370,9 +413,20 @@ class RHRegistrationsImport(RHRegistrationsActionBase):
 
         if form.validate_on_submit():
             skip_moderation = self.regform.moderation_enabled and form.skip_moderation.data
-            registrations = import_registrations_from_csv(self.regform, form.source_file.data,
-                                                          skip_moderation=skip_moderation,
-                                                          notify_users=form.notify_users.data)
+            rows = parse_registrations_csv(self.regform, form.source_file.data)
+            if len(rows) > BACKGROUND_IMPORT_THRESHOLD:
+                task = import_registrations_task.delay(self.regform, rows, skip_moderation, form.notify_users.data,
+                                                       session.user)
+                import_task_cache.set(task.id, self.regform.id, time=86400)
+                flash(_("The {} registrations are being imported. This may take a while; reload the page to see "
+                        "the progress.").format(len(rows)), 'info')
+                return jsonify_data(flash=False, redirect=url_for('.manage_reglist', self.regform),
+                                    redirect_no_loading=True, task_id=task.id,
+                                    status_url=url_for('.registrations_import_status', self.regform,
+                                                       task_id=task.id))
+            registrations = import_registrations(self.regform, rows, skip_moderation=skip_moderation,
+                                                 notify_users=form.notify_users.data)
+            _schedule_ticket_generation(self.regform, registrations)
             flash(ngettext("{} registration has been imported.",
                            "{} registrations have been imported.",
                            len(registrations)).format(len(registrations)), 'success')
@@ -382,6 +436,19 @@ class RHRegistrationsImport(RHRegistrationsActionBase):
                                 regform=self.regform)
 
 
+class RHRegistrationsImportStatus(RHManageRegFormBase):
+    """Get the progress of a registration import running in the background."""
+
+    def _process(self):
+        task_id = request.view_args['task_id']
+        # only the status of imports into this form is available
+        if import_task_cache.get(task_id) != self.regform.id:
+            raise NotFound
+        res = AsyncResult(task_id)
+        progress = res.info if res.state in ('PROGRESS', 'SUCCESS') else {}
+        return jsonify(state=res.state, done=progress.get('done', 0), total=progress.get('total'))
+
+
 class RHRegistrationsPrintBadges(RHRegistrationsActionBase):
     ALLOW_LOCKED = True
     normalize_url_spec = {
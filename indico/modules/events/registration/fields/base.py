@@ -54,13 +54,18 @@ class RegistrationFormFieldBase(object):
         """
         return 0
 
-    def create_sql_filter(self, data_list):
+    def create_sql_filter(self, data_list, data_column=RegistrationData.data):
         """
         Create a SQL criterion to check whether the field's value is
         in `data_list`.  The function is expected to return an
-        operation on ``Registrationdata.data``.
+        operation on `data_column`.
+
+        :param data_list: The values to filter by
+        :param data_column: The JSON column (or JSON element) containing
+                            the field's value; by default this is
+                            ``RegistrationData.data``.
         """
-        return RegistrationData.data.op('#>>')('{}').in_(data_list)
+        return data_column.op('#>>')('{}').in_(data_list)
 
     def create_wtf_field(self):
         validators = list(self.validators) if self.validators is not None else []
@@ -140,8 +140,8 @@ class ChoiceBaseField(RegistrationFormBillableItemsField):
             places_used.update(data)
         return dict(places_used)
 
-    def create_sql_filter(self, data_list):
-        return RegistrationData.data.has_any(db.func.cast(data_list, ARRAY(db.String)))
+    def create_sql_filter(self, data_list, data_column=RegistrationData.data):
+        return data_column.has_any(db.func.cast(data_list, ARRAY(db.String)))
 
     def calculate_price(self, reg_data, versioned_data):
         if not reg_data:
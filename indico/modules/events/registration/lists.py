@@ -10,15 +10,16 @@ from __future__ import unicode_literals
 from collections import OrderedDict
 
 from flask import request
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
 from indico.core.db import db
-from indico.modules.events.registration.models.form_fields import RegistrationFormFieldData
 from indico.modules.events.registration.models.items import PersonalDataType, RegistrationFormItem
-from indico.modules.events.registration.models.registrations import Registration, RegistrationData, RegistrationState
+from indico.modules.events.registration.models.registrations import Registration, RegistrationState
+from indico.modules.events.registration.models.search_data import RegistrationSearchData
 from indico.modules.events.util import ListGeneratorBase
-from indico.util.i18n import _
+from indico.util.i18n import _, ngettext
 from indico.web.flask.templating import get_template_module
+from indico.web.flask.util import url_for
 
 
 class RegistrationListGenerator(ListGeneratorBase):
@@ -26,6 +27,11 @@ class RegistrationListGenerator(ListGeneratorBase):
 
     endpoint = '.manage_reglist'
     list_link_type = 'registration'
+    #: The keys by which the registration list data can be sorted
+    sort_keys = ('name', 'id', 'email', 'reg_date')
+    #: The number of registrations rendered with the management list;
+    #: the remaining ones are loaded in batches of this size
+    batch_size = 100
 
     def __init__(self, regform):
         super(RegistrationListGenerator, self).__init__(regform.event, entry_parent=regform)
@@ -141,8 +147,7 @@ class RegistrationListGenerator(ListGeneratorBase):
                          if field_id in field_types}
         if not field_filters and not filters['items']:
             return query
-        criteria = [db.and_(RegistrationFormFieldData.field_id == field_id,
-                            field_types[field_id].create_sql_filter(data_list))
+        criteria = [field_types[field_id].create_sql_filter(data_list, RegistrationSearchData.data[field_id])
                     for field_id, data_list in field_filters.iteritems()]
         items_criteria = []
         if 'checked_in' in filters['items']:
@@ -156,33 +161,156 @@ class RegistrationListGenerator(ListGeneratorBase):
             items_criteria.append(Registration.state.in_(states))
 
         if field_filters:
-            subquery = (RegistrationData.query
-                        .with_entities(db.func.count(RegistrationData.registration_id))
-                        .join(RegistrationData.field_data)
-                        .filter(RegistrationData.registration_id == Registration.id)
-                        .filter(db.or_(*criteria))
-                        .correlate(Registration)
-                        .as_scalar())
-            query = query.filter(subquery == len(field_filters))
+            query = query.join(Registration.search_data).filter(*criteria)
         return query.filter(db.or_(*items_criteria))
 
     def get_list_kwargs(self):
         reg_list_config = self._get_config()
         registrations_query = self._build_query()
         total_entries = registrations_query.count()
-        registrations = self._filter_list_entries(registrations_query, reg_list_config['filters']).all()
+        filtered_query = self._filter_list_entries(registrations_query, reg_list_config['filters'])
+        filtered_entries = filtered_query.count()
+        # only the first batch is rendered, the rest of the list is
+        # loaded from the list data endpoint by the client
+        registrations, next_cursor = self._get_list_batch(reg_list_config, 'name', False, None, self.batch_size)
         dynamic_item_ids, static_item_ids = self._split_item_ids(reg_list_config['items'], 'dynamic')
         static_columns = self._get_static_columns(static_item_ids)
         regform_items = self._get_sorted_regform_items(dynamic_item_ids)
         return {
             'regform': self.regform,
             'registrations': registrations,
+            'next_cursor': next_cursor,
             'total_registrations': total_entries,
+            'filtered_registrations': filtered_entries,
+            'has_pending_registrations': filtered_query.filter(Registration.state == RegistrationState.pending)
+                                                       .has_rows(),
             'static_columns': static_columns,
             'dynamic_columns': regform_items,
-            'filtering_enabled': total_entries != len(registrations)
+            'filtering_enabled': total_entries != filtered_entries
         }
 
+    def _get_sort_columns(self, sort_key):
+        if sort_key == 'name':
+            columns = [db.func.lower(Registration.last_name), db.func.lower(Registration.first_name)]
+        elif sort_key == 'id':
+            columns = [Registration.friendly_id]
+        elif sort_key == 'email':
+            columns = [db.func.lower(Registration.email)]
+        elif sort_key == 'reg_date':
+            columns = [Registration.submitted_dt]
+        else:
+            raise ValueError('Invalid sort key: {}'.format(sort_key))
+        # the id makes the order unique, which is needed for the cursor
+        return columns + [Registration.id]
+
+    def _get_list_batch(self, reg_list_config, sort, descending, cursor, limit):
+        sort_columns = self._get_sort_columns(sort)
+        query = self._filter_list_entries(Registration.query
+                                          .with_parent(self.regform)
+                                          .filter(~Registration.is_deleted),
+                                          reg_list_config['filters'])
+        if cursor is not None:
+            ref = (db.session.query(*sort_columns)
+                   .filter(Registration.id == cursor, Registration.registration_form == self.regform)
+                   .first())
+            if ref is None:
+                raise ValueError('Invalid cursor: {}'.format(cursor))
+            if descending:
+                query = query.filter(db.tuple_(*sort_columns) < db.tuple_(*ref))
+            else:
+                query = query.filter(db.tuple_(*sort_columns) > db.tuple_(*ref))
+        query = (query
+                 .options(selectinload('data').joinedload('field_data').joinedload('field'))
+                 .order_by(*[col.desc() if descending else col for col in sort_columns]))
+        if 'payment_date' in reg_list_config['items']:
+            query = query.options(selectinload('transaction'))
+        registrations = query.limit(limit + 1).all()
+        has_more = len(registrations) > limit
+        registrations = registrations[:limit]
+        return registrations, (registrations[-1].id if has_more else None)
+
+    def get_list_data(self, sort='name', descending=False, cursor=None, limit=100, html=False):
+        """Get a part of the registration list as JSON-serializable data.
+
+        Instead of loading the whole list, the registrations are loaded
+        in batches using the ID of the last registration of the previous
+        batch as the cursor, so each request is fast regardless of the
+        size of the list.  The filters of the list are applied in the
+        query and only the columns configured for the list are included.
+
+        :param sort: One of the `sort_keys`
+        :param descending: Whether to sort in descending order
+        :param cursor: The ID of the registration after which the
+                       registrations should be returned
+        :param limit: The maximum number of registrations to return
+        :param html: Whether to include the rows of the management list
+                     table for the registrations
+        :return: A dict containing the columns, the registrations and
+                 the cursor to get the next registrations (``None``
+                 if there are no more registrations).
+        """
+        reg_list_config = self._get_config()
+        registrations, next_cursor = self._get_list_batch(reg_list_config, sort, descending, cursor, limit)
+        dynamic_item_ids, static_item_ids = self._split_item_ids(reg_list_config['items'], 'dynamic')
+        static_columns = self._get_static_columns(static_item_ids)
+        regform_items = self._get_sorted_regform_items(dynamic_item_ids)
+        columns = ([{'id': col['id'], 'caption': col['caption']} for col in static_columns] +
+                   [{'id': item.id, 'caption': item.title} for item in regform_items])
+        column_ids = [col['id'] for col in columns]
+        data = {
+            'columns': columns,
+            'registrations': [self._serialize_registration(reg, column_ids) for reg in registrations],
+            'next_cursor': next_cursor
+        }
+        if html:
+            tpl = get_template_module('events/registration/management/_reglist.html')
+            data['html'] = tpl.render_registration_rows(self.regform, registrations, regform_items, static_columns)
+        return data
+
+    def _serialize_registration(self, registration, column_ids):
+        data = registration.data_by_field
+        values = {}
+        for column_id in column_ids:
+            if column_id == 'reg_date':
+                values[column_id] = registration.submitted_dt.isoformat()
+            elif column_id == 'state':
+                values[column_id] = registration.state.title
+            elif column_id == 'price':
+                values[column_id] = registration.render_price()
+            elif column_id == 'checked_in':
+                values[column_id] = registration.checked_in
+            elif column_id == 'checked_in_date':
+                values[column_id] = registration.checked_in_dt.isoformat() if registration.checked_in_dt else None
+            elif column_id == 'payment_date':
+                values[column_id] = registration.payment_dt.isoformat() if registration.payment_dt else None
+            else:
+                values[column_id] = self._serialize_field_value(data.get(column_id))
+        return {
+            'id': registration.id,
+            'friendly_id': registration.friendly_id,
+            'full_name': registration.display_full_name,
+            'state': registration.state.name,
+            'has_files': registration.has_files,
+            'url': url_for('event_registration.registration_details', registration),
+            'values': values
+        }
+
+    def _serialize_field_value(self, data):
+        if data is None:
+            return None
+        input_type = data.field_data.field.input_type
+        if input_type == 'checkbox':
+            return bool(data.data)
+        elif input_type == 'accommodation':
+            friendly_data = data.friendly_data
+            if not friendly_data:
+                return None
+            elif friendly_data.get('is_no_accommodation'):
+                return friendly_data['choice']
+            return ngettext('{choice} ({nights} night)', '{choice} ({nights} nights)',
+                            friendly_data['nights']).format(**friendly_data)
+        return data.get_friendly_data(for_humans=True) or None
+
     def get_list_export_config(self):
         static_item_ids, item_ids = self.get_item_ids()
         return {
@@ -199,6 +327,7 @@ class RegistrationListGenerator(ListGeneratorBase):
         reg_list_kwargs = self.get_list_kwargs()
         tpl = get_template_module('events/registration/management/_reglist.html')
         filtering_enabled = reg_list_kwargs.pop('filtering_enabled')
+        del reg_list_kwargs['has_pending_registrations']
         return {
             'html': tpl.render_registration_list(**reg_list_kwargs),
             'filtering_enabled': filtering_enabled
@@ -0,0 +1,113 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+
+from indico.modules.events.registration.lists import RegistrationListGenerator
+from indico.modules.events.registration.models.items import PersonalDataType
+from indico.modules.events.registration.util import create_registration, modify_registration
+
+
+pytest_plugins = 'indico.modules.events.registration.testing.fixtures'
+
+
+def _get_all(list_generator, limit, **kwargs):
+    cursor = None
+    pages = []
+    while True:
+        data = list_generator.get_list_data(cursor=cursor, limit=limit, **kwargs)
+        pages.append([reg['full_name'] for reg in data['registrations']])
+        cursor = data['next_cursor']
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.usefixtures('request_context')
+@pytest.mark.parametrize('limit', (1, 2, 5))
+def test_get_list_data(dummy_regform, limit):
+    names = [('Jane', 'Doe'), ('John', 'Doe'), ('Alice', 'Zed'), ('Bob', 'Able'), ('alex', 'doe')]
+    for i, (first_name, last_name) in enumerate(names):
+        create_registration(dummy_regform, {
+            'email': 'user{}@example.com'.format(i),
+            'first_name': first_name,
+            'last_name': last_name
+        }, notify_user=False)
+    list_generator = RegistrationListGenerator(dummy_regform)
+    expected = ['Bob Able', 'alex doe', 'Jane Doe', 'John Doe', 'Alice Zed']
+    pages = _get_all(list_generator, limit)
+    assert all(len(page) <= limit for page in pages)
+    assert sum(pages, []) == expected
+    pages = _get_all(list_generator, limit, descending=True)
+    assert sum(pages, []) == expected[::-1]
+    pages = _get_all(list_generator, limit, sort='email')
+    assert sum(pages, []) == ['Jane Doe', 'John Doe', 'Alice Zed', 'Bob Able', 'alex doe']
+
+
+@pytest.mark.usefixtures('request_context')
+def test_get_list_kwargs_first_batch(dummy_regform):
+    registrations = [create_registration(dummy_regform, {
+        'email': 'user{}@example.com'.format(i),
+        'first_name': 'User',
+        'last_name': unicode(i)
+    }, notify_user=False) for i in range(3)]
+    list_generator = RegistrationListGenerator(dummy_regform)
+    list_generator.batch_size = 2
+    kwargs = list_generator.get_list_kwargs()
+    assert kwargs['registrations'] == registrations[:2]
+    assert kwargs['next_cursor'] == registrations[1].id
+    assert kwargs['total_registrations'] == kwargs['filtered_registrations'] == 3
+    assert not kwargs['filtering_enabled']
+    assert not kwargs['has_pending_registrations']
+    # the management list loads the remaining rows from the list data endpoint
+    data = list_generator.get_list_data(cursor=kwargs['next_cursor'], limit=2, html=True)
+    assert data['next_cursor'] is None
+    assert 'id="registration-{}"'.format(registrations[2].id) in data['html']
+    assert 'id="registration-{}"'.format(registrations[1].id) not in data['html']
+
+
+@pytest.mark.usefixtures('request_context')
+def test_get_list_data_invalid(dummy_regform):
+    list_generator = RegistrationListGenerator(dummy_regform)
+    with pytest.raises(ValueError):
+        list_generator.get_list_data(sort='foo')
+    with pytest.raises(ValueError):
+        list_generator.get_list_data(cursor=1337)
+
+
+@pytest.mark.usefixtures('request_context')
+def test_filter_list_entries(dummy_regform):
+    country_field = next(f for f in dummy_regform.active_fields if f.personal_data_type == PersonalDataType.country)
+    registrations = []
+    for i, country in enumerate(('CH', 'FR', 'CH', '')):
+        registrations.append(create_registration(dummy_regform, {
+            'email': 'user{}@example.com'.format(i),
+            'first_name': 'User',
+            'last_name': unicode(i),
+            country_field.html_field_name: country
+        }, notify_user=False))
+    assert [r.search_data.country for r in registrations] == ['CH', 'FR', 'CH', None]
+
+    list_generator = RegistrationListGenerator(dummy_regform)
+
+    def _filter(countries):
+        filters = {'fields': {unicode(country_field.id): countries}, 'items': {}}
+        query = list_generator._filter_list_entries(list_generator._build_query(), filters)
+        return [r.last_name for r in query]
+
+    assert _filter(['CH']) == ['0', '2']
+    assert _filter(['CH', 'FR']) == ['0', '1', '2']
+    assert _filter(['DE']) == []
+    modify_registration(registrations[1], {
+        'email': 'user1@example.com',
+        'first_name': 'User',
+        'last_name': '1',
+        country_field.html_field_name: 'CH'
+    }, notify_user=False)
+    assert registrations[1].search_data.country == 'CH'
+    assert _filter(['CH']) == ['0', '1', '2']
@@ -27,6 +27,7 @@ from indico.core.db.sqlalchemy import PyIntEnum, UTCDateTime
 from indico.core.db.sqlalchemy.util.queries import increment_and_get
 from indico.core.storage import StoredFileMixin
 from indico.modules.events.payment.models.transactions import TransactionStatus
+from indico.modules.events.registration.models.search_data import RegistrationSearchData
 from indico.modules.users.models.users import format_display_full_name
 from indico.util.date_time import now_utc
 from indico.util.decorators import classproperty
@@ -65,6 +66,7 @@ class Registration(db.Model):
                                postgresql_where=db.text('NOT is_deleted AND (state NOT IN (3, 4))')),
                       db.Index(None, 'registration_form_id', 'email', unique=True,
                                postgresql_where=db.text('NOT is_deleted AND (state NOT IN (3, 4))')),
+                      db.Index(None, 'event_id', 'modified_dt'),
                       db.ForeignKeyConstraint(['event_id', 'registration_form_id'],
                                               ['event_registration.forms.event_id', 'event_registration.forms.id']),
                       {'schema': 'event_registration'})
@@ -186,6 +188,22 @@ class Registration(db.Model):
         UTCDateTime,
         nullable=True
     )
+    #: The ID of the file containing the generated ticket
+    ticket_file_id = db.Column(
+        db.Integer,
+        db.ForeignKey('indico.files.id'),
+        index=True,
+        nullable=True
+    )
+    #: The date/time when the registration was last modified.  This
+    #: is updated automatically whenever the registration is updated,
+    #: but needs to be set explicitly if only its data changes.
+    modified_dt = db.Column(
+        UTCDateTime,
+        nullable=False,
+        default=now_utc,
+        onupdate=now_utc
+    )
 
     #: The Event containing this registration
     event = db.relationship(
@@ -213,6 +231,17 @@ class Registration(db.Model):
         foreign_keys=[transaction_id],
         post_update=True
     )
+    #: The file containing the generated ticket of the registration;
+    #: it is replaced whenever the ticket content changes
+    ticket_file = db.relationship(
+        'File',
+        lazy=True,
+        backref=db.backref(
+            'ticket_of_registration',
+            lazy=True,
+            uselist=False
+        )
+    )
     #: The registration this data is associated with
     data = db.relationship(
         'RegistrationData',
@@ -228,6 +257,7 @@ class Registration(db.Model):
     # - invitation (RegistrationInvitation.registration)
     # - legacy_mapping (LegacyRegistrationMapping.registration)
     # - registration_form (RegistrationForm.registrations)
+    # - search_data (RegistrationSearchData.registration)
     # - transactions (PaymentTransaction.registration)
 
     @classmethod
@@ -472,6 +502,16 @@ class Registration(db.Model):
         if self.state != initial_state:
             signals.event.registration_state_updated.send(self, previous_state=initial_state)
 
+    def update_search_data(self):
+        """Update the flattened data used to filter registrations.
+
+        This needs to be called whenever the data of the registration
+        has been modified.
+        """
+        if self.search_data is None:
+            self.search_data = RegistrationSearchData()
+        self.search_data.populate_from_registration(self)
+
     def update_state(self, approved=None, paid=None, rejected=None, withdrawn=None, _skip_moderation=False):
         """Update the state of the registration for a given action.
 
@@ -0,0 +1,91 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from sqlalchemy.dialects.postgresql import JSONB
+
+from indico.core.db import db
+from indico.modules.events.registration.models.items import PersonalDataType
+from indico.util.string import format_repr, return_ascii
+
+
+class RegistrationSearchData(db.Model):
+    """Flattened data of a registration used for filtering and stats.
+
+    Each registration has exactly one row containing the data of all
+    its fields keyed by field id, so filtering the registration list
+    or counting values does not need to query the data of each field
+    separately.  It is updated whenever a registration is created or
+    modified.
+    """
+
+    __tablename__ = 'registration_search_data'
+    __table_args__ = {'schema': 'event_registration'}
+
+    #: The ID of the registration
+    registration_id = db.Column(
+        db.Integer,
+        db.ForeignKey('event_registration.registrations.id'),
+        primary_key=True,
+        autoincrement=False
+    )
+    #: The ID of the registration form
+    registration_form_id = db.Column(
+        db.Integer,
+        db.ForeignKey('event_registration.forms.id'),
+        index=True,
+        nullable=False
+    )
+    #: The data of the registration's fields, keyed by field id
+    data = db.Column(
+        JSONB,
+        nullable=False,
+        default={}
+    )
+    #: The country code from the registration's personal data
+    country = db.Column(
+        db.String,
+        index=True,
+        nullable=True
+    )
+
+    #: The registration this data belongs to
+    registration = db.relationship(
+        'Registration',
+        lazy=True,
+        backref=db.backref(
+            'search_data',
+            lazy=True,
+            uselist=False,
+            cascade='all, delete-orphan'
+        )
+    )
+    #: The registration form of the registration
+    registration_form = db.relationship(
+        'RegistrationForm',
+        lazy=True
+    )
+
+    @return_ascii
+    def __repr__(self):
+        return format_repr(self, 'registration_id', 'registration_form_id')
+
+    def populate_from_registration(self, registration):
+        """Update the data using the current data of a registration."""
+        data = {}
+        country = None
+        for reg_data in registration.data:
+            if reg_data.data is None:
+                continue
+            field = reg_data.field_data.field
+            data[unicode(field.id)] = reg_data.data
+            if field.personal_data_type == PersonalDataType.country:
+                country = reg_data.data or None
+        self.registration_form = registration.registration_form
+        self.data = data
+        self.country = country
@@ -10,7 +10,12 @@ from __future__ import division, unicode_literals
 from collections import defaultdict, namedtuple
 from itertools import chain, groupby
 
-from indico.modules.events.registration.models.registrations import RegistrationData
+from sqlalchemy.orm import contains_eager
+
+from indico.core.db import db
+from indico.modules.events.registration.models.registrations import Registration, RegistrationData
+from indico.modules.events.registration.models.search_data import RegistrationSearchData
+from indico.util.countries import get_country
 from indico.util.date_time import now_utc
 from indico.util.i18n import _
 
@@ -131,11 +136,15 @@ class FieldStats(object):
         return {choice['id']: choice for choice in field.current_data.versioned_data['choices']}
 
     def _get_registration_data(self, field):
-        registration_ids = [r.id for r in field.registration_form.active_registrations]
         field_data_ids = [data.id for data in field.data_versions]
-        return RegistrationData.find_all(RegistrationData.registration_id.in_(registration_ids),
-                                         RegistrationData.field_data_id.in_(field_data_ids),
-                                         RegistrationData.data != {})
+        return (RegistrationData.query
+                .join(RegistrationData.registration)
+                .filter(Registration.registration_form_id == field.registration_form.id,
+                        Registration.is_active,
+                        RegistrationData.field_data_id.in_(field_data_ids),
+                        RegistrationData.data != {})
+                .options(contains_eager(RegistrationData.registration))
+                .all())
 
     def _build_data(self):
         """Build data from registration data and field choices.
@@ -305,11 +314,17 @@ class OverviewStats(StatsBase):
         self.days_left = max((self.regform.end_dt - now_utc()).days, 0) if self.regform.end_dt else 0
 
     def _get_countries(self):
+        query = (db.session.query(RegistrationSearchData.country, db.func.count())
+                 .join(RegistrationSearchData.registration)
+                 .filter(RegistrationSearchData.registration_form_id == self.regform.id,
+                         RegistrationSearchData.country.isnot(None),
+                         Registration.is_active)
+                 .group_by(RegistrationSearchData.country))
         countries = defaultdict(int)
-        for country, regs in groupby(self.registrations, lambda x: x.get_personal_data().get('country')):
-            if country is None:
-                continue
-            countries[country] += sum(1 for x in regs)
+        for code, count in query:
+            name = get_country(code)
+            if name is not None:
+                countries[name] += count
         if not countries:
             return [], 0
         # Sort by highest number of people per country then alphabetically per countries' name
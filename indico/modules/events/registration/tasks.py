@@ -0,0 +1,89 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from sqlalchemy.orm import joinedload
+
+from indico.core.celery import celery
+from indico.core.db import db
+from indico.modules.events.registration.models.registrations import Registration
+from indico.modules.events.registration.notifications import notify_registration_creation
+from indico.modules.events.registration.util import generate_ticket, iter_import_registrations
+from indico.util.struct.iterables import grouper
+
+
+#: The number of registrations whose tickets are generated in one task
+TICKET_BATCH_SIZE = 25
+
+
+@celery.task(bind=True, ignore_result=False)
+def import_registrations_task(self, regform, rows, skip_moderation, notify_users, user):
+    """Import registrations in the background.
+
+    The registrations are committed in chunks and the progress is
+    available in the task's metadata (``done`` and ``total``).  The
+    notifications for each chunk are sent in a separate task.
+    """
+    total = len(rows)
+    done = 0
+    self.update_state(state='PROGRESS', meta={'done': done, 'total': total})
+    for registrations in iter_import_registrations(regform, rows, skip_moderation, user=user):
+        registration_ids = [r.id for r in registrations]
+        db.session.commit()
+        # the notifications are sent in small batches so the tickets
+        # attached to them are generated by many workers in parallel
+        for batch in grouper(registration_ids, TICKET_BATCH_SIZE, skip_missing=True):
+            if notify_users or regform.manager_notifications_enabled:
+                send_registration_notifications.delay(batch, notify_users)
+            elif regform.tickets_enabled:
+                generate_tickets.delay(batch)
+        done += len(registration_ids)
+        self.update_state(state='PROGRESS', meta={'done': done, 'total': total})
+    return {'done': done, 'total': total}
+
+
+@celery.task(request_context=True)
+def send_registration_notifications(registration_ids, notify_users):
+    """Send the notifications about new registrations.
+
+    All emails are sent in batches once the task has finished.
+    """
+    registrations = (Registration.query
+                     .filter(Registration.id.in_(registration_ids))
+                     .options(joinedload('registration_form'))
+                     .order_by(Registration.id))
+    for registration in registrations:
+        notify_registration_creation(registration, notify_users)
+    db.session.commit()
+
+
+@celery.task(request_context=True)
+def generate_tickets(registration_ids):
+    """Generate and store the tickets of registrations.
+
+    Tickets which have already been generated and are up to date are
+    not generated again.
+    """
+    registrations = (Registration.query
+                     .filter(Registration.id.in_(registration_ids), Registration.is_active)
+                     .options(joinedload('registration_form'), joinedload('ticket_file'))
+                     .order_by(Registration.id))
+    for registration in registrations:
+        generate_ticket(registration)
+    db.session.commit()
+
+
+def schedule_ticket_generation(registrations):
+    """Generate the tickets of many registrations in the background.
+
+    The registrations are split into small batches which are processed
+    by separate tasks, so the tickets are generated in parallel.
+    """
+    registration_ids = [r.id for r in registrations]
+    for batch in grouper(registration_ids, TICKET_BATCH_SIZE, skip_missing=True):
+        generate_tickets.delay(batch)
@@ -9,21 +9,29 @@ from __future__ import unicode_literals
 
 import csv
 import itertools
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+from hashlib import sha1
+from io import BytesIO
 from operator import attrgetter
+from uuid import UUID
 
 from flask import current_app, json, session
+from PIL import Image
 from qrcode import QRCode, constants
 from sqlalchemy import and_, or_
-from sqlalchemy.orm import joinedload, load_only, undefer
+from sqlalchemy.orm import joinedload, load_only, selectinload, undefer
 from werkzeug.urls import url_parse
 from wtforms import BooleanField, ValidationError
 
 from indico.core import signals
 from indico.core.config import config
 from indico.core.db import db
+from indico.core.db.sqlalchemy.util.queries import increment_and_get
 from indico.core.db.sqlalchemy.util.session import no_autoflush
 from indico.core.errors import UserValueError
+from indico.core.storage import StorageError
+from indico.legacy.common.cache import GenericCache
 from indico.modules.events import EventLogKind, EventLogRealm
 from indico.modules.events.models.events import Event
 from indico.modules.events.models.persons import EventPerson
@@ -41,15 +49,32 @@ from indico.modules.events.registration.models.items import (PersonalDataType, R
 from indico.modules.events.registration.models.registrations import Registration, RegistrationData, RegistrationState
 from indico.modules.events.registration.notifications import (notify_registration_creation,
                                                               notify_registration_modification)
+from indico.modules.files.models.files import File
+from indico.modules.users.models.emails import UserEmail
+from indico.modules.users.models.users import User
 from indico.modules.users.util import get_user_by_email
-from indico.util.date_time import format_date
+from indico.util.date_time import format_date, now_utc
 from indico.util.i18n import _
+from indico.util.placeholders import get_placeholders
 from indico.util.spreadsheets import unique_col
 from indico.util.string import to_unicode, validate_email, validate_email_verbose
+from indico.util.struct.iterables import grouper
 from indico.web.forms.base import IndicoForm
 from indico.web.forms.widgets import SwitchWidget
 
 
+#: How long the mapping from ticket UUIDs to registrations and the
+#: ticket QR codes are cached
+TICKET_CACHE_TTL = timedelta(days=1)
+#: The number of registrations created at once when importing registrations
+IMPORT_CHUNK_SIZE = 500
+#: Imports with more registrations than this run in a background task
+BACKGROUND_IMPORT_THRESHOLD = 200
+
+_ticket_cache = GenericCache('registration-tickets')
+_ticket_qr_cache = GenericCache('registration-ticket-qr-codes')
+
+
 def get_title_uuid(regform, title):
     """Convert a string title to its UUID value.
 
@@ -208,14 +233,8 @@ def url_rule_to_angular(endpoint):
     return prefix + ''.join(segments).split('|', 1)[-1]
 
 
-@no_autoflush
-def create_registration(regform, data, invitation=None, management=False, notify_user=True, skip_moderation=None):
-    user = session.user if session else None
-    registration = Registration(registration_form=regform, user=get_user_by_email(data['email']),
-                                base_price=regform.base_price, currency=regform.currency)
-    if skip_moderation is None:
-        skip_moderation = management
-    for form_item in regform.active_fields:
+def _set_registration_data(registration, form_items, data):
+    for form_item in form_items:
         if form_item.parent.is_manager_only:
             value = form_item.field_impl.default_value
         else:
@@ -226,6 +245,16 @@ def create_registration(regform, data, invitation=None, management=False, notify
             setattr(data_entry, attr, value)
         if form_item.type == RegistrationFormItemType.field_pd and form_item.personal_data_type.column:
             setattr(registration, form_item.personal_data_type.column, value)
+
+
+@no_autoflush
+def create_registration(regform, data, invitation=None, management=False, notify_user=True, skip_moderation=None):
+    user = session.user if session else None
+    registration = Registration(registration_form=regform, user=get_user_by_email(data['email']),
+                                base_price=regform.base_price, currency=regform.currency)
+    if skip_moderation is None:
+        skip_moderation = management
+    _set_registration_data(registration, regform.active_fields, data)
     if invitation is None:
         # Associate invitation based on email in case the user did not use the link
         invitation = (RegistrationInvitation
@@ -236,6 +265,7 @@ def create_registration(regform, data, invitation=None, management=False, notify
         invitation.state = InvitationState.accepted
         invitation.registration = registration
     registration.sync_state(_skip_moderation=skip_moderation)
+    registration.update_search_data()
     db.session.flush()
     signals.event.registration_created.send(registration, management=management, data=data)
     notify_registration_creation(registration, notify_user)
@@ -281,6 +311,8 @@ def modify_registration(registration, data, management=False, notify_user=True):
                 personal_data_changes[key] = value
             setattr(registration, key, value)
     registration.sync_state()
+    registration.update_search_data()
+    registration.modified_dt = now_utc()
     db.session.flush()
     # sanity check
     if billable_items_locked and old_price != registration.price:
@@ -410,6 +442,116 @@ def build_registrations_api_data(event):
     return api_data
 
 
+def build_registrations_api_changes(event, since):
+    """Get the registrants of an event which changed since a given time.
+
+    :param event: The event to get the registrants for
+    :param since: A `datetime`; only registrants modified at or after
+                  this time are returned
+    :return: A tuple containing the API data of the registrants which
+             were created or updated and the IDs of the registrants
+             which have been deleted (or are otherwise not active
+             anymore).
+    """
+    query = (Registration.query.with_parent(event)
+             .filter(Registration.modified_dt >= since)
+             .options(joinedload('registration_form'),
+                      selectinload('data').joinedload('field_data').joinedload('field'))
+             .order_by(Registration.modified_dt, Registration.id))
+    registrants = []
+    removed_ids = []
+    for registration in query:
+        if registration.is_active and not registration.registration_form.is_deleted:
+            registrants.append(_build_base_registration_info(registration))
+        else:
+            removed_ids.append(str(registration.id))
+    return registrants, removed_ids
+
+
+def get_registration_ids_by_ticket(event, ticket_uuids):
+    """Get the registration IDs for many ticket UUIDs at once.
+
+    The mapping is cached since the ticket of a registration never
+    changes, so during check-in only tickets which have not been seen
+    before require a database query.
+
+    :param event: The event the tickets belong to
+    :param ticket_uuids: A collection of ticket UUIDs
+    :return: A dict mapping the (normalized) ticket UUIDs to
+             registration IDs; unknown or invalid UUIDs are not
+             included.
+    """
+    ticket_uuids = set(filter(None, map(_normalize_uuid, ticket_uuids)))
+    if not ticket_uuids:
+        return {}
+    cached = _ticket_cache.get_multi(['{}:{}'.format(event.id, ticket_uuid) for ticket_uuid in ticket_uuids])
+    mapping = {key.split(':', 1)[1]: registration_id
+               for key, registration_id in cached.iteritems()
+               if registration_id is not None}
+    missing = ticket_uuids - mapping.viewkeys()
+    if missing:
+        query = (db.session.query(Registration.ticket_uuid, Registration.id)
+                 .filter(Registration.event_id == event.id,
+                         Registration.ticket_uuid.in_(missing)))
+        found = dict(query)
+        _ticket_cache.set_multi({'{}:{}'.format(event.id, ticket_uuid): registration_id
+                                 for ticket_uuid, registration_id in found.iteritems()},
+                                TICKET_CACHE_TTL)
+        mapping.update(found)
+    return mapping
+
+
+def _normalize_uuid(value):
+    try:
+        return unicode(UUID(value))
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def check_in_registrations(event, ticket_uuids, checked_in=True):
+    """Update the check-in state of many registrations at once.
+
+    Updating a registration which is already in the requested state does
+    not change anything, so the same tickets can be submitted again e.g.
+    by a scanner retrying a failed request.
+
+    :param event: The event the tickets belong to
+    :param ticket_uuids: A list of ticket UUIDs
+    :param checked_in: Whether the registrations are checked in or
+                       their check-in is reset
+    :return: A list containing a dict with the result for each ticket.
+             Its ``status`` is one of ``updated``, ``unchanged``,
+             ``not_found`` and ``not_allowed``.
+    """
+    registration_ids = get_registration_ids_by_ticket(event, ticket_uuids)
+    registrations = {}
+    if registration_ids:
+        query = (Registration.query.with_parent(event)
+                 .filter(Registration.id.in_(set(registration_ids.itervalues())), ~Registration.is_deleted))
+        registrations = {r.ticket_uuid: r for r in query}
+    results = []
+    for ticket_uuid in ticket_uuids:
+        registration = registrations.get(_normalize_uuid(ticket_uuid))
+        result = {'checkin_secret': ticket_uuid}
+        if registration is None:
+            result['status'] = 'not_found'
+            results.append(result)
+            continue
+        result['registrant_id'] = str(registration.id)
+        if registration.state not in (RegistrationState.complete, RegistrationState.unpaid):
+            result['status'] = 'not_allowed'
+        elif registration.checked_in == checked_in:
+            result['status'] = 'unchanged'
+        else:
+            registration.checked_in = checked_in
+            signals.event.registration_checkin_updated.send(registration)
+            result['status'] = 'updated'
+        result['checked_in'] = registration.checked_in
+        result['checkin_date'] = registration.checked_in_dt.isoformat() if registration.checked_in_dt else ''
+        results.append(result)
+    return results
+
+
 def _build_base_registration_info(registration):
     personal_data = _build_personal_data(registration)
     return {
@@ -441,17 +583,11 @@ def build_registration_api_data(registration):
     return registration_info
 
 
-def generate_ticket_qr_code(registration):
-    """Generate a Pillow `Image` with a QR Code encoding a check-in ticket.
+def get_ticket_qr_data(registration):
+    """Get the data encoded in the QR code of a check-in ticket.
 
     :param registration: corresponding `Registration` object
     """
-    qr = QRCode(
-        version=17,
-        error_correction=constants.ERROR_CORRECT_Q,
-        box_size=3,
-        border=1
-    )
     qr_data = {
         "registrant_id": registration.id,
         "checkin_secret": registration.ticket_uuid,
@@ -460,10 +596,35 @@ def generate_ticket_qr_code(registration):
         "version": 1
     }
     signals.event.registration.generate_ticket_qr_code.send(registration, ticket_data=qr_data)
-    json_qr_data = json.dumps(qr_data)
+    return qr_data
+
+
+def generate_ticket_qr_code(registration):
+    """Generate a Pillow `Image` with a QR Code encoding a check-in ticket.
+
+    Rendering the QR code is slow, so the generated image is cached
+    based on the data it contains.
+
+    :param registration: corresponding `Registration` object
+    """
+    json_qr_data = json.dumps(get_ticket_qr_data(registration), sort_keys=True)
+    cache_key = sha1(json_qr_data).hexdigest()
+    png_data = _ticket_qr_cache.get(cache_key)
+    if png_data is not None:
+        return Image.open(BytesIO(png_data))
+    qr = QRCode(
+        version=17,
+        error_correction=constants.ERROR_CORRECT_Q,
+        box_size=3,
+        border=1
+    )
     qr.add_data(json_qr_data)
     qr.make(fit=True)
-    return qr.make_image()._img
+    image = qr.make_image()._img
+    buf = BytesIO()
+    image.save(buf, 'PNG')
+    _ticket_qr_cache.set(cache_key, buf.getvalue(), TICKET_CACHE_TTL)
+    return image
 
 
 def get_event_regforms(event, user, with_registrations=False, only_in_acl=False):
@@ -519,11 +680,29 @@ def get_event_regforms_registrations(event, user, include_scheduled=True, only_i
     return displayed_regforms, dict(all_regforms)
 
 
-def generate_ticket(registration):
+def _get_ticket_template(registration):
     from indico.modules.designer.util import get_default_ticket_on_category
+    return (registration.registration_form.ticket_template or
+            get_default_ticket_on_category(registration.event.category))
+
+
+def _get_ticket_fingerprint(registration, template):
+    """Get a hash which changes whenever the ticket content changes."""
+    from indico.modules.events.registration.controllers.management.tickets import DEFAULT_TICKET_PRINTING_SETTINGS
+    placeholders = get_placeholders('designer-fields')
+    data = [DEFAULT_TICKET_PRINTING_SETTINGS]
+    for tpl in filter(None, (template, template.backside_template)):
+        data.append([tpl.id, tpl.data, tpl.background_image_id])
+        for item in tpl.data['items']:
+            placeholder = placeholders.get(item['type'])
+            if placeholder is not None:
+                obj = registration if placeholder.group == 'registrant' else registration.event
+                data.append([item['type'], placeholder.get_fingerprint(obj)])
+    return sha1(json.dumps(data, sort_keys=True, default=unicode)).hexdigest()
+
+
+def _render_ticket(registration, template):
     from indico.modules.events.registration.controllers.management.tickets import DEFAULT_TICKET_PRINTING_SETTINGS
-    template = (registration.registration_form.ticket_template or
-                get_default_ticket_on_category(registration.event.category))
     registrations = [registration]
     signals.event.designer.print_badge_template.send(template, regform=registration.registration_form,
                                                      registrations=registrations)
@@ -532,6 +711,64 @@ def generate_ticket(registration):
     return pdf.get_pdf()
 
 
+def _store_ticket(registration, pdf, fingerprint, outdated_ticket_file):
+    ticket_file = File(filename='ticket-{}.pdf'.format(registration.friendly_id), content_type='application/pdf',
+                       meta={'registration_id': registration.id, 'fingerprint': fingerprint})
+    context = ('event', registration.event_id, 'registrations', registration.registration_form_id,
+               registration.id, 'tickets')
+    ticket_file.save(context, pdf)
+    pdf.seek(0)
+    ticket_file.claim()
+    db.session.add(ticket_file)
+    db.session.flush()
+    # the ticket is only replaced if no other worker stored a new one in
+    # the meantime.  replacing the ticket file is not a modification of the
+    # registration, so its modification date is kept
+    outdated_ticket_file_id = outdated_ticket_file.id if outdated_ticket_file is not None else None
+    updated = (Registration.query
+               .filter_by(id=registration.id, ticket_file_id=outdated_ticket_file_id)
+               .update({Registration.ticket_file_id: ticket_file.id,
+                        Registration.modified_dt: Registration.modified_dt},
+                       synchronize_session=False))
+    db.session.expire(registration, ['ticket_file_id', 'ticket_file'])
+    if updated:
+        stale_ticket_file = outdated_ticket_file
+    else:
+        # the ticket stored by the other worker is kept
+        stale_ticket_file = ticket_file
+    if stale_ticket_file is not None:
+        # unclaimed files are deleted automatically
+        stale_ticket_file.claimed = False
+
+
+def generate_ticket(registration):
+    """Get the PDF ticket of a registration.
+
+    Generated tickets are stored and reused until their content (the
+    registration's data used on the ticket or the ticket template)
+    changes.
+
+    :return: A `BytesIO` containing the PDF
+    """
+    template = _get_ticket_template(registration)
+    fingerprint = _get_ticket_fingerprint(registration, template)
+    ticket_file = registration.ticket_file
+    if ticket_file is not None and ticket_file.meta.get('fingerprint') == fingerprint:
+        try:
+            with ticket_file.open() as f:
+                return BytesIO(f.read())
+        except StorageError:
+            logger.exception('Could not read stored ticket of %s', registration)
+    pdf = _render_ticket(registration, template)
+    if registration.id is not None:
+        try:
+            _store_ticket(registration, pdf, fingerprint, ticket_file)
+        except StorageError:
+            logger.exception('Could not store ticket of %s', registration)
+            pdf.seek(0)
+    return pdf
+
+
 def get_ticket_attachments(registration):
     return [('Ticket.pdf', generate_ticket(registration).getvalue())]
 
@@ -551,13 +788,28 @@ def update_regform_item_positions(regform):
             child.position = next(positions if child_active else disabled_positions)
 
 
-def import_registrations_from_csv(regform, fileobj, skip_moderation=True, notify_users=False):
-    """Import event registrants from a CSV file into a form."""
-    reader = csv.reader(fileobj.read().splitlines())
+def _iter_csv_lines(fileobj):
+    # read the file line by line instead of loading it at once, but
+    # still support files which do not use `\n` as the line separator
+    for line in fileobj:
+        for subline in line.splitlines():
+            yield subline
+
+
+def parse_registrations_csv(regform, fileobj):
+    """Read and validate the registrations in a CSV file.
+
+    :param regform: The registration form the registrations will be
+                    imported into
+    :param fileobj: A file-like object containing the CSV data
+    :return: A list containing the registration data of each row
+    :raise UserValueError: if any row contains invalid data
+    """
+    reader = csv.reader(_iter_csv_lines(fileobj))
     query = db.session.query(Registration.email).with_parent(regform).filter(Registration.is_active)
     registered_emails = {email for (email,) in query}
     used_emails = set()
-    todo = []
+    rows = []
     for row_num, row in enumerate(reader, 1):
         try:
             first_name, last_name, affiliation, position, phone, email = [to_unicode(value).strip() for value in row]
@@ -578,7 +830,7 @@ def import_registrations_from_csv(regform, fileobj, skip_moderation=True, notify
             raise UserValueError(_('Row {}: email address is not unique').format(row_num))
 
         used_emails.add(email)
-        todo.append({
+        rows.append({
             'email': email,
             'first_name': first_name.title(),
             'last_name': last_name.title(),
@@ -586,8 +838,107 @@ def import_registrations_from_csv(regform, fileobj, skip_moderation=True, notify
             'phone': phone,
             'position': position
         })
-    return [create_registration(regform, data, notify_user=notify_users, skip_moderation=skip_moderation)
-            for data in todo]
+    return rows
+
+
+def _get_users_by_email(emails):
+    """Get the users for many email addresses at once.
+
+    Like in :func:`.get_user_by_email`, emails used by more than one
+    user are ignored.
+    """
+    query = (db.session.query(UserEmail.email, User)
+             .join(UserEmail.user)
+             .filter(~User.is_deleted, UserEmail.email.in_(emails)))
+    users = defaultdict(set)
+    for email, user in query:
+        users[email].add(user)
+    return {email: next(iter(email_users)) for email, email_users in users.iteritems() if len(email_users) == 1}
+
+
+@no_autoflush
+def iter_import_registrations(regform, rows, skip_moderation=True, user=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """Create registrations from imported data.
+
+    Unlike :func:`create_registration` this function processes many
+    registrations at once: users, invitations and friendly ids are
+    looked up and assigned once per chunk, the registrations are
+    inserted with a single flush per chunk, only one log entry is
+    written for each chunk and no notifications are sent, so the
+    caller can send them e.g. in a background task once the new
+    registrations have been committed.
+
+    :param regform: The registration form to add the registrations to
+    :param rows: The registration data as returned by
+                 :func:`parse_registrations_csv`
+    :param skip_moderation: Whether the registrations should skip
+                            moderation
+    :param user: The user who imports the registrations
+    :param chunk_size: The number of registrations to create at once
+    :return: An iterator yielding the list of registrations created
+             for each chunk
+    """
+    form_items = regform.active_fields
+    for chunk in grouper(rows, chunk_size, skip_missing=True):
+        emails = {data['email'] for data in chunk}
+        users = _get_users_by_email(emails)
+        invitations = {invitation.email: invitation
+                       for invitation in (RegistrationInvitation.query
+                                          .with_parent(regform)
+                                          .filter(RegistrationInvitation.email.in_(emails),
+                                                  RegistrationInvitation.registration_id.is_(None)))}
+        # reserve all friendly ids at once instead of updating the event for each registration
+        last_friendly_id = increment_and_get(Event._last_friendly_registration_id, Event.id == regform.event_id,
+                                             len(chunk))
+        friendly_ids = itertools.count(last_friendly_id - len(chunk) + 1)
+        registrations = []
+        for data in chunk:
+            registration = Registration(registration_form=regform, user=users.get(data['email']),
+                                        friendly_id=next(friendly_ids), base_price=regform.base_price,
+                                        currency=regform.currency)
+            _set_registration_data(registration, form_items, data)
+            invitation = invitations.get(data['email'])
+            if invitation:
+                invitation.state = InvitationState.accepted
+                invitation.registration = registration
+            registration.sync_state(_skip_moderation=skip_moderation)
+            registration.update_search_data()
+            registrations.append(registration)
+        db.session.add_all(registrations)
+        db.session.flush()
+        for registration, data in zip(registrations, chunk):
+            signals.event.registration_created.send(registration, management=False, data=data)
+        logger.info('Imported %d registrations into %s by %s', len(registrations), regform, user)
+        regform.event.log(EventLogRealm.management, EventLogKind.positive, 'Registration',
+                          'Imported {} registrations'.format(len(registrations)), user,
+                          data={'Registration form': regform.title,
+                                'Emails': ', '.join(r.email for r in registrations)})
+        yield registrations
+
+
+def import_registrations(regform, rows, skip_moderation=True, notify_users=False):
+    """Import registrations into a form.
+
+    :param regform: The registration form to add the registrations to
+    :param rows: The registration data as returned by
+                 :func:`parse_registrations_csv`
+    :param skip_moderation: Whether the registrations should skip
+                            moderation
+    :param notify_users: Whether to notify the registrants
+    :return: The list of new registrations
+    """
+    user = session.user if session else None
+    registrations = list(itertools.chain.from_iterable(iter_import_registrations(regform, rows, skip_moderation,
+                                                                                 user=user)))
+    for registration in registrations:
+        notify_registration_creation(registration, notify_users)
+    return registrations
+
+
+def import_registrations_from_csv(regform, fileobj, skip_moderation=True, notify_users=False):
+    """Import event registrants from a CSV file into a form."""
+    rows = parse_registrations_csv(regform, fileobj)
+    return import_registrations(regform, rows, skip_moderation=skip_moderation, notify_users=notify_users)
 
 
 def get_registered_event_persons(event):
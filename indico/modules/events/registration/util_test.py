@@ -9,14 +9,23 @@ from __future__ import unicode_literals
 
 from datetime import datetime
 from io import BytesIO
+from uuid import uuid4
 
 import pytest
+import pytz
 
 from indico.core.db import db
 from indico.core.errors import UserValueError
 from indico.modules.events.models.persons import EventPerson
-from indico.modules.events.registration.util import (create_registration, get_event_regforms_registrations,
-                                                     get_registered_event_persons, import_registrations_from_csv)
+from indico.modules.events.registration.models.invitations import InvitationState, RegistrationInvitation
+from indico.modules.events.registration.models.items import PersonalDataType
+from indico.modules.events.registration.models.registrations import RegistrationState
+from indico.modules.events.registration.util import (_store_ticket, build_registrations_api_changes,
+                                                     check_in_registrations, create_registration, generate_ticket,
+                                                     get_event_regforms_registrations, get_registered_event_persons,
+                                                     import_registrations_from_csv, iter_import_registrations,
+                                                     parse_registrations_csv)
+from indico.modules.files.models.files import File
 
 
 pytest_plugins = 'indico.modules.events.registration.testing.fixtures'
@@ -54,6 +63,32 @@ def test_import_registrations(dummy_regform, dummy_user):
     assert 'phone' not in data
 
 
+def test_import_registrations_chunks(dummy_regform, dummy_user):
+    invitation = RegistrationInvitation(registration_form=dummy_regform, email='jane@example.com',
+                                        first_name='Jane', last_name='Smith', affiliation='ACME Inc.')
+    db.session.flush()
+    create_registration(dummy_regform, {
+        'email': 'boss@example.com',
+        'first_name': 'Big',
+        'last_name': 'Boss'
+    }, notify_user=False)
+    csv = b'\r\n'.join([b'John,Doe,ACME Inc.,Regional Manager,+1-202-555-0140,jdoe@example.com',
+                        b'Jane,Smith,ACME Inc.,CEO,,jane@example.com',
+                        b'Billy Bob,Doe,,,,1337@example.COM'])
+    rows = parse_registrations_csv(dummy_regform, BytesIO(csv))
+    assert [row['email'] for row in rows] == ['jdoe@example.com', 'jane@example.com', '1337@example.com']
+    chunks = list(iter_import_registrations(dummy_regform, rows, chunk_size=2))
+    assert [len(chunk) for chunk in chunks] == [2, 1]
+    registrations = chunks[0] + chunks[1]
+    assert [r.friendly_id for r in registrations] == [2, 3, 4]
+    assert all(r.id is not None for r in registrations)
+    assert [r.user for r in registrations] == [None, None, dummy_user]
+    assert invitation.registration == registrations[1]
+    assert invitation.state == InvitationState.accepted
+    email_field = next(f for f in dummy_regform.active_fields if f.personal_data_type == PersonalDataType.email)
+    assert registrations[0].search_data.data[unicode(email_field.id)] == 'jdoe@example.com'
+
+
 def test_import_error(dummy_regform):
     create_registration(dummy_regform, {
         'email': 'boss@example.com',
@@ -196,3 +231,93 @@ def test_get_registered_event_persons(dummy_event, dummy_user, dummy_regform):
 
     registered_persons = get_registered_event_persons(dummy_event)
     assert registered_persons == {user_person, no_user_person}
+
+
+def _create_registrations(regform, n):
+    return [create_registration(regform, {
+        'email': 'user{}@example.com'.format(i),
+        'first_name': 'User',
+        'last_name': unicode(i)
+    }, notify_user=False) for i in range(n)]
+
+
+def test_check_in_registrations(dummy_event, dummy_regform):
+    registrations = _create_registrations(dummy_regform, 3)
+    registrations[2].state = RegistrationState.pending
+    tickets = [registrations[0].ticket_uuid, registrations[1].ticket_uuid.upper(), registrations[2].ticket_uuid,
+               'not-a-uuid', unicode(uuid4())]
+    results = check_in_registrations(dummy_event, tickets)
+    assert [r['status'] for r in results] == ['updated', 'updated', 'not_allowed', 'not_found', 'not_found']
+    assert [r['checkin_secret'] for r in results] == tickets
+    assert results[0]['registrant_id'] == unicode(registrations[0].id)
+    assert [r.checked_in for r in registrations] == [True, True, False]
+    # submitting the same tickets again does not change anything
+    results = check_in_registrations(dummy_event, tickets[:2])
+    assert [r['status'] for r in results] == ['unchanged', 'unchanged']
+    results = check_in_registrations(dummy_event, tickets[:1], checked_in=False)
+    assert [r['status'] for r in results] == ['updated']
+    assert not registrations[0].checked_in
+
+
+def test_build_registrations_api_changes(dummy_event, dummy_regform, freeze_time):
+    freeze_time(datetime(2020, 11, 9, 12, 0, 0))
+    registrations = _create_registrations(dummy_regform, 3)
+    db.session.flush()
+    freeze_time(datetime(2020, 11, 9, 13, 0, 0))
+    since = pytz.utc.localize(datetime(2020, 11, 9, 12, 30, 0))
+    assert build_registrations_api_changes(dummy_event, since) == ([], [])
+    registrations[0].checked_in = True
+    registrations[1].is_deleted = True
+    db.session.flush()
+    registrants, removed_ids = build_registrations_api_changes(dummy_event, since)
+    assert [r['registrant_id'] for r in registrants] == [unicode(registrations[0].id)]
+    assert registrants[0]['checked_in']
+    assert removed_ids == [unicode(registrations[1].id)]
+
+
+def test_generate_ticket_stored(mocker, dummy_reg):
+    mocker.patch('indico.modules.events.registration.util._get_ticket_template')
+    fingerprint = mocker.patch('indico.modules.events.registration.util._get_ticket_fingerprint',
+                               return_value='a')
+    render = mocker.patch('indico.modules.events.registration.util._render_ticket',
+                          side_effect=lambda *args: BytesIO(b'ticket-{}'.format(render.call_count)))
+    db.session.flush()
+    modified_dt = dummy_reg.modified_dt
+    assert generate_ticket(dummy_reg).read() == b'ticket-1'
+    # storing the ticket does not modify the registration
+    db.session.expire(dummy_reg)
+    assert dummy_reg.modified_dt == modified_dt
+    ticket_file = dummy_reg.ticket_file
+    assert ticket_file.claimed
+    assert ticket_file.meta['fingerprint'] == 'a'
+    # the stored ticket is used as long as its content does not change
+    assert generate_ticket(dummy_reg).read() == b'ticket-1'
+    assert render.call_count == 1
+    fingerprint.return_value = 'b'
+    assert generate_ticket(dummy_reg).read() == b'ticket-2'
+    assert render.call_count == 2
+    assert dummy_reg.ticket_file != ticket_file
+    assert not ticket_file.claimed
+
+
+def test_generate_ticket_concurrent(mocker, dummy_reg):
+    mocker.patch('indico.modules.events.registration.util._get_ticket_template')
+    mocker.patch('indico.modules.events.registration.util._get_ticket_fingerprint', return_value='a')
+
+    def _render(*args):
+        # another worker stores the ticket while this one is rendering it
+        if render.call_count == 1:
+            _store_ticket(dummy_reg, BytesIO(b'other'), 'a', None)
+        return BytesIO(b'ticket')
+
+    render = mocker.patch('indico.modules.events.registration.util._render_ticket', side_effect=_render)
+    db.session.flush()
+    assert generate_ticket(dummy_reg).read() == b'ticket'
+    other_ticket_file = dummy_reg.ticket_file
+    assert other_ticket_file.claimed
+    with other_ticket_file.open() as f:
+        assert f.read() == b'other'
+    # the ticket of the losing worker is left for cleanup
+    lost_ticket_file = File.query.filter(File.id != other_ticket_file.id,
+                                         File.meta['registration_id'].astext == unicode(dummy_reg.id)).one()
+    assert not lost_ticket_file.claimed
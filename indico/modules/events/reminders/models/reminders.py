@@ -135,9 +135,15 @@ class EventReminder(db.Model):
         This includes both explicit recipients and, if enabled,
         participants of the event.
         """
+        from indico.modules.events.registration.models.forms import RegistrationForm
         recipients = set(self.recipients)
         if self.send_to_participants:
-            recipients.update(reg.email for reg in Registration.get_all_for_event(self.event))
+            query = (db.session.query(Registration.email)
+                     .join(Registration.registration_form)
+                     .filter(Registration.is_active,
+                             ~RegistrationForm.is_deleted,
+                             RegistrationForm.event_id == self.event_id))
+            recipients.update(email for email, in query)
         recipients.discard('')  # just in case there was an empty email address somewhere
         return recipients
 
@@ -0,0 +1,44 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+
+from indico.modules.events.registration.models.forms import RegistrationForm
+from indico.modules.events.registration.models.registrations import Registration, RegistrationState
+from indico.modules.events.reminders.models.reminders import EventReminder
+from indico.util.date_time import now_utc
+
+
+pytest_plugins = 'indico.modules.events.registration.testing.fixtures'
+
+
+def _create_registration(regform, email, state=RegistrationState.complete):
+    return Registration(registration_form=regform, first_name='Guinea', last_name='Pig', email=email,
+                        state=state, currency='USD')
+
+
+@pytest.mark.parametrize('send_to_participants', (True, False))
+def test_all_recipients(db, dummy_event, dummy_user, dummy_reg, create_event, send_to_participants):
+    regform = dummy_reg.registration_form
+    deleted_regform = RegistrationForm(event=dummy_event, title='Deleted', currency='USD', is_deleted=True)
+    other_regform = RegistrationForm(event=create_event(), title='Other', currency='USD')
+    db.session.flush()
+    _create_registration(regform, 'unpaid@example.com', RegistrationState.unpaid)
+    _create_registration(regform, 'withdrawn@example.com', RegistrationState.withdrawn)
+    _create_registration(regform, 'deleted@example.com').is_deleted = True
+    _create_registration(deleted_regform, 'deleted-form@example.com')
+    _create_registration(other_regform, 'other@example.com')
+    reminder = EventReminder(event=dummy_event, creator=dummy_user, scheduled_dt=now_utc(),
+                             reply_to_address='noreply@example.com', recipients=['foo@example.com', ''],
+                             send_to_participants=send_to_participants)
+    db.session.flush()
+    if send_to_participants:
+        assert reminder.all_recipients == {'foo@example.com', '1337@example.com', 'unpaid@example.com'}
+    else:
+        assert reminder.all_recipients == {'foo@example.com'}
@@ -17,12 +17,38 @@ from indico.modules.events.reminders.models.reminders import EventReminder
 from indico.util.date_time import now_utc
 
 
+def _query_due_reminders():
+    return (EventReminder.query
+            .join(EventReminder.event)
+            .filter(~EventReminder.is_sent, ~Event.is_deleted, EventReminder.scheduled_dt <= now_utc())
+            # reminders currently being sent are locked by the task sending them
+            .with_for_update(of=EventReminder, skip_locked=True))
+
+
 @celery.periodic_task(name='event_reminders', run_every=crontab(minute='*/5'))
 def send_event_reminders():
-    reminders = EventReminder.find_all(~EventReminder.is_sent, ~Event.is_deleted,
-                                       EventReminder.scheduled_dt <= now_utc(),
-                                       _join=EventReminder.event)
-    for reminder in reminders:
-        logger.info('Sending event reminder: %s', reminder)
-        reminder.send()
+    """Dispatch all due reminders to separate tasks.
+
+    Each reminder is sent (and marked as sent) in its own task, so many
+    reminders can be sent in parallel and a failing reminder does not
+    affect the other ones.
+    """
+    reminder_ids = [id_ for id_, in _query_due_reminders().with_entities(EventReminder.id)]
+    db.session.rollback()  # release the locks
+    if reminder_ids:
+        logger.info('Dispatching %d event reminders', len(reminder_ids))
+    for reminder_id in reminder_ids:
+        send_event_reminder.delay(reminder_id)
+
+
+@celery.task(name='event_reminder')
+def send_event_reminder(reminder_id):
+    # lock the reminder so it is not sent twice in case it has been
+    # dispatched again while still waiting to be sent
+    reminder = _query_due_reminders().filter(EventReminder.id == reminder_id).first()
+    if reminder is None:
+        logger.info('Event reminder %d is already being sent or not due anymore', reminder_id)
+        return
+    logger.info('Sending event reminder: %s', reminder)
+    reminder.send()
     db.session.commit()
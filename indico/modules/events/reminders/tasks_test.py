@@ -0,0 +1,70 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+
+import pytest
+
+from indico.modules.events.reminders.models.reminders import EventReminder
+from indico.modules.events.reminders.tasks import send_event_reminder, send_event_reminders
+from indico.util.date_time import now_utc
+
+
+@pytest.fixture
+def create_reminder(db, dummy_event, dummy_user):
+    def _create_reminder(event=dummy_event, delta=timedelta(hours=-1), **kwargs):
+        reminder = EventReminder(event=event, creator=dummy_user, scheduled_dt=(now_utc() + delta),
+                                 reply_to_address='noreply@example.com', recipients=['foo@example.com'], **kwargs)
+        db.session.flush()
+        return reminder
+
+    return _create_reminder
+
+
+@pytest.fixture
+def mock_send_email(mocker):
+    return mocker.patch('indico.modules.events.reminders.models.reminders.send_email')
+
+
+def test_send_event_reminders(mocker, db, create_event, create_reminder):
+    # the test transaction must survive releasing the locks
+    mocker.patch.object(db.session, 'rollback')
+    send_event_reminder = mocker.patch('indico.modules.events.reminders.tasks.send_event_reminder')
+    due = create_reminder()
+    create_reminder(delta=timedelta(hours=1))
+    create_reminder(is_sent=True)
+    deleted_event = create_event()
+    deleted_event.is_deleted = True
+    create_reminder(event=deleted_event)
+    send_event_reminders.run()
+    send_event_reminder.delay.assert_called_once_with(due.id)
+
+
+@pytest.mark.usefixtures('request_context')
+def test_send_event_reminder(create_reminder, mock_send_email):
+    reminder = create_reminder()
+    send_event_reminder.run(reminder.id)
+    assert reminder.is_sent
+    assert mock_send_email.call_count == 1
+    assert mock_send_email.call_args[0][0]['bcc'] == {'foo@example.com'}
+    # a reminder dispatched twice is only sent once
+    send_event_reminder.run(reminder.id)
+    assert mock_send_email.call_count == 1
+
+
+@pytest.mark.usefixtures('request_context')
+@pytest.mark.parametrize(('delta', 'is_sent'), (
+    (timedelta(hours=-1), True),
+    (timedelta(hours=1), False),
+))
+def test_send_event_reminder_not_due(create_reminder, mock_send_email, delta, is_sent):
+    reminder = create_reminder(delta=delta, is_sent=is_sent)
+    send_event_reminder.run(reminder.id)
+    assert reminder.is_sent == is_sent
+    assert not mock_send_email.called
@@ -12,14 +12,13 @@ import os
 import random
 import re
 import warnings
-from collections import defaultdict
-from contextlib import contextmanager
+from collections import defaultdict, namedtuple
+from contextlib import closing, contextmanager
 from copy import deepcopy
 from mimetypes import guess_extension
 from tempfile import NamedTemporaryFile
-from zipfile import ZipFile
 
-from flask import current_app, flash, g, redirect, request, session
+from flask import current_app, flash, g, redirect, request, session, stream_with_context
 from sqlalchemy import inspect
 from sqlalchemy.orm import load_only, noload
 from werkzeug.exceptions import BadRequest, Forbidden
@@ -51,8 +50,9 @@ from indico.util.fs import chmod_umask, secure_filename
 from indico.util.i18n import _
 from indico.util.string import strip_tags
 from indico.util.user import principal_from_fossil
+from indico.util.zipstream import StreamingZipFile, should_compress
 from indico.web.flask.templating import get_template_module
-from indico.web.flask.util import send_file, url_for
+from indico.web.flask.util import make_content_disposition_args, url_for
 from indico.web.forms.colors import get_colors
 
 
@@ -257,6 +257,29 @@ def update_object_principals(obj, new_principals, read_access=False, full_access
     return {'added': added, 'removed': removed}
 
 
+#: The number of list configurations kept in a user's session
+MAX_SESSION_LIST_CONFIGS = 20
+#: The session keys used for list configurations
+RE_LIST_CONFIG_SESSION_KEY = re.compile(r'^\w+_config_\d+$')
+
+
+def _remember_list_config(session_key):
+    """Keep only the most recently used list configurations in the session.
+
+    Without limiting them, a session would keep growing with the list
+    configuration of every event (or other list parent) a user manages.
+    Sessions created before the configurations were tracked may still
+    contain other ones, which are removed as well.
+    """
+    keys = [key for key in session.get('_list_configs', []) if key != session_key and key in session]
+    keys.append(session_key)
+    keys = keys[-MAX_SESSION_LIST_CONFIGS:]
+    for key in session.keys():
+        if RE_LIST_CONFIG_SESSION_KEY.match(key) and key not in keys:
+            del session[key]
+    session['_list_configs'] = keys
+
+
 class ListGeneratorBase(object):
     """Base class for classes performing actions on Indico object lists.
 
@@ -300,6 +323,7 @@ class ListGeneratorBase(object):
             configuration = StaticListLink.load(self.event, self.list_link_type, uuid)
             if configuration and configuration['entry_parent_id'] == self.entry_parent.id:
                 session[session_key] = configuration['data']
+                _remember_list_config(session_key)
         return session.get(session_key, self.default_list_config)
 
     def _split_item_ids(self, item_ids, separator_type=None):
@@ -381,6 +405,7 @@ class ListGeneratorBase(object):
         if request.values.get('visible_items'):
             visible_items = json.loads(request.values['visible_items'])
             self.list_config['items'] = sorted(visible_items)
+        _remember_list_config(session_key)
         session.modified = True
 
     def flash_info_message(self, obj):
@@ -637,6 +662,9 @@ def get_event_from_url(url):
     return event
 
 
+_ZipEntry = namedtuple('_ZipEntry', ('name', 'storage', 'file_id', 'size', 'date_time', 'compress'))
+
+
 class ZipGeneratorMixin(object):
     """Mixin for RHs that generate zip with files."""
 
@@ -665,31 +693,53 @@ class ZipGeneratorMixin(object):
         for f in files_holder:
             yield f
 
+    def _iter_zip_entries(self, files_holder):
+        self.used_filenames = set()
+        for item in self._iter_items(files_holder):
+            name = self._prepare_folder_structure(item)
+            self.used_filenames.add(name)
+            created_dt = getattr(item, 'created_dt', None)
+            yield _ZipEntry(name, item.storage, item.storage_file_id, item.size,
+                            created_dt.replace(tzinfo=None) if created_dt else None,
+                            should_compress(item.content_type))
+
+    def _iter_zip_data(self, entries):
+        zip_file = StreamingZipFile()
+        for entry in entries:
+            with closing(entry.storage.open(entry.file_id)) as f:
+                for chunk in zip_file.write_file(entry.name, f, size=entry.size, date_time=entry.date_time,
+                                                 compress=entry.compress):
+                    yield chunk
+        for chunk in zip_file.close():
+            yield chunk
+
     def _generate_zip_file(self, files_holder, name_prefix='material', name_suffix=None, return_file=False):
         """Generate a zip file containing the files passed.
 
+        The zip file is streamed to the client while it is being
+        generated, reading the files directly from the storage.
+
         :param files_holder: An iterable (or an iterable containing) object that
                              contains the files to be added in the zip file.
         :param name_prefix: The prefix to the zip file name
         :param name_suffix: The suffix to the zip file name
-        :param return_file: Return the temp file instead of a response
+        :param return_file: Return a temp file instead of a response
         """
-
-        temp_file = NamedTemporaryFile(suffix='indico.tmp', dir=config.TEMP_DIR)
-        with ZipFile(temp_file.name, 'w', allowZip64=True) as zip_handler:
-            self.used_filenames = set()
-            for item in self._iter_items(files_holder):
-                name = self._prepare_folder_structure(item)
-                self.used_filenames.add(name)
-                with item.get_local_path() as filepath:
-                    zip_handler.write(filepath.encode('utf-8'), name)
-
-        zip_file_name = '{}-{}.zip'.format(name_prefix, name_suffix) if name_suffix else '{}.zip'.format(name_prefix)
-        chmod_umask(temp_file.name)
+        # everything which needs the database is done before streaming
+        entries = list(self._iter_zip_entries(files_holder))
         if return_file:
+            temp_file = NamedTemporaryFile(suffix='indico.tmp', dir=config.TEMP_DIR)
+            for chunk in self._iter_zip_data(entries):
+                temp_file.write(chunk)
+            temp_file.flush()
+            temp_file.seek(0)
+            chmod_umask(temp_file.name)
             return temp_file
-        temp_file.delete = False
-        return send_file(zip_file_name, temp_file.name, 'application/zip', inline=False)
+        zip_file_name = '{}-{}.zip'.format(name_prefix, name_suffix) if name_suffix else '{}.zip'.format(name_prefix)
+        response = current_app.response_class(stream_with_context(self._iter_zip_data(entries)),
+                                              mimetype='application/zip')
+        response.headers.add('Content-Disposition', 'attachment', **make_content_disposition_args(zip_file_name))
+        return response
 
     def _prepare_folder_structure(self, item):
         file_name = secure_filename('{}_{}'.format(unicode(item.id), item.filename), item.filename)
@@ -0,0 +1,27 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+from flask import session
+
+from indico.modules.events.util import MAX_SESSION_LIST_CONFIGS, _remember_list_config
+
+
+@pytest.mark.usefixtures('request_context')
+def test_remember_list_config():
+    session['other'] = 'foo'
+    session['contributions_config_1'] = {'filters': {}}
+    for i in xrange(MAX_SESSION_LIST_CONFIGS + 5):
+        session['registrations_config_{}'.format(i)] = {'filters': {}}
+        _remember_list_config('registrations_config_{}'.format(i))
+    _remember_list_config('registrations_config_10')
+    expected = ['registrations_config_{}'.format(i) for i in xrange(5, MAX_SESSION_LIST_CONFIGS + 5) if i != 10]
+    expected.append('registrations_config_10')
+    assert session['_list_configs'] == expected
+    assert sorted(session) == sorted(expected + ['_list_configs', 'other'])
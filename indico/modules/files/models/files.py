@@ -55,6 +55,7 @@ class File(StoredFileMixin, db.Model):
     # relationship backrefs:
     # - custom_boa_of (Event.custom_boa)
     # - editing_revision_files (EditingRevisionFile.file)
+    # - ticket_of_registration (Registration.ticket_file)
 
     def claim(self):
         """Mark the file as claimed by some object it's linked to.
@@ -11,6 +11,7 @@ from flask import session
 
 from indico.core import signals
 from indico.modules.groups.core import GroupProxy
+from indico.modules.groups.membership import invalidate_user_groups
 from indico.util.i18n import _
 from indico.web.flask.util import url_for
 from indico.web.menu import SideMenuItem
@@ -25,7 +26,20 @@ def _extend_admin_menu(sender, **kwargs):
         return SideMenuItem('groups', _("Groups"), url_for('groups.groups'), section='user_management')
 
 
+@signals.import_tasks.connect
+def _import_tasks(sender, **kwargs):
+    import indico.modules.groups.tasks  # noqa: F401
+
+
+@signals.users.logged_in.connect
+def _user_logged_in(user, **kwargs):
+    # the identity used to log in may have new groups
+    invalidate_user_groups(user)
+
+
 @signals.users.merged.connect
 def _merge_users(target, source, **kwargs):
     target.local_groups |= source.local_groups
     source.local_groups.clear()
+    invalidate_user_groups(target)
+    invalidate_user_groups(source)
@@ -16,8 +16,8 @@ from indico.core.auth import multipass
 from indico.core.config import config
 from indico.core.db import db
 from indico.core.db.sqlalchemy.principals import PrincipalType
-from indico.legacy.common.cache import GenericCache
 from indico.modules.auth import Identity
+from indico.modules.groups.membership import get_group_member_ids, is_group_member
 from indico.modules.groups.models.groups import LocalGroup
 from indico.util.caching import memoize_request
 from indico.util.string import return_ascii
@@ -233,21 +233,25 @@ class _MultipassGroupProxy(GroupProxy):
     def has_member(self, user):
         if not user:
             return False
-        cache = GenericCache('group-membership')
-        key = '{}:{}:{}'.format(self.provider, self.name, user.id)
-        rv = cache.get(key)
-        if rv is not None:
-            return rv
-        elif self.group is None:
+        return is_group_member(self, user)
+
+    def check_member(self, user):
+        """Check whether a user is in the group without using the cache."""
+        if self.group is None:
             warn('Tried to check if {} is in invalid group {}'.format(user, self))
-            rv = False
-        else:
-            rv = any(x[1] in self.group for x in user.iter_identifiers(check_providers=True, providers={self.provider}))
-        cache.set(key, rv, 1800)
-        return rv
+            return False
+        return any(x[1] in self.group for x in user.iter_identifiers(check_providers=True, providers={self.provider}))
 
     @memoize_request
     def get_members(self):
+        from indico.modules.users.models.users import User
+        member_ids = get_group_member_ids(self.provider, self.name)
+        if not member_ids:
+            return set()
+        return set(User.query.filter(~User.is_deleted, User.id.in_(member_ids)))
+
+    def fetch_members(self):
+        """Get the members of the group without using the cache."""
         from indico.modules.users.models.users import User
         if self.group is None:
             warn('Tried to get members for invalid group {}'.format(self))
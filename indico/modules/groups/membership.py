@@ -0,0 +1,198 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+"""Shared cache for multipass group memberships.
+
+Checking whether a user is a member of a multipass group usually means
+querying the identity provider (e.g. LDAP), so the results are cached
+in the generic cache and shared between all workers:
+
+- per user, the names of the groups the user is in for each provider
+  which can list the groups of an identity
+- per group, the ids of the users in it for providers which can list
+  the members of a group (or the fact that the group does not exist)
+- per user and group, the result of any other membership check
+
+Entries are kept for :data:`MEMBERSHIP_CACHE_TTL`; once they are older
+than :data:`MEMBERSHIP_REFRESH_AGE` they are still used but refreshed
+in the background.  Use :func:`invalidate_user_groups` and
+:func:`invalidate_group_members` when memberships are known to have
+changed.
+"""
+
+from __future__ import unicode_literals
+
+import time
+from datetime import timedelta
+
+from indico.core.auth import multipass
+from indico.legacy.common.cache import GenericCache
+
+
+#: How long cached memberships are kept
+MEMBERSHIP_CACHE_TTL = timedelta(hours=6)
+#: How old cached memberships may be before they are refreshed
+MEMBERSHIP_REFRESH_AGE = timedelta(minutes=30)
+
+_user_groups_cache = GenericCache('group-membership-users')
+_group_members_cache = GenericCache('group-membership-groups')
+_membership_cache = GenericCache('group-membership')
+_generation_cache = GenericCache('group-membership-generation')
+_refresh_lock_cache = GenericCache('group-membership-refresh', local=False)
+
+
+def _get_generation(key):
+    # bumping the generation of a user/group invalidates all its
+    # per-user-and-group entries without having to know them
+    generation = _generation_cache.get(key)
+    if generation is None:
+        generation = int(time.time() * 1000)
+        _generation_cache.set(key, generation, MEMBERSHIP_CACHE_TTL)
+    return generation
+
+
+def _bump_generation(key):
+    # make sure the generation changes even within the same millisecond
+    generation = max(int(time.time() * 1000), _generation_cache.get(key, 0) + 1)
+    _generation_cache.set(key, generation, MEMBERSHIP_CACHE_TTL)
+
+
+def _is_stale(entry):
+    return time.time() - entry[0] > MEMBERSHIP_REFRESH_AGE.total_seconds()
+
+
+def _schedule_refresh(task, *args):
+    from indico.modules.groups.tasks import refresh_group_members, refresh_user_groups
+    task = {'user': refresh_user_groups, 'group': refresh_group_members}[task]
+    # only one refresh per entry at a time
+    if _refresh_lock_cache.add(repr((task.name,) + args), True, MEMBERSHIP_REFRESH_AGE):
+        task.delay(*args)
+
+
+def _get_group_key(provider, name):
+    return '{}:{}'.format(provider, name.lower())
+
+
+def fetch_user_groups(user):
+    """Get the multipass groups of a user from the identity providers.
+
+    :return: A dict mapping the name of each provider which can list
+             the groups of an identity to a frozenset containing the
+             lowercase names of the user's groups in that provider.
+    """
+    providers = {name for name, provider in multipass.identity_providers.viewitems()
+                 if provider.supports_get_identity_groups}
+    groups = {provider: set() for provider in providers}
+    if providers:
+        for provider, identifier in user.iter_identifiers(check_providers=True, providers=providers):
+            groups[provider] |= {group.name.lower()
+                                 for group in multipass.identity_providers[provider].get_identity_groups(identifier)}
+    return {provider: frozenset(names) for provider, names in groups.viewitems()}
+
+
+def update_user_groups(user):
+    """Fetch the multipass groups of a user and store them in the cache."""
+    groups = fetch_user_groups(user)
+    _user_groups_cache.set(user.id, (time.time(), groups), MEMBERSHIP_CACHE_TTL)
+    return groups
+
+
+def get_user_groups(user):
+    """Get the cached multipass groups of a user.
+
+    The groups are fetched from the identity providers if they are not
+    cached yet.
+
+    :return: A dict as returned by :func:`fetch_user_groups`.
+    """
+    entry = _user_groups_cache.get(user.id)
+    if entry is None:
+        return update_user_groups(user)
+    if _is_stale(entry):
+        _schedule_refresh('user', user.id)
+    return entry[1]
+
+
+def fetch_group_member_ids(provider, name):
+    """Get the ids of the users in a multipass group.
+
+    :return: A frozenset containing user ids or `None` if the group
+             does not exist.
+    """
+    from indico.modules.groups import GroupProxy
+    group = GroupProxy(name, provider)
+    if group.group is None:
+        return None
+    return frozenset(user.id for user in group.fetch_members())
+
+
+def update_group_members(provider, name):
+    """Fetch the members of a multipass group and store them in the cache."""
+    member_ids = fetch_group_member_ids(provider, name)
+    _group_members_cache.set(_get_group_key(provider, name), (time.time(), member_ids), MEMBERSHIP_CACHE_TTL)
+    return member_ids
+
+
+def get_group_member_ids(provider, name):
+    """Get the cached ids of the users in a multipass group.
+
+    The members are fetched from the identity provider if they are
+    not cached yet.  Missing groups are cached as well.
+
+    :return: A frozenset containing user ids or `None` if the group
+             does not exist.
+    """
+    entry = _group_members_cache.get(_get_group_key(provider, name))
+    if entry is None:
+        return update_group_members(provider, name)
+    if _is_stale(entry):
+        _schedule_refresh('group', provider, name)
+    return entry[1]
+
+
+def _get_cached_member_ids(provider, name):
+    entry = _group_members_cache.get(_get_group_key(provider, name))
+    return entry[1] if entry is not None else None
+
+
+def is_group_member(group, user):
+    """Check whether a user is a member of a multipass group.
+
+    The check uses the cached groups of the user if the provider can
+    list them, the cached members of the group if they are available,
+    and otherwise checks (and caches) the membership for this specific
+    user and group.
+
+    :param group: A multipass :class:`.GroupProxy`
+    :param user: A :class:`.User`
+    """
+    user_groups = get_user_groups(user)
+    if group.provider in user_groups:
+        return group.name.lower() in user_groups[group.provider]
+    member_ids = _get_cached_member_ids(group.provider, group.name)
+    if member_ids is not None:
+        return user.id in member_ids
+    key = '{}:{}:{}'.format(_get_group_key(group.provider, group.name),
+                            _get_generation(_get_group_key(group.provider, group.name)),
+                            _get_generation(user.id))
+    rv = _membership_cache.get(key)
+    if rv is None:
+        rv = group.check_member(user)
+        _membership_cache.set(key, rv, MEMBERSHIP_REFRESH_AGE)
+    return rv
+
+
+def invalidate_user_groups(user):
+    """Remove all cached group memberships of a user."""
+    _user_groups_cache.delete(user.id)
+    _bump_generation(user.id)
+
+
+def invalidate_group_members(provider, name):
+    """Remove all cached memberships of a multipass group."""
+    _group_members_cache.delete(_get_group_key(provider, name))
+    _bump_generation(_get_group_key(provider, name))
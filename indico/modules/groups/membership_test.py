@@ -0,0 +1,130 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import pytest
+from mock import MagicMock
+
+from indico.legacy.common.cache import FileCacheClient
+from indico.modules.groups import GroupProxy, membership
+from indico.modules.groups.core import _MultipassGroupProxy
+from indico.modules.groups.membership import (MEMBERSHIP_REFRESH_AGE, _is_stale, get_group_member_ids,
+                                              get_user_groups, invalidate_group_members, invalidate_user_groups,
+                                              is_group_member, update_group_members)
+
+
+@pytest.fixture(autouse=True)
+def membership_cache(mocker, tmpdir):
+    client = FileCacheClient(tmpdir.strpath)
+    for cache in (membership._user_groups_cache, membership._group_members_cache, membership._membership_cache,
+                  membership._generation_cache, membership._refresh_lock_cache):
+        mocker.patch.object(cache, '_client', client)
+
+
+@pytest.fixture
+def now(mocker):
+    return mocker.patch('indico.modules.groups.membership.time.time', return_value=1000000)
+
+
+@pytest.fixture
+def user():
+    return MagicMock(id=123)
+
+
+def test_is_stale(now):
+    assert not _is_stale((now.return_value, None))
+    assert not _is_stale((now.return_value - MEMBERSHIP_REFRESH_AGE.total_seconds(), None))
+    assert _is_stale((now.return_value - MEMBERSHIP_REFRESH_AGE.total_seconds() - 1, None))
+
+
+def test_get_user_groups_cached(mocker, user):
+    fetch = mocker.patch('indico.modules.groups.membership.fetch_user_groups',
+                         return_value={'ldap': frozenset({'staff'})})
+    refresh = mocker.patch('indico.modules.groups.tasks.refresh_user_groups.delay')
+    assert get_user_groups(user) == {'ldap': {'staff'}}
+    assert get_user_groups(user) == {'ldap': {'staff'}}
+    fetch.assert_called_once_with(user)
+    assert not refresh.called
+
+
+def test_get_user_groups_stale(mocker, now, user):
+    fetch = mocker.patch('indico.modules.groups.membership.fetch_user_groups',
+                         return_value={'ldap': frozenset({'staff'})})
+    refresh = mocker.patch('indico.modules.groups.tasks.refresh_user_groups.delay')
+    get_user_groups(user)
+    now.return_value += MEMBERSHIP_REFRESH_AGE.total_seconds() + 1
+    fetch.return_value = {'ldap': frozenset()}
+    # stale entries are still used but refreshed in the background, once
+    assert get_user_groups(user) == {'ldap': {'staff'}}
+    assert get_user_groups(user) == {'ldap': {'staff'}}
+    assert fetch.call_count == 1
+    refresh.assert_called_once_with(user.id)
+    # until the refresh task updates the entry
+    membership.update_user_groups(user)
+    assert get_user_groups(user) == {'ldap': set()}
+
+
+def test_get_group_member_ids(mocker, now):
+    fetch = mocker.patch('indico.modules.groups.membership.fetch_group_member_ids', return_value=frozenset({1, 2}))
+    refresh = mocker.patch('indico.modules.groups.tasks.refresh_group_members.delay')
+    assert get_group_member_ids('ldap', 'Staff') == {1, 2}
+    # group names are not case-sensitive
+    assert get_group_member_ids('ldap', 'staff') == {1, 2}
+    fetch.assert_called_once_with('ldap', 'Staff')
+    now.return_value += MEMBERSHIP_REFRESH_AGE.total_seconds() + 1
+    fetch.return_value = frozenset({2, 3})
+    assert get_group_member_ids('ldap', 'Staff') == {1, 2}
+    refresh.assert_called_once_with('ldap', 'Staff')
+    assert update_group_members('ldap', 'Staff') == {2, 3}
+    assert get_group_member_ids('ldap', 'Staff') == {2, 3}
+
+
+def test_get_group_member_ids_missing_group(mocker):
+    fetch = mocker.patch('indico.modules.groups.membership.fetch_group_member_ids', return_value=None)
+    assert get_group_member_ids('ldap', 'missing') is None
+    assert get_group_member_ids('ldap', 'missing') is None
+    assert fetch.call_count == 1
+
+
+def test_is_group_member_user_groups(mocker, user):
+    mocker.patch('indico.modules.groups.membership.fetch_user_groups', return_value={'ldap': frozenset({'staff'})})
+    check_member = mocker.patch.object(_MultipassGroupProxy, 'check_member', return_value=False)
+    assert is_group_member(GroupProxy('Staff', 'ldap'), user)
+    assert not is_group_member(GroupProxy('Others', 'ldap'), user)
+    assert not check_member.called
+
+
+def test_is_group_member_group_members(mocker, user):
+    mocker.patch('indico.modules.groups.membership.fetch_user_groups', return_value={})
+    mocker.patch('indico.modules.groups.membership.fetch_group_member_ids', return_value=frozenset({user.id}))
+    check_member = mocker.patch.object(_MultipassGroupProxy, 'check_member', return_value=False)
+    assert not is_group_member(GroupProxy('Staff', 'ldap'), user)
+    assert check_member.call_count == 1
+    # once the members of the group are cached they are used instead
+    update_group_members('ldap', 'Staff')
+    assert is_group_member(GroupProxy('Staff', 'ldap'), user)
+    assert check_member.call_count == 1
+
+
+def test_is_group_member_invalidation(mocker, user):
+    mocker.patch('indico.modules.groups.membership.fetch_user_groups', return_value={})
+    check_member = mocker.patch.object(_MultipassGroupProxy, 'check_member', return_value=True)
+    group = GroupProxy('Staff', 'ldap')
+    assert is_group_member(group, user)
+    assert is_group_member(group, user)
+    assert check_member.call_count == 1
+    # bumping the generation of the user or the group invalidates the cached result
+    check_member.return_value = False
+    invalidate_user_groups(user)
+    assert not is_group_member(group, user)
+    assert check_member.call_count == 2
+    check_member.return_value = True
+    invalidate_group_members('ldap', 'staff')
+    assert is_group_member(group, user)
+    assert is_group_member(group, user)
+    assert check_member.call_count == 3
@@ -0,0 +1,24 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from indico.core.celery import celery
+from indico.modules.groups.membership import update_group_members, update_user_groups
+from indico.modules.users import User
+
+
+@celery.task(name='refresh_user_groups')
+def refresh_user_groups(user_id):
+    user = User.get(user_id, is_deleted=False)
+    if user is not None:
+        update_user_groups(user)
+
+
+@celery.task(name='refresh_group_members')
+def refresh_group_members(provider, name):
+    update_group_members(provider, name)
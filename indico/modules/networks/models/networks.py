@@ -81,6 +81,10 @@ class IPNetworkGroup(db.Model):
     def __repr__(self):
         return format_repr(self, 'id', 'name', hidden=False, attachment_access_override=False)
 
+    @property
+    def identifier(self):
+        return 'IPNetworkGroup:{}'.format(self.id)
+
     def __contains__(self, user):
         # This method is called via ``user in principal`` during ACL checks.
         # We have to take the IP from the request so if there's no request
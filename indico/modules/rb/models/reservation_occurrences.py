@@ -27,6 +27,7 @@ from indico.util.date_time import format_date
 from indico.util.serializer import Serializer
 from indico.util.string import format_repr, return_ascii
 from indico.util.struct.enum import IndicoEnum
+from indico.util.struct.iterables import grouper
 from indico.web.flask.util import url_for
 
 
@@ -127,6 +128,35 @@ class ReservationOccurrence(db.Model, Serializer):
         for o in cls.iter_create_occurrences(reservation.start_dt, reservation.end_dt, reservation.repetition):
             o.reservation = reservation
 
+    @classmethod
+    def bulk_insert(cls, reservation, occurrences):
+        """Insert many new occurrences of a booking at once.
+
+        Instead of adding each occurrence to the session, they are
+        inserted using multi-row ``INSERT`` queries.  The objects
+        passed to this method are NOT added to the session; use the
+        booking's `occurrences` relationship to get them afterwards.
+
+        :param reservation: The :class:`Reservation` the occurrences
+                            belong to.  It must have been flushed
+                            already.
+        :param occurrences: The new (transient) occurrences
+        """
+        from indico.modules.rb.models.room_availability import refresh_room_availability
+
+        rows = [{'reservation_id': reservation.id,
+                 'start_dt': occ.start_dt,
+                 'end_dt': occ.end_dt,
+                 'notification_sent': bool(occ.notification_sent),
+                 'state': occ.state,
+                 'rejection_reason': occ.rejection_reason}
+                for occ in occurrences]
+        for chunk in grouper(rows, 1000, skip_missing=True):
+            db.session.execute(cls.__table__.insert().values(chunk))
+        # the ORM is bypassed, so the session listener does not know about the new occurrences
+        refresh_room_availability(db.session.connection(),
+                                  {(reservation.room_id, occ.start_dt.date()) for occ in occurrences})
+
     @classmethod
     def create_series(cls, start, end, repetition):
         return list(cls.iter_create_occurrences(start, end, repetition))
@@ -14,7 +14,7 @@ from sqlalchemy import Date, Time
 from sqlalchemy.event import listens_for
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import contains_eager, joinedload
 from sqlalchemy.sql import cast
 from werkzeug.datastructures import OrderedMultiDict
 
@@ -24,7 +24,7 @@ from indico.core.db.sqlalchemy.custom import PyIntEnum
 from indico.core.db.sqlalchemy.custom.utcdatetime import UTCDateTime
 from indico.core.db.sqlalchemy.links import LinkMixin, LinkType
 from indico.core.db.sqlalchemy.util.models import auto_table_args
-from indico.core.db.sqlalchemy.util.queries import limit_groups
+from indico.core.db.sqlalchemy.util.queries import db_dates_overlap, limit_groups
 from indico.core.errors import NoReportError
 from indico.modules.rb.models.reservation_edit_logs import ReservationEditLog
 from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence, ReservationOccurrenceState
@@ -37,6 +37,7 @@ from indico.util.i18n import _
 from indico.util.serializer import Serializer
 from indico.util.string import format_repr, return_ascii, to_unicode
 from indico.util.struct.enum import IndicoEnum
+from indico.util.struct.intervals import IntervalIndex
 from indico.web.flask.util import url_for
 
 
@@ -493,52 +494,86 @@ class Reservation(Serializer, db.Model):
         return allow_admin and rb_is_admin(user) and (self.is_cancelled or self.is_rejected)
 
     def create_occurrences(self, skip_conflicts, user=None):
-        ReservationOccurrence.create_series_for_reservation(self)
+        from indico.modules.rb.models.blocked_rooms import BlockedRoom
+        from indico.modules.rb.models.blockings import Blocking
+
+        # the whole series is checked for conflicts in memory and then inserted at once
+        # instead of adding the occurrences to the session and updating them afterwards
+        occurrences = ReservationOccurrence.create_series(self.start_dt, self.end_dt, self.repetition)
         db.session.flush()
+        if not occurrences:
+            return
+        for occurrence in occurrences:
+            occurrence.state = ReservationOccurrenceState.valid
 
         if user is None:
             user = self.created_by_user
 
+        def _skip(occurrence, reason):
+            occurrence.state = ReservationOccurrenceState.cancelled
+            occurrence.rejection_reason = reason
+
+        def _get_valid_occurrences():
+            return [occ for occ in occurrences if occ.is_valid]
+
+        first_dt = occurrences[0].start_dt
+        last_dt = occurrences[-1].end_dt
+
         # Check for conflicts with nonbookable periods
         if not rb_is_admin(user) and not self.room.can_manage(user, permission='override'):
-            nonbookable_periods = self.room.nonbookable_periods.filter(NonBookablePeriod.end_dt > self.start_dt)
-            for occurrence in self.occurrences:
-                if not occurrence.is_valid:
-                    continue
-                for nbd in nonbookable_periods:
-                    if nbd.overlaps(occurrence.start_dt, occurrence.end_dt):
-                        if not skip_conflicts:
-                            raise ConflictingOccurrences()
-                        occurrence.cancel(user, 'Skipped due to nonbookable date', silent=True, propagate=False)
-                        break
+            nonbookable_periods = IntervalIndex(self.room.nonbookable_periods
+                                                .filter(NonBookablePeriod.end_dt > self.start_dt))
+            for occurrence in _get_valid_occurrences():
+                if nonbookable_periods.overlaps(occurrence.start_dt, occurrence.end_dt):
+                    if not skip_conflicts:
+                        raise ConflictingOccurrences()
+                    _skip(occurrence, 'Skipped due to nonbookable date')
 
         # Check for conflicts with blockings
-        blocked_rooms = self.room.get_blocked_rooms(*(occurrence.start_dt for occurrence in self.occurrences))
+        blocked_rooms = (self.room.blocked_rooms
+                         .join(BlockedRoom.blocking)
+                         .options(contains_eager(BlockedRoom.blocking))
+                         .filter(db_dates_overlap(Blocking, 'start_date', last_dt.date(), 'end_date', first_dt.date(),
+                                                  inclusive=True),
+                                 BlockedRoom.state == BlockedRoom.State.accepted)
+                         .all())
         for br in blocked_rooms:
             blocking = br.blocking
             if blocking.can_override(user, room=self.room):
                 continue
-            for occurrence in self.occurrences:
-                if occurrence.is_valid and blocking.is_active_at(occurrence.start_dt.date()):
+            for occurrence in _get_valid_occurrences():
+                if blocking.is_active_at(occurrence.start_dt.date()):
                     # Cancel OUR occurrence
-                    msg = 'Skipped due to collision with a blocking ({})'
-                    occurrence.cancel(user, msg.format(blocking.reason), silent=True, propagate=False)
+                    _skip(occurrence, 'Skipped due to collision with a blocking ({})'.format(blocking.reason))
 
         # Check for conflicts with other occurrences
-        conflicting_occurrences = self.get_conflicting_occurrences()
-        for occurrence, conflicts in conflicting_occurrences.iteritems():
-            if not occurrence.is_valid:
-                continue
-            if conflicts['confirmed']:
+        colliding_occurrences = IntervalIndex(ReservationOccurrence.query
+                                              .join(ReservationOccurrence.reservation)
+                                              .filter(Reservation.room_id == self.room.id,
+                                                      Reservation.id != self.id,
+                                                      ReservationOccurrence.is_valid,
+                                                      ReservationOccurrence.start_dt < last_dt,
+                                                      ReservationOccurrence.end_dt > first_dt)
+                                              .options(contains_eager(ReservationOccurrence.reservation),
+                                                       ReservationOccurrence.NO_RESERVATION_USER_STRATEGY))
+        rejected_occurrences = []
+        for occurrence in _get_valid_occurrences():
+            conflicts = list(colliding_occurrences.iter_overlapping(occurrence.start_dt, occurrence.end_dt))
+            confirmed = [x for x in conflicts if x.reservation.is_accepted]
+            if confirmed:
                 if not skip_conflicts:
                     raise ConflictingOccurrences()
                 # Cancel OUR occurrence
-                msg = 'Skipped due to collision with {} reservation(s)'
-                occurrence.cancel(user, msg.format(len(conflicts['confirmed'])), silent=True, propagate=False)
-            elif conflicts['pending'] and self.is_accepted:
+                _skip(occurrence, 'Skipped due to collision with {} reservation(s)'.format(len(confirmed)))
+            elif conflicts and self.is_accepted:
                 # Reject OTHER occurrences
-                for conflict in conflicts['pending']:
-                    conflict.reject(user, 'Rejected due to collision with a confirmed reservation')
+                rejected_occurrences += conflicts
+
+        ReservationOccurrence.bulk_insert(self, occurrences)
+        for occurrence in self.occurrences.filter(ReservationOccurrence.state == ReservationOccurrenceState.cancelled):
+            signals.rb.booking_occurrence_state_changed.send(occurrence)
+        for conflict in rejected_occurrences:
+            conflict.reject(user, 'Rejected due to collision with a confirmed reservation')
 
     def find_excluded_days(self):
         return self.occurrences.filter(~ReservationOccurrence.is_valid)
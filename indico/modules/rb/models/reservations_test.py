@@ -10,9 +10,11 @@ from datetime import date, datetime, time
 import pytest
 from dateutil.relativedelta import relativedelta
 
+from indico.core.db import db
 from indico.modules.rb.models.reservation_edit_logs import ReservationEditLog
 from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence, ReservationOccurrenceState
-from indico.modules.rb.models.reservations import RepeatFrequency, RepeatMapping, Reservation, ReservationState
+from indico.modules.rb.models.reservations import (ConflictingOccurrences, RepeatFrequency, RepeatMapping, Reservation,
+                                                   ReservationState)
 
 
 pytest_plugins = 'indico.modules.rb.testing.fixtures'
@@ -287,6 +289,44 @@ def test_find_excluded_days(db, create_reservation):
     assert set(reservation.find_excluded_days().all()) == {occ for occ in reservation.occurrences if not occ.is_valid}
 
 
+def _get_occurrences_from_db(reservation):
+    db.session.expire_all()
+    return [(occ.start_dt.day, occ.state, occ.rejection_reason)
+            for occ in ReservationOccurrence.query.filter_by(reservation_id=reservation.id).order_by('start_dt')]
+
+
+@pytest.mark.parametrize('skip_conflicts', (True, False))
+def test_create_occurrences(smtp, dummy_room, dummy_user, create_reservation, skip_conflicts):
+    existing = create_reservation(start_dt=datetime(2020, 11, 3, 8), end_dt=datetime(2020, 11, 4, 10),
+                                  repeat_frequency=RepeatFrequency.DAY)
+    pending = create_reservation(start_dt=datetime(2020, 11, 5, 8), end_dt=datetime(2020, 11, 5, 10),
+                                 state=ReservationState.pending)
+    reservation = Reservation(start_dt=datetime(2020, 11, 2, 9), end_dt=datetime(2020, 11, 6, 11),
+                              repeat_frequency=RepeatFrequency.DAY, repeat_interval=1, booking_reason='Testing',
+                              room=dummy_room, booked_for_user=dummy_user, created_by_user=dummy_user)
+    if not skip_conflicts:
+        with pytest.raises(ConflictingOccurrences):
+            reservation.create_occurrences(skip_conflicts=False)
+        assert not reservation.occurrences.count()
+        return
+    reservation.create_occurrences(skip_conflicts=True)
+    skipped = 'Skipped due to collision with 1 reservation(s)'
+    expected = [(2, ReservationOccurrenceState.valid, None),
+                (3, ReservationOccurrenceState.cancelled, skipped),
+                (4, ReservationOccurrenceState.cancelled, skipped),
+                (5, ReservationOccurrenceState.valid, None),
+                (6, ReservationOccurrenceState.valid, None)]
+    # the occurrences are available through the relationship in the session
+    assert [(occ.start_dt.day, occ.state, occ.rejection_reason)
+            for occ in reservation.occurrences.order_by(ReservationOccurrence.start_dt)] == expected
+    assert all(occ.end_dt.time() == time(11) for occ in reservation.occurrences)
+    assert reservation.occurrences[0].reservation == reservation
+    # the conflicting pending booking has been rejected
+    assert [occ.state for occ in pending.occurrences] == [ReservationOccurrenceState.rejected]
+    assert [occ.state for occ in existing.occurrences] == [ReservationOccurrenceState.valid] * 2
+    assert _get_occurrences_from_db(reservation) == expected
+
+
 def test_find_overlapping(create_reservation):
     resv1 = create_reservation(state=ReservationState.pending)
     assert not resv1.find_overlapping().count()
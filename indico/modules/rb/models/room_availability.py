@@ -0,0 +1,295 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from datetime import time, timedelta
+from itertools import chain
+
+from sqlalchemy import inspect, select, tuple_
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.event import listens_for
+from sqlalchemy.orm import Query, Session
+from sqlalchemy.orm.attributes import get_history
+
+from indico.core.db import db
+from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence, ReservationOccurrenceState
+from indico.modules.rb.models.reservations import Reservation, ReservationState
+from indico.util.string import format_repr, return_ascii
+
+
+#: The length of a slot in the availability bitmaps
+SLOT_MINUTES = 15
+#: The number of slots (and thus bits) per day
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+_EMPTY_SLOTS = '0' * SLOTS_PER_DAY
+#: The occurrence attributes which affect the availability of a room
+_AVAILABILITY_ATTRS = {'state', 'is_valid', 'start_dt', 'end_dt', 'reservation_id'}
+
+
+class RoomAvailability(db.Model):
+    """The occupancy of a room on a specific day.
+
+    This is a materialized version of the room's valid occurrences
+    which allows checking whether a room is available using bitwise
+    operations instead of checking the occurrences for overlaps.  The
+    day is split into slots of :data:`SLOT_MINUTES` and the bit of a
+    slot is set if any occurrence overlaps with it.
+
+    The data is updated automatically whenever occurrences or bookings
+    are modified; days without any occurrences have no row at all.
+    """
+
+    __tablename__ = 'room_availability'
+    __table_args__ = {'schema': 'roombooking'}
+
+    room_id = db.Column(
+        db.Integer,
+        db.ForeignKey('roombooking.rooms.id'),
+        primary_key=True
+    )
+    date = db.Column(
+        db.Date,
+        primary_key=True
+    )
+    #: The slots occupied by accepted bookings
+    booked = db.Column(
+        BIT(SLOTS_PER_DAY),
+        nullable=False
+    )
+    #: The slots occupied by pending bookings
+    pre_booked = db.Column(
+        BIT(SLOTS_PER_DAY),
+        nullable=False
+    )
+
+    @return_ascii
+    def __repr__(self):
+        return format_repr(self, 'room_id', 'date')
+
+    @classmethod
+    def filter_free(cls, room_id, dates, start_time, end_time, include_pre_bookings=True):
+        """Return a SQLAlchemy filter criterion ensuring that a room is free.
+
+        Only time ranges which can be represented exactly using the
+        slots are supported; use :func:`can_use_slots` to check this.
+
+        :param room_id: The room id (usually ``Room.id``)
+        :param dates: The dates on which the room needs to be free
+        :param start_time: The time when the room needs to become free
+        :param end_time: The time until when the room needs to be free
+        :param include_pre_bookings: Whether pending bookings should
+                                     make the room unavailable
+        """
+        occupied = cls.booked.op('|')(cls.pre_booked) if include_pre_bookings else cls.booked
+        mask = db.cast(get_slot_mask(start_time, end_time), BIT(SLOTS_PER_DAY))
+        return ~(cls.query
+                 .filter(cls.room_id == room_id,
+                         cls.date.in_(dates),
+                         occupied.op('&')(mask) != db.cast(_EMPTY_SLOTS, BIT(SLOTS_PER_DAY)))
+                 .exists())
+
+
+def _get_slot(value):
+    if value == time.max:
+        return SLOTS_PER_DAY
+    minutes = value.hour * 60 + value.minute
+    return minutes // SLOT_MINUTES
+
+
+def can_use_slots(start_time, end_time):
+    """Check whether a time range can be represented exactly using slots."""
+    if end_time != time.max and (end_time.minute % SLOT_MINUTES or end_time.second or end_time.microsecond):
+        return False
+    if start_time.minute % SLOT_MINUTES or start_time.second or start_time.microsecond:
+        return False
+    return _get_slot(start_time) < _get_slot(end_time)
+
+
+def get_slot_mask(start_time, end_time):
+    """Get the bit string with all the slots of a time range set.
+
+    Any slot which overlaps with the time range is set; ``time.max``
+    is considered to be the end of the day.
+    """
+    start = _get_slot(start_time)
+    end = _get_slot(end_time)
+    if end < SLOTS_PER_DAY and (end_time.minute % SLOT_MINUTES or end_time.second or end_time.microsecond):
+        end += 1
+    end = max(start, end)
+    return '0' * start + '1' * (end - start) + '0' * (SLOTS_PER_DAY - end)
+
+
+def _get_occurrence_slot_mask():
+    def _get_minutes(col):
+        value = db.cast(col, db.Time)
+        return db.extract('hour', value) * 60 + db.extract('minute', value) + db.extract('second', value) / 60
+
+    start = db.cast(db.func.floor(_get_minutes(ReservationOccurrence.start_dt) / SLOT_MINUTES), db.Integer)
+    end = db.case([(db.cast(ReservationOccurrence.end_dt, db.Date) > db.cast(ReservationOccurrence.start_dt, db.Date),
+                    SLOTS_PER_DAY)],
+                  else_=db.cast(db.func.ceil(_get_minutes(ReservationOccurrence.end_dt) / SLOT_MINUTES), db.Integer))
+    # the bit shift operators fill up with zeros, e.g. `(1111 >> 1) & (1111 << 1)` is `0110`
+    full = db.cast('1' * SLOTS_PER_DAY, BIT(SLOTS_PER_DAY))
+    return full.op('>>')(start).op('&')(full.op('<<')(SLOTS_PER_DAY - end))
+
+
+def refresh_room_availability(connection, room_days):
+    """Recalculate the availability of rooms on specific days.
+
+    :param connection: The connection used to execute the queries
+    :param room_days: An iterable containing ``(room_id, date)`` tuples
+    """
+    room_days = set(room_days)
+    if not room_days:
+        return
+    table = RoomAvailability.__table__
+    connection.execute(table.delete().where(tuple_(table.c.room_id, table.c.date).in_(list(room_days))))
+    day = db.cast(ReservationOccurrence.start_dt, db.Date)
+    mask = _get_occurrence_slot_mask()
+    empty = db.cast(_EMPTY_SLOTS, BIT(SLOTS_PER_DAY))
+    is_accepted = Reservation.state == ReservationState.accepted
+    min_date = min(date for __, date in room_days)
+    max_date = max(date for __, date in room_days)
+    query = (select([Reservation.room_id, day,
+                     db.func.bit_or(db.case([(is_accepted, mask)], else_=empty)),
+                     db.func.bit_or(db.case([(~is_accepted, mask)], else_=empty))])
+             .select_from(ReservationOccurrence.__table__.join(Reservation.__table__))
+             .where(db.and_(ReservationOccurrence.state == ReservationOccurrenceState.valid,
+                            ReservationOccurrence.start_dt >= min_date,
+                            ReservationOccurrence.start_dt < max_date + timedelta(days=1),
+                            Reservation.room_id.in_({room_id for room_id, __ in room_days}),
+                            tuple_(Reservation.room_id, day).in_(list(room_days))))
+             .group_by(Reservation.room_id, day))
+    connection.execute(table.insert().from_select(['room_id', 'date', 'booked', 'pre_booked'], query))
+
+
+def _get_history_values(obj, attr):
+    return [x for x in chain.from_iterable(get_history(obj, attr)) if x is not None]
+
+
+def _get_reservation_room_days(reservation):
+    room_ids = _get_history_values(reservation, 'room_id')
+    start_dts = _get_history_values(reservation, 'start_dt')
+    end_dts = _get_history_values(reservation, 'end_dt')
+    if not start_dts or not end_dts:
+        return set()
+    start_date = min(start_dts).date()
+    days = (max(end_dts).date() - start_date).days + 1
+    return {(room_id, start_date + timedelta(days=i)) for room_id in room_ids for i in xrange(days)}
+
+
+def _get_room_ids(connection, reservation_ids):
+    if not reservation_ids:
+        return {}
+    query = select([Reservation.id, Reservation.room_id]).where(Reservation.id.in_(reservation_ids))
+    return dict(connection.execute(query).fetchall())
+
+
+@listens_for(Session, 'after_flush')
+def _update_room_availability(session, flush_context):
+    reservation_days = set()
+    room_days = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, ReservationOccurrence):
+            if obj in session.dirty and not any(inspect(obj).attrs[attr].history.has_changes()
+                                                for attr in ('state', 'start_dt', 'end_dt', 'reservation_id')):
+                continue
+            reservation_ids = _get_history_values(obj, 'reservation_id')
+            if not reservation_ids and obj.reservation is not None:
+                reservation_ids = [obj.reservation.id]
+            reservation_days |= {(reservation_id, dt.date())
+                                 for reservation_id in reservation_ids
+                                 for dt in _get_history_values(obj, 'start_dt')}
+        elif isinstance(obj, Reservation) and (obj in session.deleted or
+                                               any(inspect(obj).attrs[attr].history.has_changes()
+                                                   for attr in ('state', 'room_id'))):
+            room_days |= _get_reservation_room_days(obj)
+    if not reservation_days and not room_days:
+        return
+    connection = session.connection()
+    reservation_rooms = {obj.id: obj.room_id for obj in session.deleted if isinstance(obj, Reservation)}
+    reservation_rooms.update(_get_room_ids(connection, {reservation_id for reservation_id, __ in reservation_days}
+                                           - set(reservation_rooms)))
+    room_days |= {(reservation_rooms[reservation_id], day)
+                  for reservation_id, day in reservation_days
+                  if reservation_id in reservation_rooms}
+    refresh_room_availability(connection, room_days)
+
+
+def _affects_room_availability(bulk_context):
+    if bulk_context.mapper.class_ is not ReservationOccurrence:
+        return False
+    # deletions have no values
+    values = getattr(bulk_context, 'values', None)
+    return values is None or bool(_get_bulk_update_keys(values) & _AVAILABILITY_ATTRS)
+
+
+def _get_bulk_update_keys(values):
+    items = values.items() if hasattr(values, 'items') else values
+    return {getattr(key, 'key', key) for key, __ in items}
+
+
+def _record_bulk_occurrences(bulk_context):
+    """Remember the occurrences affected by a bulk update/delete.
+
+    This works with any `synchronize_session` strategy since it does
+    not depend on the objects loaded in the session.
+    """
+    if not _affects_room_availability(bulk_context):
+        return
+    query = (bulk_context.query
+             .with_entities(ReservationOccurrence.reservation_id, ReservationOccurrence.start_dt)
+             .order_by(None))
+    bulk_context.availability_occurrences = query.all()
+
+
+def _get_reservation_days(connection, reservation_ids):
+    query = (select([Reservation.room_id, Reservation.start_dt, Reservation.end_dt])
+             .where(Reservation.id.in_(reservation_ids)))
+    return {(room_id, start_dt.date() + timedelta(days=i))
+            for room_id, start_dt, end_dt in connection.execute(query)
+            for i in xrange((end_dt.date() - start_dt.date()).days + 1)}
+
+
+def _refresh_bulk_room_availability(bulk_context):
+    """Refresh the availability after occurrences were updated or deleted in bulk."""
+    occurrences = getattr(bulk_context, 'availability_occurrences', None)
+    if not occurrences:
+        return
+    connection = bulk_context.session.connection()
+    reservation_ids = {reservation_id for reservation_id, __ in occurrences}
+    values = getattr(bulk_context, 'values', None)
+    if values is not None and _get_bulk_update_keys(values) & {'start_dt', 'reservation_id'}:
+        # the new dates of the occurrences are not known
+        refresh_room_availability(connection, _get_reservation_days(connection, reservation_ids))
+        return
+    reservation_rooms = _get_room_ids(connection, reservation_ids)
+    refresh_room_availability(connection, {(reservation_rooms[reservation_id], start_dt.date())
+                                           for reservation_id, start_dt in occurrences
+                                           if reservation_id in reservation_rooms})
+
+
+@listens_for(Query, 'before_compile_update')
+def _record_bulk_update_occurrences(query, update_context):
+    _record_bulk_occurrences(update_context)
+
+
+@listens_for(Query, 'before_compile_delete')
+def _record_bulk_delete_occurrences(query, delete_context):
+    _record_bulk_occurrences(delete_context)
+
+
+@listens_for(Session, 'after_bulk_update')
+def _update_room_availability_bulk_update(update_context):
+    _refresh_bulk_room_availability(update_context)
+
+
+@listens_for(Session, 'after_bulk_delete')
+def _update_room_availability_bulk_delete(delete_context):
+    _refresh_bulk_room_availability(delete_context)
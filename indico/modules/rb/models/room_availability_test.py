@@ -0,0 +1,138 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from datetime import date, datetime, time
+
+import pytest
+
+from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence, ReservationOccurrenceState
+from indico.modules.rb.models.reservations import RepeatFrequency, ReservationState
+from indico.modules.rb.models.room_availability import RoomAvailability, can_use_slots, get_slot_mask
+from indico.modules.rb.models.rooms import Room
+
+
+pytest_plugins = 'indico.modules.rb.testing.fixtures'
+
+
+def _slots(start_slot, end_slot):
+    return '0' * start_slot + '1' * (end_slot - start_slot) + '0' * (96 - end_slot)
+
+
+@pytest.mark.parametrize(('start_time', 'end_time', 'expected'), (
+    (time(0), time.max, True),
+    (time(8), time(9, 45), True),
+    (time(8, 15), time(8, 30), True),
+    (time(8, 5), time(9), False),
+    (time(8), time(9, 10), False),
+    (time(8), time(9, 0, 30), False),
+    (time(9), time(9), False),
+    (time(9), time(8), False),
+))
+def test_can_use_slots(start_time, end_time, expected):
+    assert can_use_slots(start_time, end_time) == expected
+
+
+@pytest.mark.parametrize(('start_time', 'end_time', 'expected'), (
+    (time(0), time.max, _slots(0, 96)),
+    (time(8), time(9, 45), _slots(32, 39)),
+    (time(8, 10), time(8, 20), _slots(32, 34)),
+    (time(23, 50), time.max, _slots(95, 96)),
+    (time(9), time(9), _slots(36, 36)),
+))
+def test_get_slot_mask(start_time, end_time, expected):
+    assert get_slot_mask(start_time, end_time) == expected
+
+
+def _get_availability(room):
+    return {(x.date, x.booked, x.pre_booked) for x in RoomAvailability.query.filter_by(room_id=room.id)}
+
+
+def test_room_availability_updated(db, dummy_room, create_reservation):
+    reservation = create_reservation(start_dt=datetime(2020, 11, 2, 8), end_dt=datetime(2020, 11, 4, 10, 10),
+                                     repeat_frequency=RepeatFrequency.DAY, state=ReservationState.pending)
+    db.session.flush()
+    assert _get_availability(dummy_room) == {(date(2020, 11, d), _slots(0, 0), _slots(32, 41)) for d in (2, 3, 4)}
+
+    reservation.state = ReservationState.accepted
+    db.session.flush()
+    assert _get_availability(dummy_room) == {(date(2020, 11, d), _slots(32, 41), _slots(0, 0)) for d in (2, 3, 4)}
+
+    occurrence = reservation.occurrences.filter_by(start_dt=datetime(2020, 11, 3, 8)).one()
+    occurrence.cancel(None, silent=True)
+    db.session.flush()
+    assert _get_availability(dummy_room) == {(date(2020, 11, d), _slots(32, 41), _slots(0, 0)) for d in (2, 4)}
+
+
+def test_room_availability_modified(db, dummy_room, dummy_user, create_reservation):
+    reservation = create_reservation(start_dt=datetime(2020, 11, 2, 8), end_dt=datetime(2020, 11, 3, 9),
+                                     repeat_frequency=RepeatFrequency.DAY)
+    db.session.flush()
+    reservation.modify({'start_dt': datetime(2020, 11, 3, 10), 'end_dt': datetime(2020, 11, 4, 11),
+                        'repeat_frequency': RepeatFrequency.DAY, 'repeat_interval': 1,
+                        'booked_for_user': dummy_user, 'booking_reason': 'Testing'}, dummy_user)
+    db.session.flush()
+    assert _get_availability(dummy_room) == {(date(2020, 11, d), _slots(40, 44), _slots(0, 0)) for d in (3, 4)}
+
+
+@pytest.mark.parametrize('action', ('cancel', 'reject'))
+def test_room_availability_cancel_reject(db, dummy_room, dummy_user, create_reservation, freeze_time, action):
+    freeze_time(datetime(2020, 11, 1))
+    reservation = create_reservation(start_dt=datetime(2020, 11, 2, 8), end_dt=datetime(2020, 11, 3, 9),
+                                     repeat_frequency=RepeatFrequency.DAY)
+    db.session.flush()
+    availability_filter = Room.filter_available(datetime(2020, 11, 2, 8), datetime(2020, 11, 3, 9),
+                                                (RepeatFrequency.DAY, 1), include_blockings=False)
+    assert not Room.find_all(availability_filter)
+    getattr(reservation, action)(dummy_user, 'Testing', silent=True)
+    db.session.flush()
+    assert _get_availability(dummy_room) == set()
+    assert set(Room.find_all(availability_filter)) == {dummy_room}
+
+
+@pytest.mark.parametrize('synchronize_session', ('evaluate', 'fetch', False))
+def test_room_availability_bulk_update(db, dummy_room, create_reservation, synchronize_session):
+    reservation = create_reservation(start_dt=datetime(2020, 11, 2, 8), end_dt=datetime(2020, 11, 3, 9),
+                                     repeat_frequency=RepeatFrequency.DAY)
+    db.session.flush()
+    query = ReservationOccurrence.query.filter_by(reservation_id=reservation.id,
+                                                  start_dt=datetime(2020, 11, 2, 8))
+    query.update({ReservationOccurrence.state: ReservationOccurrenceState.cancelled},
+                 synchronize_session=synchronize_session)
+    assert _get_availability(dummy_room) == {(date(2020, 11, 3), _slots(32, 36), _slots(0, 0))}
+    query = ReservationOccurrence.query.filter_by(reservation_id=reservation.id)
+    query.delete(synchronize_session=synchronize_session)
+    assert _get_availability(dummy_room) == set()
+
+
+def test_room_availability_bulk_update_unrelated(db, dummy_room, create_reservation, mocker):
+    reservation = create_reservation(start_dt=datetime(2020, 11, 2, 8), end_dt=datetime(2020, 11, 2, 9))
+    db.session.flush()
+    refresh = mocker.patch('indico.modules.rb.models.room_availability.refresh_room_availability')
+    ReservationOccurrence.query.filter_by(reservation_id=reservation.id).update({'notification_sent': True})
+    assert not refresh.called
+
+
+@pytest.mark.parametrize(('start_time', 'end_time', 'include_pre_bookings', 'available'), (
+    (time(7), time(8), True, True),
+    (time(7), time(8, 15), True, False),
+    (time(9), time(10), True, False),
+    (time(9), time(10), False, True),
+    (time(10), time(12), True, True),
+))
+def test_filter_available_slots(db, dummy_room, create_reservation, start_time, end_time, include_pre_bookings,
+                                available):
+    create_reservation(start_dt=datetime(2020, 11, 2, 8), end_dt=datetime(2020, 11, 2, 9))
+    create_reservation(start_dt=datetime(2020, 11, 3, 9, 30), end_dt=datetime(2020, 11, 3, 10),
+                       state=ReservationState.pending)
+    db.session.flush()
+    availability_filter = Room.filter_available(datetime.combine(date(2020, 11, 2), start_time),
+                                                datetime.combine(date(2020, 11, 3), end_time),
+                                                (RepeatFrequency.DAY, 1), include_blockings=False,
+                                                include_pre_bookings=include_pre_bookings)
+    assert set(Room.find_all(availability_filter)) == ({dummy_room} if available else set())
@@ -20,6 +20,7 @@ from indico.core.db.sqlalchemy.protection import ProtectionManagersMixin, Protec
 from indico.core.db.sqlalchemy.util.queries import db_dates_overlap
 from indico.core.errors import NoReportError
 from indico.legacy.common.cache import GenericCache
+from indico.modules.groups.membership import get_user_groups
 from indico.modules.rb.models.blocked_rooms import BlockedRoom
 from indico.modules.rb.models.blockings import Blocking
 from indico.modules.rb.models.equipment import EquipmentType, RoomEquipmentAssociation
@@ -28,6 +29,7 @@ from indico.modules.rb.models.principals import RoomPrincipal
 from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence
 from indico.modules.rb.models.reservations import Reservation
 from indico.modules.rb.models.room_attributes import RoomAttribute, RoomAttributeAssociation
+from indico.modules.rb.models.room_availability import RoomAvailability, can_use_slots
 from indico.modules.rb.models.room_bookable_hours import BookableHours
 from indico.modules.rb.models.room_nonbookable_periods import NonBookablePeriod
 from indico.modules.rb.util import rb_is_admin
@@ -450,17 +452,23 @@ class Room(ProtectionManagersMixin, db.Model, Serializer):
         """Return a SQLAlchemy filter criterion ensuring that the room is available during the given time."""
         # Check availability against reservation occurrences
         dummy_occurrences = ReservationOccurrence.create_series(start_dt, end_dt, repetition)
-        overlap_criteria = ReservationOccurrence.filter_overlap(dummy_occurrences)
-        reservation_criteria = [Reservation.room_id == Room.id,
-                                ReservationOccurrence.is_valid,
-                                overlap_criteria]
-        if not include_pre_bookings:
-            reservation_criteria.append(Reservation.is_accepted)
-        occurrences_filter = (Reservation.query
-                              .join(ReservationOccurrence.reservation)
-                              .filter(and_(*reservation_criteria)))
+        if can_use_slots(start_dt.time(), end_dt.time()):
+            # all occurrences are within a single day, so we can simply check the availability bitmaps
+            filters = RoomAvailability.filter_free(Room.id, {occ.start_dt.date() for occ in dummy_occurrences},
+                                                   start_dt.time(), end_dt.time(),
+                                                   include_pre_bookings=include_pre_bookings)
+        else:
+            overlap_criteria = ReservationOccurrence.filter_overlap(dummy_occurrences)
+            reservation_criteria = [Reservation.room_id == Room.id,
+                                    ReservationOccurrence.is_valid,
+                                    overlap_criteria]
+            if not include_pre_bookings:
+                reservation_criteria.append(Reservation.is_accepted)
+            occurrences_filter = (Reservation.query
+                                  .join(ReservationOccurrence.reservation)
+                                  .filter(and_(*reservation_criteria)))
+            filters = ~occurrences_filter.exists()
         # Check availability against blockings
-        filters = ~occurrences_filter.exists()
         if include_blockings:
             if include_pending_blockings:
                 valid_states = (BlockedRoom.State.accepted, BlockedRoom.State.pending)
@@ -544,10 +552,12 @@ class Room(ProtectionManagersMixin, db.Model, Serializer):
         for group in user.local_groups:
             criteria.append(db.and_(RoomPrincipal.type == PrincipalType.local_group,
                                     RoomPrincipal.local_group_id == group.id))
-        for group in user.iter_all_multipass_groups():
+        for provider, group_names in get_user_groups(user).viewitems():
+            if not group_names:
+                continue
             criteria.append(db.and_(RoomPrincipal.type == PrincipalType.multipass_group,
-                                    RoomPrincipal.multipass_group_provider == group.provider.name,
-                                    db.func.lower(RoomPrincipal.multipass_group_name) == group.name.lower()))
+                                    RoomPrincipal.multipass_group_provider == provider,
+                                    db.func.lower(RoomPrincipal.multipass_group_name).in_(list(group_names))))
 
         data = {}
         permissions = {'book', 'prebook', 'override', 'moderate', 'manage'}
@@ -8,8 +8,8 @@
 from __future__ import unicode_literals
 
 from collections import defaultdict
-from datetime import datetime
-from itertools import combinations
+from datetime import date, datetime, timedelta
+from operator import attrgetter
 
 from flask import session
 from sqlalchemy.orm import contains_eager
@@ -19,9 +19,14 @@ from indico.modules.rb.models.reservations import Reservation
 from indico.modules.rb.models.rooms import Room
 from indico.modules.rb.util import TempReservationConcurrentOccurrence, TempReservationOccurrence, rb_is_admin
 from indico.util.date_time import get_overlap
+from indico.util.struct.intervals import IntervalIndex
 from indico.util.struct.iterables import group_list
 
 
+# arbitrary day used to index the daily unbookable hours
+_UNBOOKABLE_HOURS_DAY = date(2000, 1, 1)
+
+
 def get_rooms_conflicts(rooms, start_dt, end_dt, repeat_frequency, repeat_interval, blocked_rooms,
                         nonbookable_periods, unbookable_hours, skip_conflicts_with=None, allow_admin=False,
                         skip_past_conflicts=False):
@@ -76,54 +81,65 @@ def get_room_bookings_conflicts(candidates, occurrences, skip_conflicts_with=fro
     conflicts = set()
     pre_conflicts = set()
     conflicting_candidates = set()
+    index = IntervalIndex(occ for occ in occurrences if occ.reservation.id not in skip_conflicts_with)
     for candidate in candidates:
-        for occurrence in occurrences:
-            if occurrence.reservation.id in skip_conflicts_with:
-                continue
-            if candidate.overlaps(occurrence):
-                overlap = candidate.get_overlap(occurrence)
-                obj = TempReservationOccurrence(*overlap, reservation=occurrence.reservation)
-                if occurrence.reservation.is_accepted:
-                    conflicting_candidates.add(candidate)
-                    conflicts.add(obj)
-                else:
-                    pre_conflicts.add(obj)
+        for occurrence in index.iter_overlapping(candidate.start_dt, candidate.end_dt):
+            overlap = candidate.get_overlap(occurrence)
+            obj = TempReservationOccurrence(*overlap, reservation=occurrence.reservation)
+            if occurrence.reservation.is_accepted:
+                conflicting_candidates.add(candidate)
+                conflicts.add(obj)
+            else:
+                pre_conflicts.add(obj)
     return conflicts, pre_conflicts, conflicting_candidates
 
 
 def get_room_blockings_conflicts(room_id, candidates, occurrences):
     conflicts = set()
     conflicting_candidates = set()
+    room = Room.get(room_id)
+    # only the blockings which cannot be overridden by the user are relevant
+    index = IntervalIndex((occ for occ in occurrences if not occ.blocking.can_override(session.user, room=room)),
+                          get_start=attrgetter('blocking.start_date'), get_end=attrgetter('blocking.end_date'))
     for candidate in candidates:
-        for occurrence in occurrences:
-            blocking = occurrence.blocking
-            if blocking.start_date <= candidate.start_dt.date() <= blocking.end_date:
-                if blocking.can_override(session.user, room=Room.get(room_id)):
-                    continue
-                conflicting_candidates.add(candidate)
-                obj = TempReservationOccurrence(candidate.start_dt, candidate.end_dt, None)
-                conflicts.add(obj)
+        candidate_date = candidate.start_dt.date()
+        if index.overlaps(candidate_date, candidate_date, inclusive=True):
+            conflicting_candidates.add(candidate)
+            obj = TempReservationOccurrence(candidate.start_dt, candidate.end_dt, None)
+            conflicts.add(obj)
     return conflicts, conflicting_candidates
 
 
 def get_room_nonbookable_periods_conflicts(candidates, occurrences):
     conflicts = set()
     conflicting_candidates = set()
+    index = IntervalIndex(occurrences)
     for candidate in candidates:
-        for occurrence in occurrences:
+        for occurrence in index.iter_overlapping(candidate.start_dt, candidate.end_dt):
             overlap = get_overlap((candidate.start_dt, candidate.end_dt), (occurrence.start_dt, occurrence.end_dt))
-            if overlap.count(None) != len(overlap):
-                conflicting_candidates.add(candidate)
-                obj = TempReservationOccurrence(overlap[0], overlap[1], None)
-                conflicts.add(obj)
+            conflicting_candidates.add(candidate)
+            obj = TempReservationOccurrence(overlap[0], overlap[1], None)
+            conflicts.add(obj)
     return conflicts, conflicting_candidates
 
 
 def get_room_unbookable_hours_conflicts(candidates, occurrences):
     conflicts = set()
     conflicting_candidates = set()
+    # the unbookable hours are the same every day, so we index them on an arbitrary day
+    # and look up the (slightly extended) time of each candidate on that day.  the exact
+    # overlap is then calculated using the actual date of the candidate
+    index = IntervalIndex(occurrences,
+                          get_start=lambda occ: datetime.combine(_UNBOOKABLE_HOURS_DAY, occ.start_time),
+                          get_end=lambda occ: datetime.combine(_UNBOOKABLE_HOURS_DAY, occ.end_time))
     for candidate in candidates:
-        for occurrence in occurrences:
+        if candidate.start_dt.date() == candidate.end_dt.date():
+            candidate_start = datetime.combine(_UNBOOKABLE_HOURS_DAY, candidate.start_dt.time()) - timedelta(minutes=1)
+            candidate_end = datetime.combine(_UNBOOKABLE_HOURS_DAY, candidate.end_dt.time()) + timedelta(minutes=1)
+            relevant = index.iter_overlapping(candidate_start, candidate_end, inclusive=True)
+        else:
+            relevant = index
+        for occurrence in relevant:
             hours_start_dt = candidate.start_dt.replace(hour=occurrence.start_time.hour,
                                                         minute=occurrence.start_time.minute)
             hours_end_dt = candidate.end_dt.replace(hour=occurrence.end_time.hour,
@@ -138,10 +154,14 @@ def get_room_unbookable_hours_conflicts(candidates, occurrences):
 
 def get_concurrent_pre_bookings(pre_bookings, skip_conflicts_with=frozenset()):
     concurrent_pre_bookings = []
-    for (x, y) in combinations(pre_bookings, 2):
-        if any(pre_booking.reservation.id in skip_conflicts_with for pre_booking in [x, y]):
-            continue
-        if x.overlaps(y):
+    pre_bookings = [(i, pre_booking) for i, pre_booking in enumerate(pre_bookings)
+                    if pre_booking.reservation.id not in skip_conflicts_with]
+    index = IntervalIndex(pre_bookings, get_start=lambda x: x[1].start_dt,
+                          get_end=lambda x: x[1].end_dt)
+    for i, x in pre_bookings:
+        # keep the order in which the pairs would be returned by `combinations()`
+        overlapping = sorted((j, y) for j, y in index.iter_overlapping(x.start_dt, x.end_dt) if j > i)
+        for __, y in overlapping:
             overlap = x.get_overlap(y)
             obj = TempReservationConcurrentOccurrence(*overlap, reservations=[x.reservation, y.reservation])
             concurrent_pre_bookings.append(obj)
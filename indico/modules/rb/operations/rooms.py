@@ -16,6 +16,7 @@ from sqlalchemy.orm import joinedload, load_only
 from indico.core.db import db
 from indico.core.db.sqlalchemy.principals import PrincipalType
 from indico.core.db.sqlalchemy.util.queries import db_dates_overlap, escape_like
+from indico.modules.groups.membership import get_user_groups
 from indico.modules.rb import rb_settings
 from indico.modules.rb.models.equipment import EquipmentType, RoomEquipmentAssociation
 from indico.modules.rb.models.favorites import favorite_room_table
@@ -24,7 +25,7 @@ from indico.modules.rb.models.reservation_occurrences import ReservationOccurren
 from indico.modules.rb.models.reservations import Reservation
 from indico.modules.rb.models.room_features import RoomFeature
 from indico.modules.rb.models.rooms import Room
-from indico.modules.rb.statistics import calculate_rooms_occupancy
+from indico.modules.rb.statistics import calculate_rooms_statistics
 from indico.modules.rb.util import rb_is_admin
 from indico.util.caching import memoize_redis
 
@@ -58,10 +59,12 @@ def _query_managed_rooms(user):
         criteria.append(db.and_(RoomPrincipal.type == PrincipalType.local_group,
                                 RoomPrincipal.local_group_id == group.id,
                                 RoomPrincipal.has_management_permission()))
-    for group in user.iter_all_multipass_groups():
+    for provider, group_names in get_user_groups(user).viewitems():
+        if not group_names:
+            continue
         criteria.append(db.and_(RoomPrincipal.type == PrincipalType.multipass_group,
-                                RoomPrincipal.multipass_group_provider == group.provider.name,
-                                db.func.lower(RoomPrincipal.multipass_group_name) == group.name.lower(),
+                                RoomPrincipal.multipass_group_provider == provider,
+                                db.func.lower(RoomPrincipal.multipass_group_name).in_(list(group_names)),
                                 RoomPrincipal.has_management_permission()))
     return Room.query.filter(~Room.is_deleted, Room.acl_entries.any(db.or_(*criteria)) | (Room.owner == user))
 
@@ -108,8 +111,9 @@ def get_room_statistics(room):
     }
     ranges = [7, 30, 365]
     end_date = date.today()
-    for days in ranges:
-        start_date = date.today() - relativedelta(days=days)
+    periods = [(end_date - relativedelta(days=days), end_date) for days in ranges]
+    room_stats = calculate_rooms_statistics([room], periods)[room.id]
+    for days, (start_date, __), stats in zip(ranges, periods, room_stats):
         count = (ReservationOccurrence.query
                  .join(ReservationOccurrence.reservation)
                  .join(Reservation.room)
@@ -119,7 +123,7 @@ def get_room_statistics(room):
                                           'start_dt', datetime.combine(start_date, time()),
                                           'end_dt', datetime.combine(end_date, time.max)))
                  .count())
-        percentage = calculate_rooms_occupancy([room], start_date, end_date) * 100
+        percentage = stats['occupancy'] * 100
         if count > 0 or percentage > 0:
             data['count']['values'].append({'days': days, 'value': count})
             data['percentage']['values'].append({'days': days, 'value': percentage})
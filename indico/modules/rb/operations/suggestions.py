@@ -7,6 +7,7 @@
 
 from __future__ import unicode_literals
 
+import heapq
 from datetime import datetime, timedelta
 
 from indico.modules.rb import rb_settings
@@ -27,15 +28,15 @@ DURATION_FACTOR = 0.25
 
 
 def get_suggestions(filters, limit=None):
-    blocked_rooms = get_blocked_rooms(filters['start_dt'], filters['end_dt'], [BlockedRoomState.accepted])
-    rooms = [room for room in search_for_rooms(filters, availability=False) if room not in blocked_rooms]
+    blocked_rooms = {room.id for room in get_blocked_rooms(filters['start_dt'], filters['end_dt'],
+                                                           [BlockedRoomState.accepted])}
+    rooms = [room for room in search_for_rooms(filters, availability=False) if room.id not in blocked_rooms]
     if filters['repeat_frequency'] == RepeatFrequency.NEVER:
-        suggestions = sort_suggestions(get_single_booking_suggestions(rooms, filters['start_dt'], filters['end_dt'],
-                                                                      limit=limit))
+        suggestions = get_single_booking_suggestions(rooms, filters['start_dt'], filters['end_dt'])
     else:
-        suggestions = sort_suggestions(get_recurring_booking_suggestions(rooms, filters['start_dt'], filters['end_dt'],
-                                                                         filters['repeat_frequency'],
-                                                                         filters['repeat_interval'], limit=limit))
+        suggestions = get_recurring_booking_suggestions(rooms, filters['start_dt'], filters['end_dt'],
+                                                        filters['repeat_frequency'], filters['repeat_interval'])
+    suggestions = sort_suggestions(suggestions, limit=limit)
     for entry in suggestions:
         entry['room_id'] = entry.pop('room').id
     return suggestions
@@ -54,6 +55,7 @@ def get_single_booking_suggestions(rooms, start_dt, end_dt, limit=None):
     unbookable_hours = get_rooms_unbookable_hours(rooms)
     rooms_occurrences = get_existing_rooms_occurrences(rooms, new_start_dt, new_end_dt, RepeatFrequency.NEVER, None,
                                                        allow_overlapping=True)
+    duration = (end_dt - start_dt).total_seconds() / 60
     for room in rooms:
         if limit and len(data) == limit:
             break
@@ -65,15 +67,16 @@ def get_single_booking_suggestions(rooms, start_dt, end_dt, limit=None):
                                  for uh in unbookable_hours[room.id])
 
         taken_periods = sorted(taken_periods)
-        suggested_time = get_start_time_suggestion(taken_periods, start_dt, end_dt)
+        free_gaps = get_free_gaps(taken_periods, new_start_dt, new_end_dt)
+        suggested_time = next((start for start, end in free_gaps
+                               if (end - start).total_seconds() / 60 >= duration), None)
         if suggested_time:
             suggested_time_change = (suggested_time - start_dt).total_seconds() / 60
             if suggested_time_change and abs(suggested_time_change) <= BOOKING_TIME_DIFF:
                 suggestions['time'] = suggested_time_change
 
         duration_suggestion = get_duration_suggestion(taken_periods, start_dt, end_dt)
-        original_duration = (end_dt - start_dt).total_seconds() / 60
-        if duration_suggestion and duration_suggestion <= DURATION_FACTOR * original_duration:
+        if duration_suggestion and duration_suggestion <= DURATION_FACTOR * duration:
             suggestions['duration'] = duration_suggestion
         if suggestions:
             data.append({'room': room, 'suggestions': suggestions})
@@ -110,29 +113,24 @@ def get_recurring_booking_suggestions(rooms, start_dt, end_dt, repeat_frequency,
     return data
 
 
-def get_start_time_suggestion(occurrences, from_, to):
-    duration = (to - from_).total_seconds() / 60
-    new_start_dt = from_ - timedelta(minutes=BOOKING_TIME_DIFF)
-    new_end_dt = to + timedelta(minutes=BOOKING_TIME_DIFF)
+def get_free_gaps(taken_periods, from_, to):
+    """Get the free periods between ``from_`` and ``to``.
 
-    if not occurrences:
-        return new_start_dt
-
-    candidates = []
-    period_start = new_start_dt
-    for (occ_start, occ_end) in occurrences:
+    :param taken_periods: A sorted list of ``(start, end)`` tuples,
+                          which may overlap each other
+    :return: A list of ``(start, end)`` tuples
+    """
+    gaps = []
+    period_start = from_
+    for occ_start, occ_end in taken_periods:
+        if occ_start >= to:
+            break
         if period_start < occ_start:
-            candidates.append((period_start, occ_start))
-        period_start = occ_end
-
-    if period_start < new_end_dt:
-        candidates.append((period_start, new_end_dt))
-
-    for candidate in candidates:
-        start, end = candidate
-        candidate_duration = (end - start).total_seconds() / 60
-        if duration <= candidate_duration:
-            return start
+            gaps.append((period_start, occ_start))
+        period_start = max(period_start, occ_end)
+    if period_start < to:
+        gaps.append((period_start, to))
+    return gaps
 
 
 def get_duration_suggestion(occurrences, from_, to):
@@ -159,9 +157,16 @@ def get_duration_suggestion(occurrences, from_, to):
     return abs(duration - old_duration) if old_duration != duration else None
 
 
-def sort_suggestions(suggestions):
-    def cmp_fn(a, b):
-        a_time, a_duration = abs(a.get('time', 0)), a.get('duration', 0)
-        b_time, b_duration = abs(b.get('time', 0)), b.get('duration', 0)
-        return int(a_time + a_duration * 0.2) - int(b_time + b_duration * 0.2)
-    return sorted(suggestions, cmp=cmp_fn, key=lambda item: item['suggestions'])
+def _get_suggestion_score(item):
+    suggestions = item['suggestions']
+    return int(abs(suggestions.get('time', 0)) + suggestions.get('duration', 0) * 0.2)
+
+
+def sort_suggestions(suggestions, limit=None):
+    """Sort suggestions so the ones requiring the smallest changes come first.
+
+    :param limit: If set, only the best `limit` suggestions are returned
+    """
+    if limit:
+        return heapq.nsmallest(limit, suggestions, key=_get_suggestion_score)
+    return sorted(suggestions, key=_get_suggestion_score)
@@ -0,0 +1,42 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+import pytest
+
+from indico.modules.rb.operations.suggestions import get_free_gaps, sort_suggestions
+
+
+def _dt(hour, minute=0):
+    return datetime(2020, 11, 2, hour, minute)
+
+
+@pytest.mark.parametrize(('taken_periods', 'expected'), (
+    ([], [(_dt(8), _dt(12))]),
+    ([(_dt(7), _dt(13))], []),
+    ([(_dt(7), _dt(9))], [(_dt(9), _dt(12))]),
+    ([(_dt(9), _dt(10)), (_dt(11), _dt(13))], [(_dt(8), _dt(9)), (_dt(10), _dt(11))]),
+    # overlapping periods, the second one ending before the first one
+    ([(_dt(9), _dt(11)), (_dt(9, 30), _dt(10))], [(_dt(8), _dt(9)), (_dt(11), _dt(12))]),
+    ([(_dt(12), _dt(14))], [(_dt(8), _dt(12))]),
+))
+def test_get_free_gaps(taken_periods, expected):
+    assert get_free_gaps(taken_periods, _dt(8), _dt(12)) == expected
+
+
+@pytest.mark.parametrize('limit', (None, 1, 2, 10))
+def test_sort_suggestions(limit):
+    suggestions = [{'room': 'a', 'suggestions': {'time': 20}},
+                   {'room': 'b', 'suggestions': {'time': -10}},
+                   {'room': 'c', 'suggestions': {'duration': 30}},
+                   {'room': 'd', 'suggestions': {'time': 10, 'duration': 10}},
+                   {'room': 'e', 'suggestions': {'skip': 2}}]
+    expected = ['e', 'c', 'b', 'd', 'a']
+    assert [x['room'] for x in sort_suggestions(suggestions, limit=limit)] == expected[:limit]
@@ -7,6 +7,7 @@
 
 from __future__ import division, unicode_literals
 
+from collections import defaultdict
 from datetime import date, datetime, time
 
 from dateutil.relativedelta import relativedelta
@@ -14,52 +15,140 @@ from dateutil.relativedelta import relativedelta
 from indico.core.db import db
 from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence
 from indico.modules.rb.models.reservations import Reservation
-from indico.util.date_time import iterdays
 
 
 WORKING_TIME_PERIODS = ((time(8, 30), time(12, 30)), (time(13, 30), time(17, 30)))
 
 
-def calculate_rooms_bookable_time(rooms, start_date=None, end_date=None):
+def _get_default_dates(start_date, end_date):
     if end_date is None:
         end_date = date.today() - relativedelta(days=1)
     if start_date is None:
         start_date = end_date - relativedelta(days=29)
-    working_time_per_day = sum((datetime.combine(date.today(), end) - datetime.combine(date.today(), start)).seconds
-                               for start, end in WORKING_TIME_PERIODS)
-    working_days = sum(1 for __ in iterdays(start_date, end_date, skip_weekends=True))
-    return working_days * working_time_per_day * len(rooms)
+    return start_date, end_date
 
 
-def calculate_rooms_booked_time(rooms, start_date=None, end_date=None):
-    if end_date is None:
-        end_date = date.today() - relativedelta(days=1)
-    if start_date is None:
-        start_date = end_date - relativedelta(days=29)
-    # Reservations on working days
-    reservations = Reservation.find(Reservation.room_id.in_(r.id for r in rooms),
-                                    db.extract('dow', ReservationOccurrence.start_dt).between(1, 5),
-                                    db.cast(ReservationOccurrence.start_dt, db.Date) >= start_date,
-                                    db.cast(ReservationOccurrence.end_dt, db.Date) <= end_date,
-                                    ReservationOccurrence.is_valid,
-                                    _join=ReservationOccurrence)
+def _get_working_time_per_day():
+    return sum((datetime.combine(date.today(), end) - datetime.combine(date.today(), start)).seconds
+               for start, end in WORKING_TIME_PERIODS)
+
 
+def _count_working_days(start_date, end_date):
+    """Count the weekdays between two dates (both inclusive)."""
+    if start_date > end_date:
+        return 0
+    days = (end_date - start_date).days + 1
+    weeks, remainder = divmod(days, 7)
+    first_weekday = start_date.weekday()
+    return weeks * 5 + sum(1 for i in xrange(remainder) if (first_weekday + i) % 7 < 5)
+
+
+def _get_booked_time_expr():
     rsv_start = db.cast(ReservationOccurrence.start_dt, db.TIME)
     rsv_end = db.cast(ReservationOccurrence.end_dt, db.TIME)
     slots = ((db.cast(start, db.TIME), db.cast(end, db.TIME)) for start, end in WORKING_TIME_PERIODS)
 
     # this basically handles all possible ways an occurrence overlaps with each one of the working time slots
-    overlaps = sum(db.case([
+    return sum(db.case([
         ((rsv_start < start) & (rsv_end > end), db.extract('epoch', end - start)),
         ((rsv_start < start) & (rsv_end > start) & (rsv_end <= end), db.extract('epoch', rsv_end - start)),
         ((rsv_start >= start) & (rsv_start < end) & (rsv_end > end), db.extract('epoch', end - rsv_start)),
         ((rsv_start >= start) & (rsv_end <= end), db.extract('epoch', rsv_end - rsv_start))
     ], else_=0) for start, end in slots)
 
-    return reservations.with_entities(db.func.sum(overlaps)).scalar() or 0
+
+def _get_booked_time_query(room_ids, start_date, end_date):
+    # Reservations on working days
+    return Reservation.find(Reservation.room_id.in_(room_ids),
+                            db.extract('dow', ReservationOccurrence.start_dt).between(1, 5),
+                            db.cast(ReservationOccurrence.start_dt, db.Date) >= start_date,
+                            db.cast(ReservationOccurrence.end_dt, db.Date) <= end_date,
+                            ReservationOccurrence.is_valid,
+                            _join=ReservationOccurrence)
+
+
+def calculate_rooms_bookable_time(rooms, start_date=None, end_date=None):
+    start_date, end_date = _get_default_dates(start_date, end_date)
+    return _count_working_days(start_date, end_date) * _get_working_time_per_day() * len(rooms)
+
+
+def calculate_rooms_booked_time(rooms, start_date=None, end_date=None):
+    start_date, end_date = _get_default_dates(start_date, end_date)
+    query = _get_booked_time_query([r.id for r in rooms], start_date, end_date)
+    return query.with_entities(db.func.sum(_get_booked_time_expr())).scalar() or 0
 
 
 def calculate_rooms_occupancy(rooms, start=None, end=None):
     bookable_time = calculate_rooms_bookable_time(rooms, start, end)
     booked_time = calculate_rooms_booked_time(rooms, start, end)
     return booked_time / bookable_time if bookable_time else 0
+
+
+def calculate_rooms_statistics(rooms, periods):
+    """Calculate the booked/bookable time of many rooms for many periods.
+
+    Unlike calling :func:`calculate_rooms_occupancy` for each room and
+    period, this only runs a single query which retrieves the booked
+    time per room and day for the whole timespan covered by the periods.
+    The values for the individual periods are then summed up from those
+    daily values.
+
+    :param rooms: The rooms to get the statistics for
+    :param periods: A list of ``(start_date, end_date)`` tuples (both
+                    inclusive)
+    :return: A dict mapping room ids to a list containing a dict with
+             the ``booked`` and ``bookable`` time (in seconds) and the
+             ``occupancy`` for each period
+    """
+    room_ids = [r.id for r in rooms]
+    if not room_ids or not periods:
+        return {room_id: [] for room_id in room_ids}
+    first_date = min(start for start, end in periods)
+    last_date = max(end for start, end in periods)
+    start_day = db.cast(ReservationOccurrence.start_dt, db.Date)
+    end_day = db.cast(ReservationOccurrence.end_dt, db.Date)
+    query = (_get_booked_time_query(room_ids, first_date, last_date)
+             .with_entities(Reservation.room_id, start_day, end_day, db.func.sum(_get_booked_time_expr()))
+             .group_by(Reservation.room_id, start_day, end_day))
+    booked_per_day = defaultdict(list)
+    for room_id, start, end, booked_time in query:
+        booked_per_day[room_id].append((start, end, booked_time or 0))
+
+    working_time_per_day = _get_working_time_per_day()
+    bookable_times = [_count_working_days(start, end) * working_time_per_day for start, end in periods]
+    stats = {}
+    for room_id in room_ids:
+        days = booked_per_day[room_id]
+        stats[room_id] = room_stats = []
+        for (period_start, period_end), bookable_time in zip(periods, bookable_times):
+            booked_time = sum(booked for start, end, booked in days if start >= period_start and end <= period_end)
+            room_stats.append({'booked': booked_time,
+                               'bookable': bookable_time,
+                               'occupancy': booked_time / bookable_time if bookable_time else 0})
+    return stats
+
+
+def iter_months(start_date, end_date):
+    """Split a date range into ``(start_date, end_date)`` tuples per month.
+
+    The first and last month are clipped to the date range.
+    """
+    month_start = start_date
+    while month_start <= end_date:
+        next_month = month_start + relativedelta(months=1, day=1)
+        yield month_start, min(next_month - relativedelta(days=1), end_date)
+        month_start = next_month
+
+
+def calculate_rooms_monthly_statistics(rooms, start_date, end_date):
+    """Calculate the booked/bookable time of many rooms for each month.
+
+    :return: A dict mapping room ids to a list of ``(month, stats)``
+             tuples, where ``month`` is the first day of the month and
+             ``stats`` is a dict as returned by
+             :func:`calculate_rooms_statistics`.
+    """
+    periods = list(iter_months(start_date, end_date))
+    stats = calculate_rooms_statistics(rooms, periods)
+    return {room_id: [(start.replace(day=1), period_stats) for (start, end), period_stats in zip(periods, room_stats)]
+            for room_id, room_stats in stats.iteritems()}
@@ -0,0 +1,62 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from indico.modules.rb.models.reservations import RepeatFrequency
+from indico.modules.rb.statistics import (_count_working_days, calculate_rooms_booked_time,
+                                          calculate_rooms_bookable_time, calculate_rooms_monthly_statistics,
+                                          calculate_rooms_statistics, iter_months)
+from indico.util.date_time import iterdays
+
+
+pytest_plugins = 'indico.modules.rb.testing.fixtures'
+
+
+@pytest.mark.parametrize('start_date', [date(2020, 11, 2) + timedelta(days=i) for i in range(7)])
+@pytest.mark.parametrize('days', (-1, 0, 1, 4, 6, 7, 8, 13, 30, 366))
+def test_count_working_days(start_date, days):
+    end_date = start_date + timedelta(days=days)
+    expected = sum(1 for __ in iterdays(start_date, end_date, skip_weekends=True))
+    assert _count_working_days(start_date, end_date) == expected
+
+
+def test_iter_months():
+    assert list(iter_months(date(2020, 1, 15), date(2020, 3, 10))) == [
+        (date(2020, 1, 15), date(2020, 1, 31)),
+        (date(2020, 2, 1), date(2020, 2, 29)),
+        (date(2020, 3, 1), date(2020, 3, 10)),
+    ]
+    assert list(iter_months(date(2020, 1, 15), date(2020, 1, 15))) == [(date(2020, 1, 15), date(2020, 1, 15))]
+    assert list(iter_months(date(2020, 1, 15), date(2020, 1, 14))) == []
+
+
+def test_calculate_rooms_statistics(db, create_room, create_reservation):
+    rooms = [create_room(), create_room()]
+    create_reservation(room=rooms[0], start_dt=datetime(2020, 10, 1, 8), end_dt=datetime(2020, 11, 30, 12),
+                       repeat_frequency=RepeatFrequency.DAY)
+    create_reservation(room=rooms[1], start_dt=datetime(2020, 10, 15, 12), end_dt=datetime(2020, 10, 25, 19),
+                       repeat_frequency=RepeatFrequency.WEEK)
+    periods = [(date(2020, 10, 1), date(2020, 10, 31)),
+               (date(2020, 10, 10), date(2020, 11, 10)),
+               (date(2020, 11, 1), date(2020, 12, 31))]
+    stats = calculate_rooms_statistics(rooms, periods)
+    assert set(stats) == {room.id for room in rooms}
+    for room in rooms:
+        for (start_date, end_date), period_stats in zip(periods, stats[room.id]):
+            assert period_stats['booked'] == calculate_rooms_booked_time([room], start_date, end_date)
+            assert period_stats['bookable'] == calculate_rooms_bookable_time([room], start_date, end_date)
+    assert stats[rooms[0].id][0]['booked'] > 0
+    assert stats[rooms[1].id][2]['booked'] == 0
+
+    monthly = calculate_rooms_monthly_statistics(rooms, date(2020, 10, 1), date(2020, 11, 30))
+    assert [month for month, __ in monthly[rooms[0].id]] == [date(2020, 10, 1), date(2020, 11, 1)]
+    assert monthly[rooms[0].id][0][1] == stats[rooms[0].id][0]
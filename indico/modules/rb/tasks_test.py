@@ -12,8 +12,10 @@ from itertools import chain
 import dateutil.parser
 
 from indico.modules.rb import rb_settings
+from indico.modules.rb.models.reservation_occurrences import ReservationOccurrence
 from indico.modules.rb.models.reservations import RepeatFrequency
-from indico.modules.rb.tasks import roombooking_end_notifications, roombooking_occurrences
+from indico.modules.rb.models.room_availability import RoomAvailability
+from indico.modules.rb.tasks import _notify_occurrences, roombooking_end_notifications, roombooking_occurrences
 
 
 pytest_plugins = 'indico.modules.rb.testing.fixtures'
@@ -235,3 +237,19 @@ def test_roombooking_notifications(mocker, create_user, create_room, create_rese
             assert reservation.end_notification_sent == should_be_sent
         assert all(not r.end_notification_sent for r in end_notifications)
     assert not end_notification_map
+
+
+def test_notify_daily_occurrences(mocker, db, dummy_user, dummy_room, create_reservation, freeze_time):
+    freeze_time(datetime(2017, 4, 1, 8, 0, 0))
+    reservation = create_reservation(start_dt=datetime(2017, 4, 3, 12), end_dt=datetime(2017, 4, 5, 14),
+                                     repeat_frequency=RepeatFrequency.DAY)
+    db.session.flush()
+    availability = {(x.date, x.booked) for x in RoomAvailability.query.filter_by(room_id=dummy_room.id)}
+    assert len(availability) == 3
+    notify_upcoming_occurrences = mocker.patch('indico.modules.rb.tasks.notify_upcoming_occurrences')
+    occurrence = reservation.occurrences.order_by(ReservationOccurrence.start_dt).first()
+    _notify_occurrences(dummy_user, [occurrence])
+    notify_upcoming_occurrences.assert_called_once_with(dummy_user, [occurrence])
+    assert all(occ.notification_sent for occ in reservation.occurrences)
+    # sending notifications does not affect the availability of the room
+    assert {(x.date, x.booked) for x in RoomAvailability.query.filter_by(room_id=dummy_room.id)} == availability
@@ -0,0 +1,64 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from bisect import bisect_left, bisect_right
+from operator import attrgetter, itemgetter
+
+
+class IntervalIndex(object):
+    """Index to efficiently find the intervals overlapping a range.
+
+    The intervals are kept sorted by their start.  Since no interval
+    is longer than the longest one, all intervals which may overlap
+    a range can be found using binary search instead of comparing the
+    range against every single interval.  This works best when the
+    lengths of the indexed intervals are in the same order of magnitude,
+    which is usually the case e.g. for the occurrences of bookings.
+
+    The index is static; it needs to be rebuilt if the intervals
+    change.
+
+    :param items: The objects to index
+    :param get_start: A callable returning the start of an item
+    :param get_end: A callable returning the end of an item
+    """
+
+    def __init__(self, items, get_start=attrgetter('start_dt'), get_end=attrgetter('end_dt')):
+        self._entries = sorted(((get_start(x), get_end(x), x) for x in items), key=itemgetter(0))
+        self._starts = [entry[0] for entry in self._entries]
+        self._max_length = max(end - start for start, end, __ in self._entries) if self._entries else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        return (item for __, __, item in self._entries)
+
+    def iter_overlapping(self, start, end, inclusive=False):
+        """Iterate over the items overlapping a range.
+
+        The items are returned in the order of their start.
+
+        :param start: The start of the range
+        :param end: The end of the range
+        :param inclusive: Whether intervals merely touching the range
+                          (e.g. ending exactly when the range starts)
+                          are considered overlapping
+        """
+        if not self._entries:
+            return
+        first = bisect_left(self._starts, start - self._max_length)
+        last = bisect_right(self._starts, end) if inclusive else bisect_left(self._starts, end)
+        for item_start, item_end, item in self._entries[first:last]:
+            if item_end > start or (inclusive and item_end == start):
+                yield item
+
+    def overlaps(self, start, end, inclusive=False):
+        """Check whether any item overlaps a range."""
+        return next(self.iter_overlapping(start, end, inclusive), None) is not None
@@ -0,0 +1,60 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+import random
+from itertools import product
+from operator import itemgetter
+
+import pytest
+
+from indico.util.struct.intervals import IntervalIndex
+
+
+def _make_index(intervals):
+    return IntervalIndex(intervals, get_start=itemgetter(0), get_end=itemgetter(1))
+
+
+def test_interval_index_empty():
+    index = _make_index([])
+    assert len(index) == 0
+    assert list(index.iter_overlapping(0, 10)) == []
+    assert not index.overlaps(0, 10)
+
+
+@pytest.mark.parametrize(('start', 'end', 'inclusive', 'expected'), (
+    (0, 1, False, []),
+    (0, 2, False, []),
+    (0, 2, True, [(2, 4)]),
+    (0, 3, False, [(2, 4)]),
+    (3, 3, True, [(2, 4)]),
+    (4, 5, False, [(4, 10)]),
+    (4, 5, True, [(2, 4), (4, 10), (5, 6)]),
+    (6, 7, False, [(4, 10)]),
+    (10, 12, False, []),
+    (10, 12, True, [(4, 10)]),
+))
+def test_interval_index(start, end, inclusive, expected):
+    index = _make_index([(5, 6), (2, 4), (4, 10)])
+    assert list(index.iter_overlapping(start, end, inclusive)) == expected
+    assert index.overlaps(start, end, inclusive) == bool(expected)
+
+
+def test_interval_index_random():
+    rnd = random.Random(1337)
+    intervals = []
+    for __ in xrange(200):
+        start = rnd.randint(0, 1000)
+        intervals.append((start, start + rnd.randint(0, 50)))
+    index = _make_index(intervals)
+    for (start, length), inclusive in product([(rnd.randint(-50, 1050), rnd.randint(0, 30)) for __ in xrange(200)],
+                                              (True, False)):
+        end = start + length
+        if inclusive:
+            expected = {x for x in intervals if x[0] <= end and start <= x[1]}
+        else:
+            expected = {x for x in intervals if x[0] < end and start < x[1]}
+        assert set(index.iter_overlapping(start, end, inclusive)) == expected
@@ -7,25 +7,71 @@
 
 from __future__ import division, print_function, unicode_literals
 
-from collections import defaultdict
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
 from datetime import date, timedelta
 
-from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.orm import joinedload
 
+from indico.core.db import db
 from indico.modules.events import Event
 from indico.modules.events.abstracts.util import get_events_with_abstract_persons
 from indico.modules.events.contributions.util import get_events_with_linked_contributions
 from indico.modules.events.registration.util import get_events_registered
 from indico.modules.events.surveys.util import get_events_with_submitted_surveys
-from indico.util.date_time import now_utc, utc_to_server
+from indico.util.date_time import now_utc, overlaps, utc_to_server
 from indico.util.struct.iterables import window
 
 
+_TimelineEvent = namedtuple('_TimelineEvent', ('id', 'start_dt', 'end_dt'))
+
+
+class CategoryTimeline(object):
+    """The (non-deleted) events in a category, ordered by start date.
+
+    This allows scoring a category for many users without querying
+    its events again for each of them.
+    """
+
+    def __init__(self, events):
+        self.events = events
+        self._start_dts = [e.start_dt for e in events]
+
+    @classmethod
+    def load_many(cls, category_ids):
+        """Load the timelines of multiple categories at once.
+
+        :return: A dict mapping category ids to timelines.
+        """
+        events = defaultdict(list)
+        query = (db.session.query(Event.category_id, Event.id, Event.start_dt, Event.end_dt)
+                 .filter(Event.category_id.in_(category_ids), ~Event.is_deleted)
+                 .order_by(Event.start_dt, Event.id))
+        for category_id, event_id, start_dt, end_dt in query:
+            events[category_id].append(_TimelineEvent(event_id, start_dt, end_dt))
+        return {id_: cls(events[id_]) for id_ in category_ids}
+
+    def between(self, from_dt=None, to_dt=None):
+        """Get the events taking place within two dates.
+
+        This uses the same logic as :meth:`Event.happens_between`.
+        """
+        if from_dt is not None and to_dt is not None:
+            candidates = self.events[:bisect_right(self._start_dts, to_dt)]
+            return [e for e in candidates if overlaps((e.start_dt, e.end_dt), (from_dt, to_dt), inclusive=True)]
+        elif from_dt is not None:
+            return self.events[bisect_left(self._start_dts, from_dt):]
+        elif to_dt is not None:
+            return [e for e in self.events if e.end_dt <= to_dt]
+        else:
+            return list(self.events)
+
+
 def _get_blocks(events, attended):
     blocks = []
     block = []
     for event in events:
-        if event not in attended:
+        if event.id not in attended:
             if block:
                 blocks.append(block)
             block = []
@@ -36,14 +82,7 @@ def _get_blocks(events, attended):
     return blocks
 
 
-def _query_categ_events(categ, start_dt, end_dt):
-    return (Event.query
-            .with_parent(categ)
-            .filter(Event.happens_between(start_dt, end_dt))
-            .options(load_only('id', 'start_dt', 'end_dt')))
-
-
-def _get_category_score(user, categ, attended_events, debug=False):
+def _get_category_score(user, categ, attended_events, timeline, debug=False):
     if debug:
         print(repr(categ))
     # We care about events in the whole timespan where the user attended some events.
@@ -52,7 +91,8 @@ def _get_category_score(user, categ, attended_events, debug=False):
     # to the start time of the newest block)
     first_event_date = attended_events[0].start_dt.replace(hour=0, minute=0)
     last_event_date = attended_events[-1].start_dt.replace(hour=0, minute=0) + timedelta(days=1)
-    blocks = _get_blocks(_query_categ_events(categ, first_event_date, last_event_date), attended_events)
+    attended_ids = {e.id for e in attended_events}
+    blocks = _get_blocks(timeline.between(first_event_date, last_event_date), attended_ids)
     for a, b in window(blocks):
         # More than 3 months between blocks? Ignore the old block!
         if b[0].start_dt - a[-1].start_dt > timedelta(weeks=12):
@@ -64,14 +104,14 @@ def _get_category_score(user, categ, attended_events, debug=False):
         print('{0:+.3f} - initial'.format(score))
     # Attendance percentage goes to the score directly. If the attendance is high chances are good that the user
     # is either very interested in whatever goes on in the category or it's something he has to attend regularily.
-    total = _query_categ_events(categ, first_event_date, last_event_date).count()
+    total = len(timeline.between(first_event_date, last_event_date))
     if total:
         attended_block_event_count = sum(1 for e in attended_events if e.start_dt >= first_event_date)
         score += attended_block_event_count / total
     if debug:
         print('{0:+.3f} - attendance'.format(score))
     # If there are lots/few unattended events after the last attended one we also update the score with that
-    total_after = _query_categ_events(categ, last_event_date + timedelta(days=1), None).count()
+    total_after = len(timeline.between(last_event_date + timedelta(days=1), None))
     if total_after < total * 0.05:
         score += 0.25
     elif total_after > total * 0.25:
@@ -88,9 +128,7 @@ def _get_category_score(user, categ, attended_events, debug=False):
         print('{0:+.3f} - days since last event'.format(score))
     # For events in the future however we raise the score
     now_local = utc_to_server(now_utc())
-    attending_future = (_query_categ_events(categ, now_local, last_event_date)
-                        .filter(Event.id.in_(e.id for e in attended_events))
-                        .all())
+    attending_future = [e for e in timeline.between(now_local, last_event_date) if e.id in attended_ids]
     if attending_future:
         score += 0.25 * len(attending_future)
         if debug:
@@ -102,7 +140,17 @@ def _get_category_score(user, categ, attended_events, debug=False):
     return score
 
 
-def get_category_scores(user, debug=False):
+def get_category_scores(user, debug=False, timelines=None):
+    """Get the suggestion scores of the categories a user attended events in.
+
+    :param user: A :class:`.User`
+    :param debug: Whether to print how the scores are calculated
+    :param timelines: A dict used to cache :class:`CategoryTimeline`
+                      objects by category id.  Pass the same dict when
+                      scoring multiple users to load the events of each
+                      category only once.
+    :return: A dict mapping categories to scores
+    """
     # XXX: check if we can add some more roles such as 'contributor' to assume attendance
     event_ids = set()
     event_ids.update(id_
@@ -123,5 +171,10 @@ def get_category_scores(user, debug=False):
     categ_events = defaultdict(list)
     for event in attended:
         categ_events[event.category].append(event)
-    return dict((categ, _get_category_score(user, categ, events, debug))
+    if timelines is None:
+        timelines = {}
+    missing = {categ.id for categ in categ_events} - timelines.viewkeys()
+    if missing:
+        timelines.update(CategoryTimeline.load_many(missing))
+    return dict((categ, _get_category_score(user, categ, events, timelines[categ.id], debug))
                 for categ, events in categ_events.iteritems())
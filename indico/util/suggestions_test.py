@@ -0,0 +1,45 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+import pytest
+import pytz
+
+from indico.util.suggestions import CategoryTimeline, _TimelineEvent
+
+
+def _dt(day):
+    return datetime(2020, 11, day, tzinfo=pytz.utc)
+
+
+@pytest.fixture
+def timeline():
+    return CategoryTimeline([_TimelineEvent(1, _dt(1), _dt(2)),
+                             _TimelineEvent(2, _dt(3), _dt(8)),
+                             _TimelineEvent(3, _dt(5), _dt(5)),
+                             _TimelineEvent(4, _dt(10), _dt(11))])
+
+
+@pytest.mark.parametrize(('from_day', 'to_day', 'expected'), (
+    (None, None, [1, 2, 3, 4]),
+    (1, 30, [1, 2, 3, 4]),
+    (2, 4, [1, 2]),
+    (6, 9, [2]),
+    (5, 5, [2, 3]),
+    (12, 30, []),
+    (3, None, [2, 3, 4]),
+    (4, None, [3, 4]),
+    (None, 5, [1, 3]),
+    (None, 1, []),
+))
+def test_category_timeline_between(timeline, from_day, to_day, expected):
+    from_dt = _dt(from_day) if from_day else None
+    to_dt = _dt(to_day) if to_day else None
+    assert [e.id for e in timeline.between(from_dt, to_dt)] == expected
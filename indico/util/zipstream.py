@@ -0,0 +1,197 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import absolute_import, unicode_literals
+
+import struct
+import zlib
+from datetime import datetime
+from zipfile import (ZIP64_LIMIT, ZIP_DEFLATED, ZIP_FILECOUNT_LIMIT, ZIP_STORED, stringCentralDir, stringEndArchive,
+                     stringEndArchive64, stringEndArchive64Locator, stringFileHeader, structCentralDir,
+                     structEndArchive, structEndArchive64, structEndArchive64Locator, structFileHeader)
+
+
+#: Content types which are already compressed and thus stored as-is
+COMPRESSED_CONTENT_TYPES = {'application/gzip', 'application/x-7z-compressed', 'application/x-bzip2',
+                            'application/x-rar-compressed', 'application/x-xz', 'application/zip',
+                            'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+                            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                            'application/vnd.openxmlformats-officedocument.wordprocessingml.document'}
+
+_CHUNK_SIZE = 1024 * 1024
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+_EXTRA_ZIP64 = 0x0001
+_VERSION_DEFAULT = 20
+_VERSION_ZIP64 = 45
+# version made by: unix, so the external attributes contain the file mode
+_CREATE_SYSTEM = 3
+_EXTERNAL_ATTR = 0o100644 << 16
+
+
+def should_compress(content_type):
+    """Check whether a file should be compressed in a ZIP archive.
+
+    Compressing files which are already compressed is only a waste of
+    CPU time, so this is only done for other files.
+    """
+    if not content_type:
+        return True
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    if content_type.split('/', 1)[0] in {'audio', 'image', 'video'}:
+        return content_type in {'image/bmp', 'image/svg+xml'}
+    return content_type not in COMPRESSED_CONTENT_TYPES
+
+
+def _dos_date_time(dt):
+    dt = max(dt, datetime(1980, 1, 1))
+    return (((dt.year - 1980) << 9) | (dt.month << 5) | dt.day,
+            (dt.hour << 11) | (dt.minute << 5) | (dt.second // 2))
+
+
+class _ZipEntry(object):
+    def __init__(self, name, date_time, compress, zip64, offset):
+        self.name = name.encode('utf-8')
+        self.date, self.time = _dos_date_time(date_time)
+        self.compress_type = ZIP_DEFLATED if compress else ZIP_STORED
+        self.zip64 = zip64
+        self.offset = offset
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+
+    @property
+    def version(self):
+        return _VERSION_ZIP64 if self.zip64 or self.offset > ZIP64_LIMIT else _VERSION_DEFAULT
+
+    def get_local_header(self):
+        extra = b''
+        size = 0
+        if self.zip64:
+            # the actual sizes are only written in the data descriptor
+            extra = struct.pack(b'<HHQQ', _EXTRA_ZIP64, 16, 0, 0)
+            size = 0xffffffff
+        header = struct.pack(structFileHeader, stringFileHeader, self.version, 0,
+                             _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8, self.compress_type, self.time, self.date,
+                             0, size, size, len(self.name), len(extra))
+        return header + self.name + extra
+
+    def get_data_descriptor(self):
+        fmt = b'<4sLQQ' if self.zip64 else b'<4sLLL'
+        return struct.pack(fmt, _DATA_DESCRIPTOR_SIGNATURE, self.crc, self.compress_size, self.file_size)
+
+    def get_central_directory_record(self):
+        zip64_values = []
+        file_size = self.file_size
+        compress_size = self.compress_size
+        offset = self.offset
+        if self.zip64 or file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
+            zip64_values += [file_size, compress_size]
+            file_size = compress_size = 0xffffffff
+        if offset > ZIP64_LIMIT:
+            zip64_values.append(offset)
+            offset = 0xffffffff
+        extra = b''
+        if zip64_values:
+            extra = struct.pack(b'<HH{}Q'.format(len(zip64_values)), _EXTRA_ZIP64, 8 * len(zip64_values),
+                                *zip64_values)
+        record = struct.pack(structCentralDir, stringCentralDir, self.version, _CREATE_SYSTEM, self.version, 0,
+                             _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8, self.compress_type, self.time, self.date,
+                             self.crc, compress_size, file_size, len(self.name), len(extra), 0, 0, 0,
+                             _EXTERNAL_ATTR, offset)
+        return record + self.name + extra
+
+
+class StreamingZipFile(object):
+    """Generate a ZIP archive without writing it to a seekable file.
+
+    The archive is generated as a sequence of bytestrings which can be
+    sent directly to the client (or written to any file-like object).
+    Since the CRC and size of each file are only known after it has
+    been read completely, they are written after the file's data and
+    thus the file contents never have to be kept in memory.
+
+    ZIP64 extensions are used for files larger than 2 GB (or of unknown
+    size) and for archives exceeding the limits of a regular ZIP file.
+
+    Usage::
+
+        zip_file = StreamingZipFile()
+        for name, fileobj in files:
+            for chunk in zip_file.write_file(name, fileobj):
+                yield chunk
+        for chunk in zip_file.close():
+            yield chunk
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._offset = 0
+
+    def _emit(self, data):
+        self._offset += len(data)
+        return data
+
+    def write_file(self, name, fileobj, size=None, date_time=None, compress=True):
+        """Add a file to the archive.
+
+        :param name: The path of the file within the archive
+        :param fileobj: A file-like object containing the data to add
+        :param size: The size of the file if it is known in advance;
+                     if it is not known ZIP64 extensions are used in
+                     case the file turns out to be very large.
+        :param date_time: The modification time of the file as a naive
+                          `datetime`; defaults to the current time
+        :param compress: Whether the file should be compressed
+        :return: An iterator yielding the archive data as bytestrings
+        """
+        entry = _ZipEntry(name, date_time or datetime.now(), compress, size is None or size > ZIP64_LIMIT,
+                          self._offset)
+        self._entries.append(entry)
+        yield self._emit(entry.get_local_header())
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if compress else None
+        crc = 0
+        while True:
+            data = fileobj.read(_CHUNK_SIZE)
+            if not data:
+                break
+            entry.file_size += len(data)
+            crc = zlib.crc32(data, crc)
+            if compressor:
+                data = compressor.compress(data)
+            entry.compress_size += len(data)
+            if data:
+                yield self._emit(data)
+        if compressor:
+            data = compressor.flush()
+            entry.compress_size += len(data)
+            yield self._emit(data)
+        if not entry.zip64 and (entry.file_size > 0xffffffff or entry.compress_size > 0xffffffff):
+            raise ValueError('{} is bigger than its specified size'.format(name))
+        entry.crc = crc & 0xffffffff
+        yield self._emit(entry.get_data_descriptor())
+
+    def close(self):
+        """Finish the archive by writing its central directory.
+
+        :return: An iterator yielding the archive data as bytestrings
+        """
+        start = self._offset
+        for entry in self._entries:
+            yield self._emit(entry.get_central_directory_record())
+        size = self._offset - start
+        count = len(self._entries)
+        if count >= ZIP_FILECOUNT_LIMIT or start > ZIP64_LIMIT or size > ZIP64_LIMIT:
+            end_offset = self._offset
+            yield self._emit(struct.pack(structEndArchive64, stringEndArchive64, 44, _VERSION_ZIP64,
+                                         _VERSION_ZIP64, 0, 0, count, count, size, start))
+            yield self._emit(struct.pack(structEndArchive64Locator, stringEndArchive64Locator, 0, end_offset, 1))
+            count = min(count, 0xffff)
+            size = min(size, 0xffffffff)
+            start = min(start, 0xffffffff)
+        yield self._emit(struct.pack(structEndArchive, stringEndArchive, 0, 0, count, count, size, start, 0))
@@ -0,0 +1,66 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import os
+from datetime import datetime
+from io import BytesIO
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+import pytest
+
+from indico.util.zipstream import StreamingZipFile, should_compress
+
+
+def _make_zip(files, known_size=True):
+    zip_file = StreamingZipFile()
+    buf = BytesIO()
+    for name, data, compress in files:
+        for chunk in zip_file.write_file(name, BytesIO(data), size=(len(data) if known_size else None),
+                                         date_time=datetime(2020, 11, 10, 13, 37, 42), compress=compress):
+            buf.write(chunk)
+    for chunk in zip_file.close():
+        buf.write(chunk)
+    buf.seek(0)
+    return ZipFile(buf)
+
+
+@pytest.mark.parametrize('known_size', (True, False))
+def test_streaming_zip_file(known_size):
+    files = [('test.txt', b'hello world\n' * 1000, True),
+             ('dir/\xfcml\xe4ut.bin', os.urandom(100000), False),
+             ('empty', b'', True)]
+    zf = _make_zip(files, known_size=known_size)
+    assert zf.testzip() is None
+    assert zf.namelist() == [name for name, __, __ in files]
+    for name, data, compress in files:
+        info = zf.getinfo(name)
+        assert info.compress_type == (ZIP_DEFLATED if compress else ZIP_STORED)
+        assert info.date_time == (2020, 11, 10, 13, 37, 42)
+        assert zf.read(name) == data
+    assert zf.getinfo('test.txt').compress_size < 12000
+
+
+def test_streaming_zip_file_many_files():
+    files = [('{}.txt'.format(i), b'', False) for i in range(70000)]
+    zf = _make_zip(files)
+    assert len(zf.namelist()) == 70000
+
+
+@pytest.mark.parametrize(('content_type', 'expected'), (
+    (None, True),
+    ('text/plain', True),
+    ('application/pdf', True),
+    ('image/svg+xml', True),
+    ('image/png', False),
+    ('video/mp4', False),
+    ('application/zip', False),
+    ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', False),
+))
+def test_should_compress(content_type, expected):
+    assert should_compress(content_type) == expected
@@ -8,16 +8,21 @@
 from __future__ import absolute_import, unicode_literals
 
 import cPickle
+import json
+import struct
 import uuid
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
+import redis
 from flask import flash, request
 from flask.sessions import SessionInterface, SessionMixin
 from markupsafe import Markup
+from speaklater import _LazyString
 from werkzeug.datastructures import CallbackDict
 from werkzeug.utils import cached_property
 
 from indico.core.config import config
+from indico.core.logger import Logger
 from indico.legacy.common.cache import GenericCache
 from indico.modules.users import User
 from indico.util.date_time import get_display_tz
@@ -25,6 +30,9 @@ from indico.util.decorators import cached_writable_property
 from indico.util.i18n import _, set_best_lang
 
 
+logger = Logger.get('session')
+
+
 class BaseSession(CallbackDict, SessionMixin):
     def __init__(self, initial=None, sid=None, new=False):
         def on_update(self):
@@ -33,6 +41,8 @@ class BaseSession(CallbackDict, SessionMixin):
         self.sid = sid
         self.new = new
         self.modified = False
+        # the serialized fields as they are currently in the session storage
+        self.stored_fields = {}
         defaults = self._get_defaults()
         if defaults:
             self.update(defaults)
@@ -132,14 +142,220 @@ class IndicoSession(BaseSession):
         return get_display_tz(as_timezone=True)
 
 
+class _UnsupportedValue(Exception):
+    pass
+
+
+class SessionSerializer(object):
+    """Compact, versioned serializer for session data.
+
+    Each session field is serialized on its own so the fields can be
+    stored (and updated) individually.  Values are encoded as JSON,
+    using tagged objects for the few non-JSON types commonly found in
+    a session.  Fields containing anything else are pickled, so it is
+    still possible to store arbitrary (picklable) objects.
+
+    A whole session is packed into a single string starting with a
+    version byte, followed by the length-prefixed keys and values.
+    Sessions pickled by older Indico versions can still be loaded.
+    """
+
+    version = 1
+    _tag = '\x00'
+
+    def _encode(self, obj):
+        if obj is None or isinstance(obj, (bool, int, long, float)):
+            return obj
+        elif isinstance(obj, Markup):
+            return {self._tag: 'markup', 'v': unicode(obj)}
+        elif isinstance(obj, basestring):
+            return obj
+        elif isinstance(obj, _LazyString):
+            return unicode(obj)
+        elif isinstance(obj, list):
+            return [self._encode(x) for x in obj]
+        elif isinstance(obj, tuple):
+            return {self._tag: 'tuple', 'v': [self._encode(x) for x in obj]}
+        elif isinstance(obj, (set, frozenset)):
+            return {self._tag: 'set', 'v': [self._encode(x) for x in obj]}
+        elif isinstance(obj, dict):
+            if not all(isinstance(k, basestring) for k in obj) or self._tag in obj:
+                raise _UnsupportedValue
+            return {k: self._encode(v) for k, v in obj.iteritems()}
+        elif isinstance(obj, datetime) and obj.tzinfo is None:
+            return {self._tag: 'datetime', 'v': obj.isoformat()}
+        elif isinstance(obj, date) and not isinstance(obj, datetime):
+            return {self._tag: 'date', 'v': obj.isoformat()}
+        elif isinstance(obj, timedelta):
+            return {self._tag: 'timedelta', 'v': [obj.days, obj.seconds, obj.microseconds]}
+        elif isinstance(obj, User):
+            return {self._tag: 'user', 'v': obj.id}
+        raise _UnsupportedValue
+
+    def _decode_tagged(self, obj):
+        if self._tag not in obj:
+            return obj
+        tag, value = obj[self._tag], obj['v']
+        if tag == 'markup':
+            return Markup(value)
+        elif tag == 'tuple':
+            return tuple(value)
+        elif tag == 'set':
+            return set(value)
+        elif tag == 'datetime':
+            return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S')
+        elif tag == 'date':
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        elif tag == 'timedelta':
+            return timedelta(*value)
+        elif tag == 'user':
+            return User.get(value)
+        raise ValueError('Unknown session value tag: {}'.format(tag))
+
+    def dumps_value(self, value):
+        try:
+            return b'j' + json.dumps(self._encode(value), separators=(b',', b':'))
+        except (_UnsupportedValue, UnicodeDecodeError):
+            return b'p' + cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+
+    def loads_value(self, data):
+        if data[:1] == b'j':
+            return json.loads(data[1:], object_hook=self._decode_tagged)
+        elif data[:1] == b'p':
+            return cPickle.loads(data[1:])
+        raise ValueError('Unknown session field format')
+
+    def dumps(self, fields):
+        """Pack the serialized fields of a session into a single string."""
+        parts = [struct.pack(b'>B', self.version)]
+        for key, value in fields.iteritems():
+            key = key.encode('utf-8')
+            parts += [struct.pack(b'>HI', len(key), len(value)), key, value]
+        return b''.join(parts)
+
+    def loads(self, data):
+        """Unpack a string created by :meth:`dumps`.
+
+        :return: a dict containing the serialized fields of the session
+        """
+        if data[:1] != struct.pack(b'>B', self.version):
+            # session pickled by an older indico version
+            return {key: self.dumps_value(value) for key, value in cPickle.loads(data).iteritems()}
+        fields = {}
+        pos = 1
+        while pos < len(data):
+            key_len, value_len = struct.unpack_from(b'>HI', data, pos)
+            pos += 6
+            key = data[pos:pos + key_len].decode('utf-8')
+            pos += key_len
+            fields[key] = data[pos:pos + value_len]
+            pos += value_len
+        return fields
+
+
+class CacheSessionStorage(object):
+    """Store each session as a single entry in the generic cache."""
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.cache = GenericCache('flask-session')
+
+    def load(self, sid):
+        """Load the serialized fields of a session.
+
+        :return: A ``(fields, migrate)`` tuple. `fields` is `None` if
+                 the session does not exist. `migrate` indicates that
+                 the session comes from a different storage, so all its
+                 fields need to be written when saving it.
+        """
+        data = self.cache.get(sid)
+        return (self.serializer.loads(data) if data is not None else None), False
+
+    def save(self, sid, fields, stored_fields, ttl):
+        self.cache.set(sid, self.serializer.dumps(fields), ttl)
+
+    def delete(self, sid):
+        self.cache.delete(sid)
+
+
+class RedisSessionStorage(object):
+    """Store each session as a Redis hash containing one entry per field.
+
+    Only fields that actually changed are written when saving a session.
+    Sessions stored in the generic cache (e.g. before switching to this
+    storage) are still loaded and moved to a hash when they are saved.
+
+    If Redis is not available, sessions are treated as missing and not
+    saved instead of failing the whole request.
+    """
+
+    key_prefix = 'flask-session/'
+    _clients = {}
+
+    def __init__(self, serializer, url):
+        self.serializer = serializer
+        self.legacy_storage = CacheSessionStorage(serializer)
+        if url not in self._clients:
+            self._clients[url] = redis.StrictRedis.from_url(url, socket_timeout=1)
+        self._client = self._clients[url]
+
+    def load(self, sid):
+        try:
+            fields = self._client.hgetall(self.key_prefix + sid)
+        except redis.RedisError:
+            logger.exception('Could not load session %s', sid)
+            return None, False
+        if fields:
+            return {key.decode('utf-8'): value for key, value in fields.iteritems()}, False
+        fields, __ = self.legacy_storage.load(sid)
+        return fields, fields is not None
+
+    def save(self, sid, fields, stored_fields, ttl):
+        """Save a session.
+
+        :param stored_fields: The fields currently stored in the hash.
+                              If empty, the whole hash is written and
+                              the session is removed from the legacy
+                              storage.
+        """
+        key = self.key_prefix + sid
+        changed = {k: v for k, v in fields.iteritems() if stored_fields.get(k) != v}
+        removed = set(stored_fields) - set(fields)
+        try:
+            pipe = self._client.pipeline()
+            if not stored_fields:
+                pipe.delete(key)
+            if changed:
+                pipe.hset(key, mapping=changed)
+            if removed:
+                pipe.hdel(key, *removed)
+            pipe.expire(key, ttl)
+            pipe.execute()
+        except redis.RedisError:
+            logger.exception('Could not save session %s', sid)
+            return
+        if not stored_fields:
+            self.legacy_storage.delete(sid)
+
+    def delete(self, sid):
+        try:
+            self._client.delete(self.key_prefix + sid)
+        except redis.RedisError:
+            logger.exception('Could not delete session %s', sid)
+        self.legacy_storage.delete(sid)
+
+
 class IndicoSessionInterface(SessionInterface):
     pickle_based = True
-    serializer = cPickle
+    serializer = SessionSerializer()
     session_class = IndicoSession
     temporary_session_lifetime = timedelta(days=7)
 
-    def __init__(self):
-        self.storage = GenericCache('flask-session')
+    @property
+    def storage(self):
+        if config.CACHE_BACKEND == 'redis':
+            return RedisSessionStorage(self.serializer, config.REDIS_CACHE_URL)
+        return CacheSessionStorage(self.serializer)
 
     def generate_sid(self):
         return str(uuid.uuid4())
@@ -173,18 +389,26 @@ class IndicoSessionInterface(SessionInterface):
         sid = request.cookies.get(app.session_cookie_name)
         if not sid:
             return self.session_class(sid=self.generate_sid(), new=True)
-        data = self.storage.get(sid)
-        if data is not None:
-            return self.session_class(self.serializer.loads(data), sid=sid)
-        return self.session_class(sid=self.generate_sid(), new=True)
+        fields, migrate = self.storage.load(sid)
+        if fields is None:
+            return self.session_class(sid=self.generate_sid(), new=True)
+        data = {key: self.serializer.loads_value(value) for key, value in fields.iteritems()}
+        session = self.session_class(data, sid=sid)
+        if migrate:
+            # make sure the session is saved (with all its fields) in the new storage
+            session.modified = True
+        else:
+            session.stored_fields = fields
+        return session
 
     def save_session(self, app, session, response):
+        storage = self.storage
         domain = self.get_cookie_domain(app)
         secure = self.get_cookie_secure(app)
         refresh_sid = self.should_refresh_sid(app, session)
         if not session and not session.new:
             # empty session, delete it from storage and cookie
-            self.storage.delete(session.sid)
+            storage.delete(session.sid)
             response.delete_cookie(app.session_cookie_name, domain=domain)
             return
 
@@ -202,10 +426,13 @@ class IndicoSessionInterface(SessionInterface):
         session['_expires'] = datetime.now() + storage_ttl
 
         if refresh_sid:
-            self.storage.delete(session.sid)
+            storage.delete(session.sid)
             session.sid = self.generate_sid()
+            session.stored_fields = {}
 
         session['_secure'] = request.is_secure
-        self.storage.set(session.sid, self.serializer.dumps(dict(session)), storage_ttl)
+        fields = {key: self.serializer.dumps_value(value) for key, value in session.iteritems()}
+        storage.save(session.sid, fields, session.stored_fields, int(storage_ttl.total_seconds()))
+        session.stored_fields = fields
         response.set_cookie(app.session_cookie_name, session.sid, expires=cookie_lifetime, httponly=True,
                             secure=secure)
@@ -0,0 +1,184 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+from __future__ import unicode_literals
+
+import cPickle
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+import redis
+from flask import g, request
+from markupsafe import Markup
+
+from indico.legacy.common.cache import FileCacheClient
+from indico.web.flask.session import (CacheSessionStorage, IndicoSessionInterface, RedisSessionStorage,
+                                      SessionSerializer)
+
+
+class MockRedis(object):
+    """A minimal in-memory replacement for a redis client using hashes."""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.commands = []
+        self.broken = False
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        if self.broken:
+            raise redis.ConnectionError
+        commands = self.commands
+        self.commands = []
+        for name, args, kwargs in commands:
+            getattr(self, '_' + name)(*args, **kwargs)
+
+    def hgetall(self, key):
+        if self.broken:
+            raise redis.ConnectionError
+        return {k.encode('utf-8'): v for k, v in self.data.get(key, {}).iteritems()}
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def _hset(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+
+    def _hdel(self, key, *fields):
+        for field in fields:
+            self.data[key].pop(field)
+
+    def _expire(self, key, ttl):
+        self.ttls[key] = ttl
+
+    def _delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.mark.parametrize('value', (
+    None,
+    True,
+    123,
+    1.5,
+    'foo',
+    [1, 'two', [3]],
+    {'a': {'b': ['c']}},
+    (1, 2),
+    {1, 2, 3},
+    datetime(2020, 11, 1, 13, 37),
+    datetime(2020, 11, 1, 13, 37, 0, 123),
+    date(2020, 11, 1),
+    timedelta(days=1, seconds=2, microseconds=3),
+    Markup('<strong>foo</strong>'),
+    [('message', Markup('<em>bar</em>'))],
+))
+def test_session_serializer_json(value):
+    serializer = SessionSerializer()
+    data = serializer.dumps_value(value)
+    assert isinstance(data, bytes)
+    assert data.startswith(b'j')
+    loaded = serializer.loads_value(data)
+    assert loaded == value
+    assert type(loaded) == type(value)
+
+
+@pytest.mark.parametrize('value', (
+    Decimal('1.5'),
+    {1: 'non-string key'},
+    {'\x00': 'reserved key'},
+    {'nested': Decimal('1.5')},
+    b'\xff\xfe',
+))
+def test_session_serializer_pickle_fallback(value):
+    serializer = SessionSerializer()
+    data = serializer.dumps_value(value)
+    assert data.startswith(b'p')
+    assert serializer.loads_value(data) == value
+
+
+def test_session_serializer_pack():
+    serializer = SessionSerializer()
+    session = {'_user_id': 123, '_expires': datetime(2020, 11, 1), '\xfcnicode': 'foo'}
+    fields = {key: serializer.dumps_value(value) for key, value in session.iteritems()}
+    data = serializer.dumps(fields)
+    assert data.startswith(b'\x01')
+    assert serializer.loads(data) == fields
+
+
+def test_session_serializer_legacy():
+    serializer = SessionSerializer()
+    session = {'_user_id': 123, '_expires': datetime(2020, 11, 1)}
+    fields = serializer.loads(cPickle.dumps(session))
+    assert {key: serializer.loads_value(value) for key, value in fields.iteritems()} == session
+
+
+@pytest.fixture
+def redis_storage(request_context, mocker, tmpdir):
+    g.generic_cache_client = FileCacheClient(tmpdir.strpath)
+    client = MockRedis()
+    mocker.patch('indico.web.flask.session.redis.StrictRedis.from_url', return_value=client)
+    mocker.patch.object(RedisSessionStorage, '_clients', {})
+    storage = RedisSessionStorage(SessionSerializer(), 'redis://localhost')
+    storage.mock_client = client
+    return storage
+
+
+def test_redis_session_storage_migrate(redis_storage):
+    legacy_storage = CacheSessionStorage(redis_storage.serializer)
+    legacy_fields = {'_user_id': b'j1', 'foo': b'j"bar"'}
+    legacy_storage.save('sid', legacy_fields, {}, 3600)
+    fields, migrate = redis_storage.load('sid')
+    assert fields == legacy_fields
+    assert migrate
+    # a session loaded from the legacy storage is written completely
+    redis_storage.save('sid', dict(legacy_fields, foo=b'j"baz"'), {}, 3600)
+    assert redis_storage.mock_client.data['flask-session/sid'] == {'_user_id': b'j1', 'foo': b'j"baz"'}
+    assert legacy_storage.load('sid') == (None, False)
+    assert redis_storage.load('sid') == ({'_user_id': b'j1', 'foo': b'j"baz"'}, False)
+
+
+def test_redis_session_storage_partial_update(redis_storage):
+    stored = {'_user_id': b'j1', 'foo': b'j"bar"', 'removed': b'j2'}
+    redis_storage.save('sid', stored, {}, 3600)
+    redis_storage.mock_client.data['flask-session/sid']['_user_id'] = b'j2'
+    redis_storage.save('sid', {'_user_id': b'j1', 'foo': b'j"baz"', 'new': b'j3'}, stored, 60)
+    client = redis_storage.mock_client
+    # only changed fields are written, so the unchanged one written by someone else is kept
+    assert client.data['flask-session/sid'] == {'_user_id': b'j2', 'foo': b'j"baz"', 'new': b'j3'}
+    assert client.ttls['flask-session/sid'] == 60
+
+
+def test_redis_session_storage_unavailable(redis_storage):
+    redis_storage.save('sid', {'_user_id': b'j1'}, {}, 3600)
+    redis_storage.mock_client.broken = True
+    assert redis_storage.load('sid') == (None, False)
+    redis_storage.save('sid', {'_user_id': b'j2'}, {'_user_id': b'j1'}, 3600)
+    redis_storage.mock_client.broken = False
+    assert redis_storage.load('sid') == ({'_user_id': b'j1'}, False)
+
+
+def test_session_interface_migrate_legacy(app, mocker, redis_storage):
+    mocker.patch.object(IndicoSessionInterface, 'storage', redis_storage)
+    interface = IndicoSessionInterface()
+    serializer = interface.serializer
+    legacy_fields = {'_user_id': serializer.dumps_value(1), 'foo': serializer.dumps_value('bar')}
+    CacheSessionStorage(serializer).save('sid', legacy_fields, {}, 3600)
+    with app.test_request_context(headers={'Cookie': '{}=sid'.format(app.session_cookie_name)}):
+        session = interface.open_session(app, request)
+        assert session['_user_id'] == 1
+        session['foo'] = 'baz'
+        interface.save_session(app, session, app.response_class())
+        session = interface.open_session(app, request)
+    stored = redis_storage.mock_client.data['flask-session/sid']
+    assert serializer.loads_value(stored['_user_id']) == 1
+    assert serializer.loads_value(stored['foo']) == 'baz'
+    assert session['_user_id'] == 1
+    assert session.stored_fields == stored
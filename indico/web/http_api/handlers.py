@@ -18,7 +18,7 @@ import urllib
 from urlparse import parse_qs
 from uuid import UUID
 
-from flask import current_app, g, request, session
+from flask import copy_current_request_context, current_app, g, request, session
 from werkzeug.exceptions import BadRequest, NotFound
 
 from indico.core.db import db
@@ -28,6 +28,7 @@ from indico.modules.api import APIMode, api_settings
 from indico.modules.api.models.keys import APIKey
 from indico.modules.oauth import oauth
 from indico.modules.oauth.provider import load_token
+from indico.modules.users import User
 from indico.util.fossilize import clearCache, fossilize
 from indico.util.string import to_unicode
 from indico.web.http_api import HTTPAPIHook
@@ -39,6 +40,10 @@ from indico.web.http_api.util import get_query_parameter
 
 # Remove the extension at the end or before the querystring
 RE_REMOVE_EXTENSION = re.compile(r'\.(\w+)(?:$|(?=\?))')
+# How long a worker may hold the lock for computing a result (in seconds)
+CACHE_LOCK_TTL = 120
+# How long to wait for another worker to compute a result (in seconds)
+CACHE_LOCK_WAIT = 30
 
 
 def normalizeQuery(path, query, remove=('signature',), separate=False):
@@ -101,6 +106,80 @@ def checkAK(apiKey, signature, timestamp, path, query):
     return ak, onlyPublic
 
 
+class CacheRefreshLock(object):
+    """Ensure only one worker at a time computes a cached API result.
+
+    The lock is stored in the cache backend, so it works across
+    processes and servers when using Redis or Memcached.  Other
+    backends only prevent concurrent computations within the same
+    process.
+    """
+
+    def __init__(self, cache_key):
+        self._cache = GenericCache('HTTPAPI-lock', local=False)
+        self._key = cache_key
+        self.acquired = False
+
+    def acquire(self):
+        self.acquired = self._cache.add(self._key, True, CACHE_LOCK_TTL)
+        return self.acquired
+
+    def release(self):
+        if self.acquired:
+            self._cache.delete(self._key)
+            self.acquired = False
+
+
+def _wait_for_cached_result(cache, cache_key, lock):
+    """Wait until another worker has stored a result in the cache.
+
+    If the other worker gives up (or the lock expires), the lock is
+    acquired and `None` is returned so the caller computes the result
+    itself.  The same happens when waiting takes too long, but in that
+    case the lock is not held.
+    """
+    deadline = time.time() + CACHE_LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(0.1)
+        obj = cache.get(cache_key)
+        if obj is not None:
+            return obj
+        if lock.acquire():
+            return None
+    return None
+
+
+def _get_hook_result(hook, user):
+    """Run a hook and return the data needed for the response.
+
+    :return: A ``(result, extra, complete, typeMap, is_response)`` tuple
+    """
+    g.current_api_user = user
+    res = hook(user)
+    if isinstance(res, current_app.response_class):
+        return res, {}, True, {}, True
+    elif isinstance(res, tuple) and len(res) == 4:
+        return res + (False,)
+    else:
+        return res, {}, True, {}, False
+
+
+def _refresh_cached_result(path, query_params, user_id, cache, cache_key, lock, ttl):
+    """Recompute a stale cached result after the response has been sent."""
+    try:
+        clearCache()
+        user = User.get(user_id) if user_id is not None else None
+        hook, __ = HTTPAPIHook.parseRequest(path, query_params)
+        result, extra, complete, typeMap, is_response = _get_hook_result(hook, user)
+        if result is not None and not is_response:
+            cache.set(cache_key, (result, extra, int(time.time()), complete, typeMap), ttl)
+    except Exception:
+        Logger.get('httpapi').exception('Could not refresh cached result for %s', cache_key)
+    finally:
+        lock.release()
+        db.session.rollback()
+
+
 def handler(prefix, path):
     path = posixpath.join('/', prefix, path)
     clearCache()  # init fossil cache
@@ -149,6 +228,8 @@ def handler(prefix, path):
         oauth_valid = False
 
     # Get our handler function and its argument and response type
+    # (keep the original arguments in case the hook needs to run again later)
+    originalQueryParams = dict(queryParams)
     hook, dformat = HTTPAPIHook.parseRequest(path, queryParams)
     if hook is None or dformat is None:
         raise NotFound
@@ -162,6 +243,7 @@ def handler(prefix, path):
     typeMap = {}
     status_code = None
     is_response = False
+    refreshCache = False
     try:
         used_session = None
         if cookieAuth:
@@ -222,27 +304,33 @@ def handler(prefix, path):
         addToCache = not hook.NO_CACHE
         cache = GenericCache('HTTPAPI')
         cacheKey = RE_REMOVE_EXTENSION.sub('', cacheKey)
+        ttl = api_settings.get('cache_ttl')
+        staleTTL = api_settings.get('cache_stale_ttl')
+        lock = CacheRefreshLock(cacheKey)
         if not noCache:
             obj = cache.get(cacheKey)
+            if obj is not None and time.time() > obj[2] + ttl + staleTTL:
+                obj = None
+            if obj is None and addToCache and ttl > 0 and not lock.acquire():
+                # someone else is already computing the same result
+                obj = _wait_for_cached_result(cache, cacheKey, lock)
             if obj is not None:
                 result, extra, ts, complete, typeMap = obj
                 addToCache = False
-        if result is None:
-            g.current_api_user = user
-            # Perform the actual exporting
-            res = hook(user)
-            if isinstance(res, current_app.response_class):
-                addToCache = False
-                is_response = True
-                result, extra, complete, typeMap = res, {}, True, {}
-            elif isinstance(res, tuple) and len(res) == 4:
-                result, extra, complete, typeMap = res
-            else:
-                result, extra, complete, typeMap = res, {}, True, {}
-        if result is not None and addToCache:
-            ttl = api_settings.get('cache_ttl')
-            if ttl > 0:
-                cache.set(cacheKey, (result, extra, ts, complete, typeMap), ttl)
+                if time.time() > ts + ttl and lock.acquire():
+                    # serve the stale result and refresh it once the response has been sent
+                    refreshCache = True
+        try:
+            if result is None:
+                # Perform the actual exporting
+                result, extra, complete, typeMap, is_response = _get_hook_result(hook, user)
+                if is_response:
+                    addToCache = False
+            if result is not None and addToCache and ttl > 0:
+                cache.set(cacheKey, (result, extra, ts, complete, typeMap), ttl + staleTTL)
+        finally:
+            if not refreshCache:
+                lock.release()
     except HTTPAPIError as e:
         error = e
         if e.getCode():
@@ -290,6 +378,10 @@ def handler(prefix, path):
                 response.content_type = content_type
             if status_code:
                 response.status_code = status_code
+            if refreshCache:
+                response.call_on_close(copy_current_request_context(
+                    lambda: _refresh_cached_result(path, originalQueryParams, user.id if user else None,
+                                                   cache, cacheKey, lock, ttl + staleTTL)))
             return response
         except Exception:
             logger.exception('Serialization error in request %s?%s', path, query)
@@ -0,0 +1,115 @@
+# This file is part of Indico.
+# Copyright (C) 2002 - 2020 CERN
+#
+# Indico is free software; you can redistribute it and/or
+# modify it under the terms of the MIT License; see the
+# LICENSE file for more details.
+
+import time
+
+import pytest
+from flask import g
+from mock import MagicMock
+
+from indico.legacy.common.cache import FileCacheClient, GenericCache
+from indico.modules.api import APIMode
+from indico.util import json
+from indico.web.http_api.handlers import CacheRefreshLock, _wait_for_cached_result, handler
+
+
+CACHE_KEY = 'public_/export/categ/1'
+API_SETTINGS = {
+    'security_mode': APIMode.KEY,
+    'cache_ttl': 10,
+    'cache_stale_ttl': 100,
+}
+
+
+@pytest.fixture
+def api_request(app, mocker, tmpdir):
+    """Run API requests with a mocked export hook and a file cache."""
+    mocker.patch('indico.web.http_api.handlers.api_settings.get', side_effect=API_SETTINGS.get)
+    mocker.patch('indico.web.http_api.handlers.db')
+    hook = MagicMock(NO_CACHE=False, serializer_args={}, return_value=[{'title': 'new'}])
+    mocker.patch('indico.web.http_api.handlers.HTTPAPIHook.parseRequest', return_value=(hook, 'json'))
+    with app.test_request_context('/export/categ/1.json', headers={'Authorization': 'Basic dummy'}):
+        g.generic_cache_client = FileCacheClient(tmpdir.strpath)
+        yield hook
+
+
+def _get_results(response):
+    return [x['title'] for x in json.loads(response.get_data())['results']]
+
+
+def _cached_result(title, age):
+    return [{'title': title}], {}, int(time.time() - age), True, {}
+
+
+def test_wait_for_cached_result(request_context, tmpdir):
+    g.generic_cache_client = FileCacheClient(tmpdir.strpath)
+    cache = GenericCache('HTTPAPI')
+    lock = CacheRefreshLock('test')
+    other_lock = CacheRefreshLock('test')
+    assert lock.acquire()
+    assert not other_lock.acquire()
+    cache.set('test', 'result')
+    assert _wait_for_cached_result(cache, 'test', other_lock) == 'result'
+    assert not other_lock.acquired
+    # once the other worker gives up, the waiter takes over
+    cache.delete('test')
+    lock.release()
+    assert _wait_for_cached_result(cache, 'test', other_lock) is None
+    assert other_lock.acquired
+
+
+def test_lock_contention(api_request, mocker):
+    cache = GenericCache('HTTPAPI')
+    # another worker is computing the result and stores it while we wait
+    assert CacheRefreshLock(CACHE_KEY).acquire()
+    sleep = mocker.patch('indico.web.http_api.handlers.time.sleep',
+                         side_effect=lambda s: cache.set(CACHE_KEY, _cached_result('other', 0)))
+    response = handler('export', 'categ/1.json')
+    assert sleep.call_count == 1
+    assert _get_results(response) == ['other']
+    assert not api_request.called
+
+
+def test_stale_while_revalidate(api_request):
+    cache = GenericCache('HTTPAPI')
+    cache.set(CACHE_KEY, _cached_result('old', 50))
+    response = handler('export', 'categ/1.json')
+    assert _get_results(response) == ['old']
+    assert not api_request.called
+    # the lock is held until the result has been refreshed
+    assert not CacheRefreshLock(CACHE_KEY).acquire()
+    response.close()
+    assert api_request.call_count == 1
+    assert cache.get(CACHE_KEY)[0] == [{'title': 'new'}]
+    assert CacheRefreshLock(CACHE_KEY).acquire()
+
+
+def test_expired_result_not_served(api_request):
+    cache = GenericCache('HTTPAPI')
+    cache.set(CACHE_KEY, _cached_result('old', 200))
+    response = handler('export', 'categ/1.json')
+    assert _get_results(response) == ['new']
+    assert CacheRefreshLock(CACHE_KEY).acquire()
+
+
+def test_lock_released_on_error(api_request):
+    api_request.side_effect = Exception('failed')
+    with pytest.raises(Exception):
+        handler('export', 'categ/1.json')
+    assert CacheRefreshLock(CACHE_KEY).acquire()
+
+
+def test_lock_released_on_refresh_error(api_request):
+    cache = GenericCache('HTTPAPI')
+    cache.set(CACHE_KEY, _cached_result('old', 50))
+    api_request.side_effect = Exception('failed')
+    response = handler('export', 'categ/1.json')
+    assert _get_results(response) == ['old']
+    response.close()
+    assert api_request.call_count == 1
+    assert cache.get(CACHE_KEY)[0] == [{'title': 'old'}]
+    assert CacheRefreshLock(CACHE_KEY).acquire()